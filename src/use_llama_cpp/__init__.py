@@ -9,12 +9,26 @@ __version__ = "0.1.0"
 __author__ = "Parham Hard"
 __description__ = "GPU-accelerated AI chat application using llama.cpp"
 
-from .core.chat import AIChat
-from .core.model_loader import ModelLoader
-from .utils.gpu_checker import GPUChecker
+from typing import TYPE_CHECKING
+
+from ._lazy import lazy_attributes
+
+if TYPE_CHECKING:
+    from .core.chat import AIChat, AsyncAIChat
+    from .core.model_loader import ModelLoader
+    from .utils.gpu_checker import GPUChecker
+
+# torch and llama_cpp are only imported once one of these is used
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    "AIChat": ".core.chat",
+    "AsyncAIChat": ".core.chat",
+    "ModelLoader": ".core.model_loader",
+    "GPUChecker": ".utils.gpu_checker",
+})
 
 __all__ = [
     "AIChat",
+    "AsyncAIChat",
     "ModelLoader", 
     "GPUChecker",
     "__version__",
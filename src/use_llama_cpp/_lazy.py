@@ -0,0 +1,40 @@
+"""
+Lazy attribute loading for AI Room packages.
+
+Importing the package must stay cheap: torch and llama_cpp take seconds
+and hundreds of MB to import, and short-lived commands such as --help never
+need them. Packages expose their public names through a module __getattr__
+that imports the defining module on first access.
+"""
+
+import importlib
+import sys
+from typing import Any, Callable, Dict, List, Tuple
+
+
+def lazy_attributes(
+    package: str, imports: Dict[str, str]
+) -> Tuple[Callable[[str], Any], Callable[[], List[str]]]:
+    """
+    Build module-level __getattr__ and __dir__ functions for a package.
+    
+    Args:
+        package: The package's __name__
+        imports: Public name -> relative module that defines it
+        
+    Returns:
+        Tuple of (__getattr__, __dir__) to assign in the package namespace
+    """
+    def __getattr__(name: str) -> Any:
+        module = imports.get(name)
+        if module is None:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(module, package), name)
+        # Later lookups find the attribute directly and skip __getattr__
+        setattr(sys.modules[package], name, value)
+        return value
+    
+    def __dir__() -> List[str]:
+        return sorted(set(vars(sys.modules[package])) | set(imports))
+    
+    return __getattr__, __dir__
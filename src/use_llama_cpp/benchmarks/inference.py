@@ -0,0 +1,359 @@
+"""
+Inference benchmark suite for AI Room application.
+
+Measures prompt processing and decode throughput, time to first token and
+latency percentiles for a GGUF model across prompt lengths, context sizes
+and concurrency levels. Results are plain JSON so runs before and after an
+upgrade can be compared with compare_results.
+"""
+
+import json
+import logging
+import math
+import platform
+import statistics
+import time
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from .. import __version__
+from ..utils.hardware import probe_cpu
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
+
+logger = logging.getLogger(__name__)
+
+_FILLER = (
+    "Benchmarks measure how quickly the model reads this sentence and writes a reply. "
+)
+
+# Metrics where a larger value is better; every other metric is a time
+HIGHER_IS_BETTER = {
+    "prefill_tokens_per_second",
+    "decode_tokens_per_second",
+    "tokens_per_second",
+}
+
+
+@dataclass
+class BenchmarkConfig:
+    """What to measure."""
+
+    model_path: str
+    prompt_lengths: List[int] = field(default_factory=lambda: [32, 128, 512])
+    context_sizes: List[int] = field(default_factory=lambda: [2048])
+    concurrency: List[int] = field(default_factory=lambda: [1, 4])
+    max_tokens: int = 32
+    repeats: int = 3
+    chat_turns: int = 4
+    gpu_layers: int = -1
+    n_threads: Optional[int] = None
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """p50, p95 and p99 of a list of measurements (nearest rank)."""
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    return {"p50": rank(50), "p95": rank(95), "p99": rank(99)}
+
+
+def _summary(samples: List[Dict[str, float]]) -> Dict[str, Any]:
+    """Median of every metric plus latency and TTFT percentiles."""
+    result: Dict[str, Any] = {"samples": len(samples)}
+    for key in samples[0]:
+        result[key] = statistics.median(s[key] for s in samples)
+    result["latency_seconds_percentiles"] = percentiles(
+        [s["latency_seconds"] for s in samples]
+    )
+    result["ttft_seconds_percentiles"] = percentiles(
+        [s["ttft_seconds"] for s in samples]
+    )
+    return result
+
+
+def make_prompt(model: "Llama", n_tokens: int) -> List[int]:
+    """A prompt of exactly n_tokens tokens (BOS included)."""
+    text = _FILLER * (n_tokens // 8 + 1)
+    return model.tokenize(text.encode("utf-8"))[:n_tokens]
+
+
+def measure_completion(
+    model: "Llama", prompt: List[int], max_tokens: int
+) -> Dict[str, float]:
+    """
+    Time one streamed completion from an empty KV cache.
+
+    Returns:
+        prompt_tokens, output_tokens, ttft_seconds, latency_seconds and
+        prefill/decode tokens per second
+    """
+    # Start cold so the prompt is actually processed
+    model.reset()
+    start = time.perf_counter()
+    first = None
+    for _ in model.create_completion(
+        prompt=prompt, max_tokens=max_tokens, temperature=0.0, stream=True
+    ):
+        if first is None:
+            first = time.perf_counter()
+    end = time.perf_counter()
+    first = first or end
+    # Every sampled token but the last is evaluated into the context
+    output_tokens = model.n_tokens - len(prompt) + 1
+
+    decode_seconds = end - first
+    return {
+        "prompt_tokens": len(prompt),
+        "output_tokens": output_tokens,
+        "ttft_seconds": first - start,
+        "latency_seconds": end - start,
+        "prefill_tokens_per_second": len(prompt) / (first - start),
+        "decode_tokens_per_second": (
+            (output_tokens - 1) / decode_seconds
+            if output_tokens > 1 and decode_seconds
+            else 0.0
+        ),
+    }
+
+
+def bench_prompt_lengths(
+    model: "Llama", config: BenchmarkConfig
+) -> List[Dict[str, Any]]:
+    """Single-request throughput and TTFT for each prompt length."""
+    results = []
+    for length in config.prompt_lengths:
+        if length + config.max_tokens > model.n_ctx():
+            logger.info(
+                f"Skipping prompt length {length}: "
+                f"does not fit in {model.n_ctx()} tokens"
+            )
+            continue
+        prompt = make_prompt(model, length)
+        # One untimed run warms up the weights and kernels
+        measure_completion(model, prompt, 2)
+        samples = [
+            measure_completion(model, prompt, config.max_tokens)
+            for _ in range(config.repeats)
+        ]
+        results.append({"prompt_length": length, **_summary(samples)})
+        logger.info(
+            f"Prompt {length}: "
+            f"{results[-1]['prefill_tokens_per_second']:.1f} prefill tok/s, "
+            f"{results[-1]['decode_tokens_per_second']:.1f} decode tok/s"
+        )
+    return results
+
+
+def bench_chat(model: "Llama", config: BenchmarkConfig) -> Dict[str, Any]:
+    """Per-turn latency of an AIChat conversation, which reuses its KV prefix."""
+    from ..core.chat import AIChat
+
+    model.reset()
+    chat = AIChat(model)
+    samples = []
+    for turn in range(config.chat_turns):
+        start = time.perf_counter()
+        first = None
+        for _ in chat.stream_response(
+            f"Question {turn}: {_FILLER}", max_tokens=config.max_tokens, temperature=0.0
+        ):
+            if first is None:
+                first = time.perf_counter()
+        end = time.perf_counter()
+        samples.append({
+            "prompt_tokens": chat.last_prompt_tokens,
+            "cached_tokens": chat.last_cached_tokens,
+            "ttft_seconds": (first or end) - start,
+            "latency_seconds": end - start,
+        })
+    return {"turns": samples, **_summary(samples)}
+
+
+def bench_concurrency(
+    model: "Llama", config: BenchmarkConfig, prompt_length: int
+) -> List[Dict[str, Any]]:
+    """Latency and aggregate throughput with concurrent requests batched together."""
+    from ..core.scheduler import BatchScheduler, SamplingParams
+
+    results = []
+    prompt = make_prompt(model, prompt_length)
+    params = SamplingParams(max_tokens=config.max_tokens, temperature=0.0)
+    for level in config.concurrency:
+        # Split the context between sequences so the KV cache stays at n_ctx
+        context = model.n_ctx() // level
+        if prompt_length + config.max_tokens > context:
+            logger.info(
+                f"Skipping concurrency {level}: does not fit in {context} tokens "
+                "per sequence"
+            )
+            continue
+        scheduler = BatchScheduler(
+            model, n_parallel=level, context_per_sequence=context
+        )
+        try:
+            samples = []
+            wall = 0.0
+            tokens = 0
+            for _ in range(config.repeats):
+                start = time.perf_counter()
+                requests = [scheduler.submit(prompt, params) for _ in range(level)]
+                scheduler.run_until_idle()
+                wall += time.perf_counter() - start
+                for request in requests:
+                    tokens += len(request.output_tokens)
+                    samples.append(
+                        {
+                            "ttft_seconds": (
+                                request.first_token_at or request.finished_at
+                            )
+                            - request.submitted_at,
+                            "latency_seconds": request.finished_at
+                            - request.submitted_at,
+                        }
+                    )
+        finally:
+            scheduler.close()
+        results.append({
+            "concurrency": level,
+            "prompt_length": prompt_length,
+            "tokens_per_second": tokens / wall if wall else 0.0,
+            **_summary(samples),
+        })
+        logger.info(
+            f"Concurrency {level}: {results[-1]['tokens_per_second']:.1f} tok/s"
+        )
+    return results
+
+
+def run_benchmarks(config: BenchmarkConfig) -> Dict[str, Any]:
+    """
+    Run the whole suite.
+
+    Args:
+        config: What to measure
+
+    Returns:
+        JSON-serializable results with environment metadata
+    """
+    from ..core.model_loader import ModelLoader
+    import llama_cpp
+
+    cpu = probe_cpu()
+    report: Dict[str, Any] = {
+        "metadata": {
+            "use_llama_cpp": __version__,
+            "llama_cpp_python": llama_cpp.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu": cpu.model_name,
+            "cpu_cores": cpu.physical_cores,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "config": asdict(config),
+        },
+        "runs": [],
+    }
+
+    for context_size in config.context_sizes:
+        loader = ModelLoader(config.model_path, gpu_layers=config.gpu_layers,
+                             context_size=context_size, n_threads=config.n_threads)
+        model = loader.load_model()
+        if model is None:
+            raise RuntimeError(f"Failed to load {config.model_path}")
+        try:
+            prompt_results = bench_prompt_lengths(model, config)
+            fitting = [
+                n
+                for n in config.prompt_lengths
+                if n + config.max_tokens <= context_size
+            ]
+            report["runs"].append({
+                "context_size": context_size,
+                "prompt_lengths": prompt_results,
+                "chat": bench_chat(model, config),
+                "concurrency": bench_concurrency(model, config, min(fitting or [32])),
+            })
+        finally:
+            loader.unload_model()
+    return report
+
+
+def _flatten(report: Dict[str, Any]) -> Dict[str, float]:
+    """Map "scenario/metric" -> value for every comparable number in a report."""
+    flat = {}
+    for run in report.get("runs", []):
+        prefix = f"ctx{run['context_size']}"
+        for entry in run.get("prompt_lengths", []):
+            for key, value in entry.items():
+                if isinstance(value, (int, float)) and key.endswith(
+                    ("_second", "_seconds")
+                ):
+                    flat[f"{prefix}/prompt{entry['prompt_length']}/{key}"] = value
+        for entry in run.get("concurrency", []):
+            for key, value in entry.items():
+                if isinstance(value, (int, float)) and key.endswith(
+                    ("_second", "_seconds")
+                ):
+                    flat[f"{prefix}/concurrency{entry['concurrency']}/{key}"] = value
+        chat = run.get("chat", {})
+        for key in ("ttft_seconds", "latency_seconds"):
+            if key in chat:
+                flat[f"{prefix}/chat/{key}"] = chat[key]
+    return flat
+
+
+def compare_results(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.05
+) -> List[Dict[str, Any]]:
+    """
+    Compare two reports metric by metric.
+
+    Args:
+        baseline: Earlier report
+        current: New report
+        threshold: Relative change counted as a regression or improvement
+
+    Returns:
+        One entry per shared metric with both values, the relative change
+        and a verdict of "better", "worse" or "same"
+    """
+    old, new = _flatten(baseline), _flatten(current)
+    rows = []
+    for key in sorted(old.keys() & new.keys()):
+        if not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key]
+        higher_better = key.rsplit("/", 1)[1] in HIGHER_IS_BETTER
+        gain = change if higher_better else -change
+        verdict = (
+            "better" if gain > threshold else "worse" if gain < -threshold else "same"
+        )
+        rows.append(
+            {
+                "metric": key,
+                "baseline": old[key],
+                "current": new[key],
+                "change": change,
+                "verdict": verdict,
+            }
+        )
+    return rows
+
+
+def save_report(report: Dict[str, Any], path: str):
+    """Write a report as JSON."""
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+
+def load_report(path: str) -> Dict[str, Any]:
+    """Read a report written by save_report."""
+    with open(path) as f:
+        return json.load(f)
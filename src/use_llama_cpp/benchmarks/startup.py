@@ -0,0 +1,120 @@
+"""
+Startup benchmark for AI Room application.
+
+Measures wall time and peak RSS of fresh interpreters that import the
+package or run the CLI, and which heavy dependencies each one loaded. Run
+with: python -m use_llama_cpp.benchmarks.startup
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+# Modules that must not be imported until a model is loaded
+HEAVY_MODULES = ["torch", "llama_cpp", "numpy"]
+
+_REPORT_MODULES = (
+    "import atexit, json, sys\n"
+    "atexit.register(lambda: sys.__stderr__.write("
+    "'HEAVY_MODULES=' + json.dumps([m for m in {modules!r} if m in sys.modules])"
+    " + '\\n'))\n"
+)
+
+CASES = {
+    "python": ["-c", "pass"],
+    "import": ["-c", "import use_llama_cpp"],
+    "cli_help": ["-c", "from use_llama_cpp.cli.main import main; main(['--help'])"],
+}
+
+
+def run_once(args: List[str]) -> Dict[str, Any]:
+    """
+    Run a fresh interpreter once.
+    
+    Args:
+        args: Interpreter arguments, e.g. ["-c", "import use_llama_cpp"]
+        
+    Returns:
+        Dictionary with seconds, peak_rss_mb and heavy_modules
+    """
+    if args[:1] == ["-c"]:
+        report = _REPORT_MODULES.format(modules=HEAVY_MODULES)
+        args = ["-c", report + args[1], *args[2:]]
+    
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, *args], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    stderr = process.stderr.read().decode("utf-8", "replace")
+    # wait4 reports the child's own resource usage, not the sum over all children
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    
+    heavy: List[str] = []
+    for line in stderr.splitlines():
+        if line.startswith("HEAVY_MODULES="):
+            heavy = json.loads(line.split("=", 1)[1])
+    return {
+        "seconds": seconds,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+        "heavy_modules": heavy,
+        "exit_code": os.waitstatus_to_exitcode(status),
+    }
+
+
+def measure_startup(
+    runs: int = 5, cases: Optional[List[str]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Measure startup cost of each case.
+    
+    Args:
+        runs: Interpreter launches per case
+        cases: Names from CASES to run (default: all)
+        
+    Returns:
+        Case name -> median seconds, max peak RSS and heavy modules loaded
+    """
+    results = {}
+    for name in cases or list(CASES):
+        samples = [run_once(CASES[name]) for _ in range(runs)]
+        results[name] = {
+            "runs": runs,
+            "median_seconds": statistics.median(s["seconds"] for s in samples),
+            "min_seconds": min(s["seconds"] for s in samples),
+            "peak_rss_mb": max(s["peak_rss_mb"] for s in samples),
+            "heavy_modules": samples[-1]["heavy_modules"],
+        }
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    """Run the startup benchmark and print or save the results as JSON."""
+    parser = argparse.ArgumentParser(description="Measure import time and peak RSS")
+    parser.add_argument(
+        "--runs", type=int, default=5, help="Interpreter launches per case"
+    )
+    parser.add_argument(
+        "--case", action="append", choices=list(CASES), help="Case to run (repeatable)"
+    )
+    parser.add_argument(
+        "--output", type=str, default=None, help="Write JSON results to this file"
+    )
+    args = parser.parse_args(argv)
+    
+    results = measure_startup(args.runs, args.case)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
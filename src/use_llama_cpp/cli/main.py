@@ -3,14 +3,15 @@ Main CLI entry point for AI Room application.
 """
 
 import argparse
+import json
 import logging
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, List, Optional
 
-from ..core.model_loader import ModelLoader
-from ..core.chat import AIChat
-from ..utils.gpu_checker import GPUChecker
+if TYPE_CHECKING:
+    from ..core.chat import AIChat
+    from ..core.model_loader import ModelLoader
 
 
 def setup_logging(verbose: bool = False):
@@ -22,7 +23,166 @@ def setup_logging(verbose: bool = False):
     )
 
 
-def parse_arguments():
+def add_model_arguments(parser: argparse.ArgumentParser):
+    """Add the model loading arguments shared by all commands."""
+    parser.add_argument(
+        'model_path',
+        type=str,
+        help='Path to the GGUF model file'
+    )
+    
+    parser.add_argument(
+        '--gpu-layers',
+        type=int,
+        default=-1,
+        help='Number of GPU layers to use (-1 for all, 0 for CPU only)'
+    )
+    
+    parser.add_argument(
+        '--context-size',
+        type=int,
+        default=2048,
+        help='Context window size'
+    )
+    
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=None,
+        help='Threads for token generation (default: llama.cpp default or auto-tuned)'
+    )
+    
+    parser.add_argument(
+        '--threads-batch',
+        type=int,
+        default=None,
+        help='Threads for prompt processing (default: llama.cpp default or auto-tuned)'
+    )
+    
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=512,
+        help='Maximum tokens evaluated per llama.cpp batch'
+    )
+    
+    parser.add_argument(
+        '--auto-tune',
+        action='store_true',
+        help='Pick thread counts from the cgroup CPU quota and core topology'
+    )
+    
+    parser.add_argument(
+        '--calibrate',
+        action='store_true',
+        help='Time thread counts on the model once and cache the fastest '
+             '(implies --auto-tune)'
+    )
+    
+    parser.add_argument(
+        '--prefetch',
+        action='store_true',
+        help='Read the weights into the page cache in the background while loading'
+    )
+    
+    parser.add_argument(
+        '--warmup-tokens',
+        type=int,
+        default=8,
+        help='Tokens decoded to warm up the model after loading (0 to skip)'
+    )
+    
+    parser.add_argument(
+        '--draft-model',
+        type=str,
+        default=None,
+        help='Small GGUF model with the same vocabulary for speculative decoding'
+    )
+    
+    parser.add_argument(
+        '--prompt-lookup',
+        action='store_true',
+        help='Speculative decoding by n-gram lookup in the prompt '
+             '(no draft model needed)'
+    )
+    
+    parser.add_argument(
+        '--draft-tokens',
+        type=int,
+        default=8,
+        help='Tokens drafted per step with --draft-model or --prompt-lookup'
+    )
+    
+    parser.add_argument(
+        '--embedding',
+        action='store_true',
+        help='Load the model for embeddings (serves /v1/embeddings)'
+    )
+    
+    parser.add_argument(
+        '--pooling',
+        choices=['none', 'mean', 'cls', 'last'],
+        help="Embedding pooling (default: the model's own; 'none' lets requests choose)"
+    )
+    
+    parser.add_argument(
+        '--no-mmap',
+        action='store_true',
+        help='Read the weights into memory instead of memory-mapping the file'
+    )
+    
+    parser.add_argument(
+        '--mlock',
+        nargs='?',
+        const='on',
+        choices=['on', 'auto'],
+        help="Lock the weights in RAM; 'auto' locks only if the locked memory limit "
+             "and free memory allow"
+    )
+    
+    parser.add_argument(
+        '--numa',
+        help='NUMA placement: distribute, isolate, numactl, a node number to bind to, '
+             'or auto'
+    )
+    
+    cache_types = ['f32', 'f16', 'bf16', 'q8_0', 'q5_1', 'q5_0', 'q4_1', 'q4_0',
+                   'iq4_nl']
+    parser.add_argument(
+        '--cache-type-k',
+        choices=cache_types,
+        help='KV cache type of keys (default: f16, quantized if the context does not '
+             'fit in memory)'
+    )
+    
+    parser.add_argument(
+        '--cache-type-v',
+        choices=cache_types,
+        help='KV cache type of values; quantized types need flash attention'
+    )
+    
+    parser.add_argument(
+        '--flash-attn',
+        action='store_const',
+        const=True,
+        help='Use flash attention (default: enabled when needed to fit the context '
+             'in memory)'
+    )
+    
+    parser.add_argument(
+        '--memory-budget',
+        type=float,
+        help='GB the weights and KV cache may use (default: available memory on CPU)'
+    )
+    
+    parser.add_argument(
+        '--verbose', '-v',
+        action='store_true',
+        help='Enable verbose logging'
+    )
+
+
+def parse_arguments(argv: Optional[List[str]] = None):
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(
         description="AI Room - GPU-accelerated AI chat application",
@@ -32,11 +192,112 @@ Examples:
   airoom /path/to/model.gguf                    # Basic usage
   airoom model.gguf --gpu-layers 20            # Use 20 GPU layers
   airoom model.gguf --context-size 4096        # Larger context window
+  airoom model.gguf --auto-tune                # Threads from CPU quota and topology
   airoom model.gguf --verbose                   # Verbose logging
   airoom model.gguf --interactive              # Interactive chat mode
+
+Commands:
+  airoom serve model.gguf --port 8000          # OpenAI-compatible HTTP server
+  airoom bench model.gguf -o results.json      # Throughput and latency benchmark
+  airoom models /models                        # List models from their GGUF headers
+  airoom batch model.gguf in.jsonl out.jsonl   # Offline generation for many prompts
         """
     )
     
+    add_model_arguments(parser)
+    
+    parser.add_argument(
+        '--max-tokens',
+        type=int,
+        default=100,
+        help='Maximum tokens in response'
+    )
+    
+    parser.add_argument(
+        '--temperature',
+        type=float,
+        default=0.3,
+        help='Response randomness (0.0 = deterministic, 1.0 = random)'
+    )
+    
+    parser.add_argument(
+        '--interactive',
+        action='store_true',
+        help='Run in interactive chat mode'
+    )
+    
+    parser.add_argument(
+        '--system-prompt',
+        type=str,
+        default="You are a helpful AI assistant. Keep your responses concise and relevant.",
+        help='System prompt for the AI assistant'
+    )
+    
+    parser.add_argument(
+        '--session',
+        type=str,
+        default=None,
+        help='Session file to resume from and save to on exit (interactive mode)'
+    )
+    
+    return parser.parse_args(argv)
+
+
+def parse_serve_arguments(argv: Optional[List[str]] = None):
+    """Parse arguments for the serve command."""
+    parser = argparse.ArgumentParser(
+        prog="use-llama-cpp serve",
+        description="Serve a model over an OpenAI-compatible HTTP API"
+    )
+    
+    add_model_arguments(parser)
+    
+    parser.add_argument(
+        '--host',
+        type=str,
+        default='127.0.0.1',
+        help='Interface to bind (use 0.0.0.0 inside containers)'
+    )
+    
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8000,
+        help='Port to listen on'
+    )
+    
+    parser.add_argument(
+        '--max-queue',
+        type=int,
+        default=16,
+        help='Requests allowed to wait before the server answers 429'
+    )
+    
+    parser.add_argument(
+        '--model-name',
+        type=str,
+        default=None,
+        help='Model id reported to clients (defaults to the file name)'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Worker processes, each pinned to its own CPUs and sharing the mapped '
+             'weights'
+    )
+    
+    return parser.parse_args(argv)
+
+
+def parse_bench_arguments(argv: Optional[List[str]] = None):
+    """Parse arguments for the bench command."""
+    parser = argparse.ArgumentParser(
+        prog="use-llama-cpp bench",
+        description="Measure prefill/decode throughput, TTFT and latency percentiles"
+    )
+    
     parser.add_argument(
         'model_path',
         type=str,
@@ -51,30 +312,82 @@ Examples:
     )
     
     parser.add_argument(
-        '--context-size',
+        '--threads',
         type=int,
-        default=2048,
-        help='Context window size'
+        default=None,
+        help='Threads for token generation'
+    )
+    
+    parser.add_argument(
+        '--prompt-lengths',
+        type=int,
+        nargs='+',
+        default=[32, 128, 512],
+        help='Prompt lengths in tokens'
+    )
+    
+    parser.add_argument(
+        '--context-sizes',
+        type=int,
+        nargs='+',
+        default=[2048],
+        help='Context window sizes to load the model with'
+    )
+    
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        nargs='+',
+        default=[1, 4],
+        help='Numbers of concurrent requests'
     )
     
     parser.add_argument(
         '--max-tokens',
         type=int,
-        default=100,
-        help='Maximum tokens in response'
+        default=32,
+        help='Tokens generated per request'
     )
     
     parser.add_argument(
-        '--temperature',
+        '--repeats',
+        type=int,
+        default=3,
+        help='Measurements per scenario'
+    )
+    
+    parser.add_argument(
+        '--chat-turns',
+        type=int,
+        default=4,
+        help='Turns in the multi-turn chat scenario'
+    )
+    
+    parser.add_argument(
+        '--output', '-o',
+        type=str,
+        default=None,
+        help='Write JSON results to this file'
+    )
+    
+    parser.add_argument(
+        '--compare',
+        type=str,
+        default=None,
+        help='Baseline JSON results to compare against'
+    )
+    
+    parser.add_argument(
+        '--threshold',
         type=float,
-        default=0.3,
-        help='Response randomness (0.0 = deterministic, 1.0 = random)'
+        default=0.05,
+        help='Relative change reported as better/worse (default 0.05)'
     )
     
     parser.add_argument(
-        '--interactive',
+        '--fail-on-regression',
         action='store_true',
-        help='Run in interactive chat mode'
+        help='Exit with status 1 if any metric got worse than the baseline'
     )
     
     parser.add_argument(
@@ -83,17 +396,111 @@ Examples:
         help='Enable verbose logging'
     )
     
+    return parser.parse_args(argv)
+
+
+def parse_models_arguments(argv: Optional[List[str]] = None):
+    """Parse arguments for the models command."""
+    parser = argparse.ArgumentParser(
+        prog="use-llama-cpp models",
+        description="List GGUF models in a directory from their headers, "
+                    "without loading them"
+    )
+    
+    parser.add_argument(
+        'directory',
+        type=str,
+        help='Directory to scan for .gguf files'
+    )
+    
+    parser.add_argument(
+        '--no-recursive',
+        action='store_true',
+        help='Do not scan subdirectories'
+    )
+    
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='Print the listing as JSON'
+    )
+    
+    parser.add_argument(
+        '--verbose', '-v',
+        action='store_true',
+        help='Enable verbose logging'
+    )
+    
+    return parser.parse_args(argv)
+
+
+def parse_batch_arguments(argv: Optional[List[str]] = None):
+    """Parse arguments for the batch command."""
+    parser = argparse.ArgumentParser(
+        prog="use-llama-cpp batch",
+        description="Generate responses for a JSONL file of independent prompts, "
+                    "several prompts per llama.cpp batch"
+    )
+    
+    add_model_arguments(parser)
+    
+    parser.add_argument(
+        'input',
+        type=str,
+        help='JSONL file with one {"id": ..., "prompt": ...} or '
+             '{"id": ..., "messages": [...]} per line'
+    )
+    
+    parser.add_argument(
+        'output',
+        type=str,
+        help='JSONL file results are appended to; also the checkpoint for resuming'
+    )
+    
+    parser.add_argument(
+        '--parallel',
+        type=int,
+        default=8,
+        help='Prompts decoded together'
+    )
+    
+    parser.add_argument(
+        '--max-tokens',
+        type=int,
+        default=100,
+        help='Maximum tokens per response (records may override)'
+    )
+    
+    parser.add_argument(
+        '--temperature',
+        type=float,
+        default=0.3,
+        help='Response randomness (records may override)'
+    )
+    
     parser.add_argument(
         '--system-prompt',
         type=str,
-        default="You are a helpful AI assistant. Keep your responses concise and relevant.",
-        help='System prompt for the AI assistant'
+        default=None,
+        help='System prompt for records that do not set one'
     )
     
-    return parser.parse_args()
+    parser.add_argument(
+        '--no-resume',
+        action='store_true',
+        help='Overwrite the output instead of skipping records already in it'
+    )
+    
+    parser.add_argument(
+        '--no-share-prefix',
+        action='store_true',
+        help='Evaluate the system prompt separately for every record'
+    )
+    
+    return parser.parse_args(argv)
 
 
-def interactive_chat(chat: AIChat):
+def interactive_chat(chat: "AIChat"):
     """Run interactive chat mode."""
     print("\n💬 Interactive chat mode (type 'quit', 'exit', or 'q' to exit)")
     print("💡 Type 'reset' to clear conversation history")
@@ -133,13 +540,17 @@ def interactive_chat(chat: AIChat):
                 print("  help - Show this help message")
                 continue
             
-            # Get AI response
-            response = chat.get_response(user_input)
+            # Stream AI response as it is generated
+            print("Assistant: ", end="", flush=True)
+            received = False
+            for delta in chat.stream_response(user_input):
+                received = True
+                print(delta, end="", flush=True)
             
-            if response:
-                print(f"Assistant: {response}")
+            if received:
+                print()
             else:
-                print("Assistant: I'm not sure how to respond to that.")
+                print("I'm not sure how to respond to that.")
                 
         except KeyboardInterrupt:
             print("\n\n👋 Goodbye!")
@@ -148,37 +559,265 @@ def interactive_chat(chat: AIChat):
             print(f"❌ Error: {e}")
 
 
-def main():
-    """Main entry point."""
-    args = parse_arguments()
+def create_loader(args) -> "ModelLoader":
+    """Create the model loader described by parsed arguments."""
+    from ..core.model_loader import ModelLoader
+    
+    return ModelLoader(
+        model_path=args.model_path,
+        gpu_layers=args.gpu_layers,
+        context_size=args.context_size,
+        n_threads=args.threads,
+        n_threads_batch=args.threads_batch,
+        n_batch=args.batch_size,
+        auto_tune=args.auto_tune,
+        calibrate=args.calibrate,
+        prefetch=args.prefetch,
+        warmup_tokens=args.warmup_tokens,
+        draft_model_path=args.draft_model,
+        prompt_lookup=args.prompt_lookup,
+        draft_tokens=args.draft_tokens,
+        embedding=args.embedding,
+        pooling=args.pooling,
+        use_mmap=not args.no_mmap,
+        use_mlock={None: False, 'on': True, 'auto': None}[args.mlock],
+        numa=args.numa,
+        type_k=args.cache_type_k,
+        type_v=args.cache_type_v,
+        flash_attn=args.flash_attn,
+        memory_budget=(int(args.memory_budget * 1024 ** 3)
+                       if args.memory_budget else None)
+    )
+
+
+def load_model_or_exit(args) -> "ModelLoader":
+    """Load and warm up the model described by parsed arguments, exiting on failure."""
+    model_loader = create_loader(args)
+    
+    print(f"\n🚀 Loading model: {args.model_path}")
+    if not model_loader.load_and_warmup():
+        logging.getLogger(__name__).error("Failed to load model")
+        sys.exit(1)
+    
+    return model_loader
+
+
+def serve(argv: Optional[List[str]] = None):
+    """Run the OpenAI-compatible HTTP server."""
+    from ..server import InferenceServer, PreforkServer
+    
+    args = parse_serve_arguments(argv)
     setup_logging(args.verbose)
+    model_name = args.model_name or Path(args.model_path).stem
     
-    logger = logging.getLogger(__name__)
+    if args.workers > 1:
+        # Workers load their own copy of the context; the weights are shared
+        server = PreforkServer(
+            create_loader(args),
+            n_workers=args.workers,
+            model_name=model_name,
+            host=args.host,
+            port=args.port,
+            max_queue_size=args.max_queue
+        )
+        print(f"\n🚀 Starting {args.workers} workers for: {args.model_path}")
+        print(f"🌐 Serving on http://{args.host}:{args.port}/v1 "
+              f"(GET /ready reports when a worker is warm)")
+        server.run()
+        return
     
-    # Check GPU availability
-    print("🔍 Checking GPU availability...")
-    GPUChecker.print_gpu_summary()
+    # Load in the background so health checks are answered meanwhile
+    model_loader = create_loader(args)
+    print(f"\n🚀 Loading model: {args.model_path}")
+    model_loader.start_background_load()
+    server = InferenceServer(
+        model_name=model_name,
+        host=args.host,
+        port=args.port,
+        max_queue_size=args.max_queue,
+        loader=model_loader
+    )
+    
+    print(f"🌐 Serving on http://{args.host}:{args.port}/v1 "
+          f"(GET /ready reports when the model is warm)")
+    server.run()
     
-    # Initialize model loader
-    model_loader = ModelLoader(
+    model_loader.unload_model()
+
+
+def bench(argv: Optional[List[str]] = None):
+    """Run the inference benchmark suite."""
+    from ..benchmarks.inference import (
+        BenchmarkConfig, compare_results, load_report, run_benchmarks, save_report
+    )
+    
+    args = parse_bench_arguments(argv)
+    setup_logging(args.verbose)
+    
+    config = BenchmarkConfig(
         model_path=args.model_path,
+        prompt_lengths=args.prompt_lengths,
+        context_sizes=args.context_sizes,
+        concurrency=args.concurrency,
+        max_tokens=args.max_tokens,
+        repeats=args.repeats,
+        chat_turns=args.chat_turns,
         gpu_layers=args.gpu_layers,
-        context_size=args.context_size
+        n_threads=args.threads
     )
     
-    # Load model
-    print(f"\n🚀 Loading model: {args.model_path}")
-    model = model_loader.load_model()
+    print(f"⏱️  Benchmarking: {args.model_path}")
+    try:
+        report = run_benchmarks(config)
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Benchmark failed: {e}")
+        sys.exit(1)
+    
+    for run in report["runs"]:
+        print(f"\n📐 Context size {run['context_size']}")
+        for entry in run["prompt_lengths"]:
+            print(f"   prompt {entry['prompt_length']:>5}: "
+                  f"prefill {entry['prefill_tokens_per_second']:8.1f} tok/s, "
+                  f"decode {entry['decode_tokens_per_second']:7.1f} tok/s, "
+                  f"TTFT p50 {entry['ttft_seconds_percentiles']['p50'] * 1000:7.1f} ms")
+        for entry in run["concurrency"]:
+            latency = entry["latency_seconds_percentiles"]
+            print(f"   concurrency {entry['concurrency']:>2}: "
+                  f"{entry['tokens_per_second']:8.1f} tok/s, latency p50/p95/p99 "
+                  f"{latency['p50']:.3f}/{latency['p95']:.3f}/{latency['p99']:.3f} s")
+        chat = run["chat"]
+        ttft = chat['ttft_seconds_percentiles']['p50'] * 1000
+        print(f"   chat: TTFT p50 {ttft:.1f} ms over {chat['samples']} turns")
+    
+    if args.output:
+        save_report(report, args.output)
+        print(f"\n💾 Results written to {args.output}")
+    
+    if args.compare:
+        rows = compare_results(load_report(args.compare), report, args.threshold)
+        print(f"\n📊 Compared with {args.compare}")
+        for row in rows:
+            if row["verdict"] != "same":
+                print(f"   {row['verdict']:>6} {row['change'] * 100:+6.1f}%  "
+                      f"{row['metric']}")
+        worse = sum(row["verdict"] == "worse" for row in rows)
+        better = sum(row["verdict"] == "better" for row in rows)
+        print(f"   {worse} worse, {better} better, {len(rows)} compared")
+        if worse and args.fail_on_regression:
+            sys.exit(1)
+
+
+def models(argv: Optional[List[str]] = None):
+    """List the GGUF models in a directory."""
+    from ..utils.gguf import list_models
+    
+    args = parse_models_arguments(argv)
+    setup_logging(args.verbose)
+    
+    found = list_models(args.directory, recursive=not args.no_recursive)
+    if args.json:
+        print(json.dumps([gguf.summary() for gguf in found], indent=2))
+        return
+    
+    if not found:
+        print(f"No GGUF models found in {args.directory}")
+        return
+    print(f"{'NAME':<32} {'ARCH':<12} {'QUANT':<8} {'PARAMS':>8} {'CONTEXT':>8} "
+          f"{'SIZE':>9}  PATH")
+    for gguf in found:
+        context = gguf.context_length or "-"
+        print(f"{gguf.name[:32]:<32} {gguf.architecture[:12]:<12} "
+              f"{gguf.quantization:<8} {gguf.parameter_count / 1e9:7.2f}B {context:>8} "
+              f"{gguf.file_size / 1024 ** 3:7.2f}GB  {gguf.path}")
+
+
+def batch(argv: Optional[List[str]] = None):
+    """Run offline generation over a JSONL file of prompts."""
+    from ..core.batch import BatchRunner
+    from ..core.scheduler import SamplingParams
+    
+    args = parse_batch_arguments(argv)
+    setup_logging(args.verbose)
     
-    if not model:
-        logger.error("Failed to load model")
+    if not Path(args.input).exists():
+        logging.getLogger(__name__).error(f"Input file not found: {args.input}")
         sys.exit(1)
     
-    # Initialize chat
-    chat = AIChat(model, system_prompt=args.system_prompt)
+    model_loader = load_model_or_exit(args)
+    runner = BatchRunner(
+        model_loader.model,
+        n_parallel=args.parallel,
+        params=SamplingParams(max_tokens=args.max_tokens, temperature=args.temperature),
+        system_prompt=args.system_prompt,
+        n_batch=args.batch_size,
+        share_prefix=not args.no_share_prefix
+    )
+    
+    written = 0
+    
+    def progress(result):
+        nonlocal written
+        written += 1
+        if written % 100 == 0:
+            print(f"   {written} records written", flush=True)
+    
+    print(f"📦 Generating {args.input} -> {args.output} "
+          f"with {args.parallel} parallel sequences")
+    try:
+        summary = runner.run(args.input, args.output, resume=not args.no_resume,
+                             on_result=progress)
+    except KeyboardInterrupt:
+        print(f"\n⏸️  Interrupted; rerun the same command to resume from {args.output}")
+        sys.exit(130)
+    finally:
+        model_loader.unload_model()
+    
+    print(f"✅ {summary['completed']} completed, {summary['failed']} failed, "
+          f"{summary['skipped']} already done in {summary['seconds']:.1f}s "
+          f"({summary['completion_tokens_per_second']:.1f} tok/s)")
+
+
+COMMANDS = {
+    "serve": serve,
+    "bench": bench,
+    "models": models,
+    "batch": batch,
+}
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main entry point."""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+    
+    args = parse_arguments(argv)
+    setup_logging(args.verbose)
+    
+    # Heavy imports wait until arguments are valid, so --help stays fast
+    from ..core.chat import AIChat
+    from ..utils.gpu_checker import GPUChecker
+    
+    # Check GPU availability
+    print("🔍 Checking GPU availability...")
+    GPUChecker.print_gpu_summary()
+    
+    # Load model
+    model_loader = load_model_or_exit(args)
+    
+    # Initialize chat, resuming a saved session if there is one
+    chat = None
+    if args.session and Path(args.session).exists():
+        chat = AIChat.load_session(model_loader.model, args.session)
+        if chat:
+            print(f"📂 Resumed session: {args.session}")
+    if chat is None:
+        chat = AIChat(model_loader.model, system_prompt=args.system_prompt)
     
     if args.interactive:
         interactive_chat(chat)
+        if args.session:
+            chat.save_session(args.session)
     else:
         # Simple test
         print("\n🧪 Testing model with a simple prompt...")
@@ -2,7 +2,48 @@
 Core functionality for AI Room application.
 """
 
-from .chat import AIChat
-from .model_loader import ModelLoader
+from typing import TYPE_CHECKING
 
-__all__ = ["AIChat", "ModelLoader"]
+from .._lazy import lazy_attributes
+
+if TYPE_CHECKING:
+    from .batch import BatchRunner
+    from .chat import AIChat, AsyncAIChat
+    from .embeddings import Embedder
+    from .grammar import GrammarCache
+    from .kv_cache import PrefixStateCache
+    from .model_loader import ModelLoader
+    from .pool import ModelPool
+    from .response_cache import ResponseCache
+    from .scheduler import BatchScheduler, SamplingParams
+    from .tokenizer import Tokenizer
+
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    "AIChat": ".chat",
+    "AsyncAIChat": ".chat",
+    "ModelLoader": ".model_loader",
+    "ModelPool": ".pool",
+    "BatchScheduler": ".scheduler",
+    "BatchRunner": ".batch",
+    "SamplingParams": ".scheduler",
+    "PrefixStateCache": ".kv_cache",
+    "ResponseCache": ".response_cache",
+    "Embedder": ".embeddings",
+    "GrammarCache": ".grammar",
+    "Tokenizer": ".tokenizer",
+})
+
+__all__ = [
+    "AIChat",
+    "AsyncAIChat",
+    "ModelLoader",
+    "ModelPool",
+    "BatchScheduler",
+    "BatchRunner",
+    "SamplingParams",
+    "PrefixStateCache",
+    "ResponseCache",
+    "Embedder",
+    "GrammarCache",
+    "Tokenizer",
+]
@@ -0,0 +1,364 @@
+"""
+Offline batch generation for AI Room application.
+
+Runs many independent prompts, each as a fresh conversation, through the
+BatchScheduler so that several of them share every llama.cpp decode call.
+Input and output are JSONL files. Results are appended as soon as each
+prompt finishes, and the output file doubles as the checkpoint: records
+whose id is already in it are skipped when an interrupted run is resumed.
+Generations that failed or were cancelled are written too, but retried on
+resume; records rejected as invalid input are not.
+"""
+
+import json
+import logging
+import os
+import time
+from dataclasses import replace
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from llama_cpp import Llama
+
+from .prompt import chat_prefix_tokens, tokenize_chat_prompt
+from .scheduler import BatchScheduler, SamplingParams, ScheduledRequest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYSTEM_PROMPT = (
+    "You are a helpful AI assistant. Keep your responses concise and relevant."
+)
+
+# Finish reasons of failed generations, which a resumed run retries
+RETRY_FINISH_REASONS = ("error", "cancelled")
+
+# Per-record keys that override the runner's sampling settings
+_PARAM_KEYS = ("max_tokens", "temperature", "top_p", "top_k", "seed", "stop")
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Read prompt records from a JSONL file one line at a time.
+
+    A record is an object with either a "prompt" string or a chat "messages"
+    list, and optionally an "id", a "system" prompt and sampling overrides.
+    Records without an id get their line number. A bare JSON string is
+    treated as a prompt.
+
+    Args:
+        path: JSONL input file
+
+    Yields:
+        Records with an "id"; lines that are not valid JSON yield a record
+        with an "error"
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {"id": line_number, "error": f"Invalid JSON: {e}"}
+                continue
+            if isinstance(record, str):
+                record = {"prompt": record}
+            if not isinstance(record, dict):
+                yield {
+                    "id": line_number,
+                    "error": "Record must be an object or a string",
+                }
+                continue
+            record.setdefault("id", line_number)
+            yield record
+
+
+def completed_ids(path: str) -> Set[Any]:
+    """
+    Ids already written to a results file, for resuming a batch run.
+
+    Failed or cancelled generations are not counted, so they run again.
+    A partial last line left by an interrupted run is cut off so the next
+    result starts on a fresh line.
+
+    Args:
+        path: JSONL output file
+
+    Returns:
+        Set of completed record ids (empty if the file does not exist)
+    """
+    done: Set[Any] = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path, "r+b") as f:
+        valid_end = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            valid_end += len(line)
+            try:
+                result = json.loads(line)
+                if result.get("finish_reason") not in RETRY_FINISH_REASONS:
+                    done.add(_id_key(result["id"]))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                logger.warning(f"Ignoring unreadable line in {path}")
+        if f.tell() != valid_end:
+            logger.warning(f"Truncating partial result at the end of {path}")
+            f.truncate(valid_end)
+    return done
+
+
+def _id_key(record_id: Any) -> Any:
+    """Hashable form of a record id."""
+    return json.dumps(record_id) if isinstance(record_id, (list, dict)) else record_id
+
+
+class BatchRunner:
+    """Generates responses for many independent prompts with shared batches."""
+
+    def __init__(self,
+                 model: Llama,
+                 n_parallel: int = 8,
+                 params: Optional[SamplingParams] = None,
+                 system_prompt: Optional[str] = None,
+                 context_per_sequence: Optional[int] = None,
+                 n_batch: Optional[int] = None,
+                 share_prefix: bool = True,
+                 scheduler: Optional[BatchScheduler] = None):
+        """
+        Initialize the runner.
+
+        Args:
+            model: Loaded Llama model instance
+            n_parallel: Prompts decoded together
+            params: Default sampling settings, overridable per record
+            system_prompt: System prompt for records that do not set one
+            context_per_sequence: Context tokens per prompt (defaults to an
+                even share of the model's n_ctx, so the KV cache stays at n_ctx)
+            n_batch: Maximum tokens per llama_decode call (defaults to the
+                model's n_batch)
+            share_prefix: Evaluate the chat prefix (system prompt) once and
+                copy it into every prompt that starts with it
+            scheduler: Existing scheduler to step instead of creating one; it
+                must not be running its background loop
+        """
+        self.model = model
+        self.n_parallel = n_parallel
+        self.params = params or SamplingParams()
+        self.system_prompt = system_prompt or DEFAULT_SYSTEM_PROMPT
+        self.context_per_sequence = context_per_sequence
+        self.n_batch = n_batch
+        self.share_prefix = share_prefix
+        self.scheduler = scheduler
+        self._prefixes: Dict[str, List[int]] = {}
+
+    def generate(self, records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Generate a response for every record.
+
+        Records are read lazily and only about twice n_parallel are in
+        flight at once, so arbitrarily long inputs run in constant memory.
+
+        Args:
+            records: Prompt records as described in read_records
+
+        Yields:
+            Result records in completion order, each with the record's "id"
+            and either "response" or "error"
+        """
+        own_scheduler = self.scheduler is None
+        scheduler = self.scheduler or BatchScheduler(
+            self.model,
+            n_parallel=self.n_parallel,
+            context_per_sequence=(
+                self.context_per_sequence or self.model.n_ctx() // self.n_parallel
+            ),
+            n_batch=self.n_batch,
+            share_prefix=self.share_prefix
+        )
+        share_prefix = self.share_prefix and getattr(scheduler, "share_prefix", False)
+        max_in_flight = 2 * scheduler.n_parallel
+        pending = iter(records)
+        in_flight: List[Tuple[Dict[str, Any], ScheduledRequest]] = []
+        exhausted = False
+        prefix: Optional[List[int]] = None
+
+        try:
+            while True:
+                while not exhausted and len(in_flight) < max_in_flight:
+                    record = next(pending, None)
+                    if record is None:
+                        exhausted = True
+                        break
+                    if "error" in record:
+                        yield {"id": record.get("id"), "error": record["error"]}
+                        continue
+                    try:
+                        messages, params = self._prepare(record)
+                        tokens, stop = tokenize_chat_prompt(self.model, messages)
+                        params = replace(
+                            params,
+                            stop=list(params.stop)
+                            + [s for s in stop if s not in params.stop],
+                        )
+                        if share_prefix:
+                            prefix = self._update_prefix(scheduler, messages, prefix)
+                        in_flight.append((record, scheduler.submit(tokens, params)))
+                    except Exception as e:
+                        logger.warning(f"Skipping record {record.get('id')}: {e}")
+                        yield {"id": record.get("id"), "error": str(e)}
+
+                if not in_flight:
+                    break
+
+                scheduler.step()
+                still_running = []
+                for record, request in in_flight:
+                    if request.done:
+                        yield self._result(record, request)
+                    else:
+                        still_running.append((record, request))
+                in_flight = still_running
+        finally:
+            if own_scheduler:
+                scheduler.close()
+
+    def run(
+        self,
+        input_path: str,
+        output_path: str,
+        resume: bool = True,
+        on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Generate responses for a JSONL file and append them to another.
+
+        Every result is flushed as soon as it is written, so an interrupted
+        run loses at most the prompts that were in flight. With resume,
+        records whose id already appears in the output are skipped.
+
+        Args:
+            input_path: JSONL file of prompt records
+            output_path: JSONL file results are appended to
+            resume: Skip records already in the output instead of starting over
+            on_result: Called with every result record after it is written
+
+        Returns:
+            Run statistics
+        """
+        done = completed_ids(output_path) if resume else set()
+        if done:
+            logger.info(f"Resuming: {len(done)} records already in {output_path}")
+
+        skipped = 0
+
+        def remaining() -> Iterator[Dict[str, Any]]:
+            nonlocal skipped
+            for record in read_records(input_path):
+                if _id_key(record.get("id")) in done:
+                    skipped += 1
+                    continue
+                yield record
+
+        summary = {
+            "completed": 0,
+            "failed": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        }
+        started = time.perf_counter()
+        last_sync = started
+        with open(output_path, "a" if resume else "w", encoding="utf-8") as out:
+            for result in self.generate(remaining()):
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                # Bound what a power loss can take; flush alone covers crashes
+                if time.perf_counter() - last_sync > 5.0:
+                    os.fsync(out.fileno())
+                    last_sync = time.perf_counter()
+                if "error" in result:
+                    summary["failed"] += 1
+                else:
+                    summary["completed"] += 1
+                    summary["prompt_tokens"] += result["prompt_tokens"]
+                    summary["completion_tokens"] += result["completion_tokens"]
+                if on_result is not None:
+                    on_result(result)
+            out.flush()
+            os.fsync(out.fileno())
+
+        elapsed = time.perf_counter() - started
+        summary["skipped"] = skipped
+        summary["seconds"] = elapsed
+        summary["completion_tokens_per_second"] = (
+            summary["completion_tokens"] / elapsed if elapsed else 0.0
+        )
+        logger.info(
+            f"Batch finished: {summary['completed']} completed, "
+            f"{summary['failed']} failed, {skipped} skipped in {elapsed:.1f}s"
+        )
+        return summary
+
+    def _prepare(
+        self, record: Dict[str, Any]
+    ) -> Tuple[List[Dict[str, str]], SamplingParams]:
+        """Build the conversation and sampling settings of a record."""
+        if "messages" in record:
+            messages = list(record["messages"])
+            if not messages or messages[0].get("role") != "system":
+                messages.insert(
+                    0,
+                    {
+                        "role": "system",
+                        "content": record.get("system", self.system_prompt),
+                    },
+                )
+        elif isinstance(record.get("prompt"), str):
+            messages = [
+                {"role": "system", "content": record.get("system", self.system_prompt)},
+                {"role": "user", "content": record["prompt"]},
+            ]
+        else:
+            raise ValueError("Record needs a 'prompt' string or a 'messages' list")
+
+        overrides = {key: record[key] for key in _PARAM_KEYS if key in record}
+        if isinstance(overrides.get("stop"), str):
+            overrides["stop"] = [overrides["stop"]]
+        return messages, replace(self.params, **overrides)
+
+    def _update_prefix(self,
+                       scheduler: BatchScheduler,
+                       messages: List[Dict[str, str]],
+                       current: Optional[List[int]]) -> List[int]:
+        """Share the chat prefix of the record's system prompt if it changed."""
+        system = [m for m in messages[:1] if m.get("role") == "system"]
+        key = system[0]["content"] if system else ""
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            prefix = chat_prefix_tokens(self.model, system)
+            if len(prefix) >= scheduler.context_per_sequence:
+                prefix = []
+            # Runs rarely have more than a few system prompts
+            if len(self._prefixes) < 16:
+                self._prefixes[key] = prefix
+        if prefix != current:
+            scheduler.set_shared_prefix(prefix)
+        return prefix
+
+    @staticmethod
+    def _result(record: Dict[str, Any], request: ScheduledRequest) -> Dict[str, Any]:
+        """Result record of a finished request."""
+        if request.finish_reason in RETRY_FINISH_REASONS:
+            return {
+                "id": record.get("id"),
+                "error": f"Generation {request.finish_reason}",
+                "finish_reason": request.finish_reason,
+            }
+        return {
+            "id": record.get("id"),
+            "response": request.text.strip(),
+            "finish_reason": request.finish_reason,
+            "prompt_tokens": len(request.prompt_tokens),
+            "completion_tokens": len(request.output_tokens),
+        }
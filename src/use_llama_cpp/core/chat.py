@@ -3,29 +3,107 @@ Chat functionality for AI Room application.
 """
 
 import logging
-from typing import List, Dict, Any, Optional
-from llama_cpp import Llama
+import os
+from typing import (
+    List,
+    Dict,
+    Any,
+    Optional,
+    Iterator,
+    AsyncIterator,
+    Sequence,
+    Tuple,
+    Callable,
+)
+from llama_cpp import Llama, LlamaGrammar, LlamaState
+
+from .context import ContextPolicy, ContextWindow, SlidingWindowPolicy, shift_context
+from .grammar import GrammarCache, Schema, default_grammar_cache
+from .kv_cache import PrefixStateCache, evaluate_prefix
+from .metrics import MetricsRegistry, RequestMetrics, RequestTimer, default_registry
+from .prompt import chat_prefix_tokens, tokenize_chat_prompt
+from .response_cache import ResponseCache
+from .tokenizer import Tokenizer
+from .worker import ModelWorker
+from . import session
 
 logger = logging.getLogger(__name__)
 
+# Sequences that end a turn when the chat template leaks role markers
+STOP_SEQUENCES = ["\nHuman:", "Human:", "Assistant:"]
+
+# Template tokens around each message (role markers, separators), estimated
+MESSAGE_OVERHEAD = 8
+
 
 class AIChat:
     """Handles chat interactions with the loaded language model."""
     
-    def __init__(self, model: Llama, system_prompt: str = None):
+    def __init__(self,
+                 model: Llama,
+                 system_prompt: str = None,
+                 snapshot_kv: bool = False,
+                 prefix_cache: Optional[PrefixStateCache] = None,
+                 context_policy: Optional[ContextPolicy] = None,
+                 metrics: Optional[MetricsRegistry] = None,
+                 on_metrics: Optional[Callable[[RequestMetrics], None]] = None,
+                 response_cache: Optional[ResponseCache] = None,
+                 grammar_cache: Optional[GrammarCache] = None,
+                 tokenizer: Optional[Tokenizer] = None):
         """
         Initialize the chat interface.
         
         Args:
             model: Loaded Llama model instance
             system_prompt: System prompt for the AI assistant
+            snapshot_kv: Keep a copy of this conversation's KV state after each
+                turn so it can be restored if another session reuses the model
+            prefix_cache: Shared cache of evaluated system-prompt states, so new
+                sessions and resets skip evaluating the system prompt
+            context_policy: Decides which messages are sent once the history
+                outgrows the context window (default: SlidingWindowPolicy)
+            metrics: Registry that aggregates per-request metrics
+                (default: the shared default_registry)
+            on_metrics: Called with the RequestMetrics of every finished turn
+            response_cache: Replies to reuse for repeated deterministic requests
+                (temperature 0 or a fixed seed)
+            grammar_cache: Compiled grammars for json_schema and grammar
+                requests (default: the shared default_grammar_cache)
+            tokenizer: Token ID cache used to count messages (default: the
+                model's shared Tokenizer)
         """
         self.model = model
         self.system_prompt = system_prompt or "You are a helpful AI assistant. Keep your responses concise and relevant."
         self.conversation_history: List[Dict[str, str]] = [
             {"role": "system", "content": self.system_prompt}
         ]
+        self.snapshot_kv = snapshot_kv
+        # Tokens this conversation left in the model's KV cache after its last turn
+        self._kv_tokens: List[int] = []
+        self._kv_snapshot: Optional[LlamaState] = None
+        self.prefix_cache = prefix_cache
+        self._system_prefix: Optional[List[int]] = None
+        self.last_prompt_tokens = 0
+        self.last_cached_tokens = 0
+        self.context_policy = context_policy or SlidingWindowPolicy()
+        self._window = ContextWindow()
+        self._tokenizer = tokenizer
+        self.metrics = metrics if metrics is not None else default_registry
+        self.on_metrics = on_metrics
+        self.last_metrics: Optional[RequestMetrics] = None
+        self.response_cache = response_cache
+        self.last_cache_hit = False
+        self.grammar_cache = (
+            grammar_cache if grammar_cache is not None else default_grammar_cache
+        )
         
+    @property
+    def tokenizer(self) -> Tokenizer:
+        """The tokenizer given, or the shared one of the current model."""
+        if self._tokenizer is not None:
+            return self._tokenizer
+        return Tokenizer.for_model(self.model)
+    
     def add_message(self, role: str, content: str):
         """Add a message to the conversation history."""
         self.conversation_history.append({"role": role, "content": content})
@@ -36,7 +114,10 @@ class AIChat:
                     temperature: float = 0.3,
                     top_p: float = 0.9,
                     top_k: int = 40,
-                    repeat_penalty: float = 1.1) -> Optional[str]:
+                    repeat_penalty: float = 1.1,
+                    seed: Optional[int] = None,
+                    json_schema: Optional[Schema] = None,
+                    grammar: Optional[str] = None) -> Optional[str]:
         """
         Get a response from the AI model.
         
@@ -47,6 +128,9 @@ class AIChat:
             top_p: Nucleus sampling parameter
             top_k: Top-k sampling parameter
             repeat_penalty: Penalty for repetition
+            seed: Sampling seed for reproducible output
+            json_schema: JSON schema (dict or JSON string) the response must match
+            grammar: GBNF grammar the response must match, instead of a schema
             
         Returns:
             AI response text or None if error
@@ -54,20 +138,41 @@ class AIChat:
         # Add user message to conversation
         self.add_message("user", user_message)
         
+        sampling = self._sampling(
+            max_tokens, temperature, top_p, top_k, repeat_penalty, seed
+        )
+        sampling.update(json_schema=json_schema, grammar=grammar)
+        cached = self._cached_response(sampling)
+        if cached is not None:
+            self.add_message("assistant", cached)
+            return cached
+        
+        timer = RequestTimer(self.model)
         try:
-            response = self.model.create_chat_completion(
-                messages=self.conversation_history,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p,
-                top_k=top_k,
-                repeat_penalty=repeat_penalty,
-                stop=["\nHuman:", "Human:", "Assistant:"]
+            response = self.model.create_completion(
+                **self._completion_kwargs(
+                    max_tokens,
+                    temperature,
+                    top_p,
+                    top_k,
+                    repeat_penalty,
+                    seed,
+                    self._grammar(json_schema, grammar),
+                )
             )
+            self._remember_kv()
+            usage = response.get('usage') or {}
+            self._record_metrics(timer.finish(
+                prompt_tokens=self.last_prompt_tokens,
+                completion_tokens=usage.get('completion_tokens'),
+                cached_tokens=self.last_cached_tokens,
+                finish_reason=response['choices'][0].get('finish_reason'),
+            ))
             
-            response_text = response['choices'][0]['message']['content'].strip()
+            response_text = response['choices'][0]['text'].strip()
             
             if response_text:
+                self._store_response(sampling, response_text)
                 # Add AI response to conversation history
                 self.add_message("assistant", response_text)
                 return response_text
@@ -77,13 +182,466 @@ class AIChat:
                 
         except Exception as e:
             logger.error(f"Error generating response: {e}")
+            self._record_metrics(timer.finish(
+                prompt_tokens=self.last_prompt_tokens,
+                cached_tokens=self.last_cached_tokens,
+                finish_reason="error",
+            ))
+            return None
+    
+    def stream_response(self,
+                        user_message: str,
+                        max_tokens: int = 100,
+                        temperature: float = 0.3,
+                        top_p: float = 0.9,
+                        top_k: int = 40,
+                        repeat_penalty: float = 1.1,
+                        seed: Optional[int] = None,
+                        json_schema: Optional[Schema] = None,
+                        grammar: Optional[str] = None) -> Iterator[str]:
+        """
+        Stream a response from the AI model as it is generated.
+        
+        Takes the same sampling arguments as get_response. Text deltas are
+        yielded as soon as the model produces them; the complete reply is
+        recorded in the conversation history once the stream finishes.
+        
+        Args:
+            user_message: User's input message
+            max_tokens: Maximum tokens in response
+            temperature: Response randomness (0.0 = deterministic, 1.0 = random)
+            top_p: Nucleus sampling parameter
+            top_k: Top-k sampling parameter
+            repeat_penalty: Penalty for repetition
+            seed: Sampling seed for reproducible output
+            json_schema: JSON schema (dict or JSON string) the response must match
+            grammar: GBNF grammar the response must match, instead of a schema
+            
+        Yields:
+            Text deltas of the AI response
+        """
+        self.add_message("user", user_message)
+        
+        sampling = self._sampling(
+            max_tokens, temperature, top_p, top_k, repeat_penalty, seed
+        )
+        sampling.update(json_schema=json_schema, grammar=grammar)
+        cached = self._cached_response(sampling)
+        if cached is not None:
+            self.add_message("assistant", cached)
+            yield cached
+            return
+        
+        parts: List[str] = []
+        finish_reason = None
+        timer = RequestTimer(self.model)
+        try:
+            stream = self.model.create_completion(
+                stream=True,
+                **self._completion_kwargs(
+                    max_tokens,
+                    temperature,
+                    top_p,
+                    top_k,
+                    repeat_penalty,
+                    seed,
+                    self._grammar(json_schema, grammar),
+                ),
+            )
+            
+            for chunk in stream:
+                finish_reason = (
+                    chunk["choices"][0].get("finish_reason") or finish_reason
+                )
+                delta = chunk['choices'][0].get('text')
+                if not delta:
+                    continue
+                # Leading whitespace is stripped like get_response does
+                if not parts:
+                    delta = delta.lstrip()
+                    if not delta:
+                        continue
+                timer.token()
+                parts.append(delta)
+                yield delta
+                
+        except Exception as e:
+            logger.error(f"Error streaming response: {e}")
+            finish_reason = "error"
+        finally:
+            self._remember_kv()
+            self._record_metrics(timer.finish(
+                prompt_tokens=self.last_prompt_tokens,
+                cached_tokens=self.last_cached_tokens,
+                finish_reason=finish_reason,
+            ))
+            response_text = "".join(parts).strip()
+            if response_text:
+                # Streams abandoned or failed part way are not complete replies
+                if finish_reason not in (None, "error"):
+                    self._store_response(sampling, response_text)
+                self.add_message("assistant", response_text)
+            else:
+                logger.warning("Empty response from model")
+    
+    async def astream_response(
+        self, user_message: str, **kwargs: Any
+    ) -> AsyncIterator[str]:
+        """
+        Async variant of stream_response.
+        
+        Generation runs on the model's ModelWorker thread so the event loop
+        stays responsive and no other call interleaves with it. Stopping
+        the iteration early aborts generation at the next token.
+        
+        Args:
+            user_message: User's input message
+            **kwargs: Sampling arguments accepted by stream_response
+            
+        Yields:
+            Text deltas of the AI response
+        """
+        worker = ModelWorker.for_model(self.model)
+        async for delta in worker.stream(
+            lambda: self.stream_response(user_message, **kwargs)
+        ):
+            yield delta
+    
+    def _completion_kwargs(self,
+                           max_tokens: int,
+                           temperature: float,
+                           top_p: float,
+                           top_k: int,
+                           repeat_penalty: float,
+                           seed: Optional[int] = None,
+                           grammar: Optional[LlamaGrammar] = None) -> Dict[str, Any]:
+        """Build the create_completion arguments for the current conversation."""
+        prompt_tokens, template_stop = self._fit_prompt(max_tokens)
+        self._prepare_kv_cache(prompt_tokens)
+        kwargs = {
+            "prompt": prompt_tokens,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            "top_k": top_k,
+            "repeat_penalty": repeat_penalty,
+            "stop": STOP_SEQUENCES + template_stop,
+        }
+        if seed is not None:
+            kwargs["seed"] = seed
+        if grammar is not None:
+            kwargs["grammar"] = grammar
+        return kwargs
+    
+    def _grammar(
+        self, json_schema: Optional[Schema], grammar: Optional[str]
+    ) -> Optional[LlamaGrammar]:
+        """Compiled grammar constraining the response, if one was requested."""
+        if json_schema is None and grammar is None:
+            return None
+        return self.grammar_cache.get(json_schema, grammar, model=self.model)
+    
+    def _sampling(self,
+                  max_tokens: int,
+                  temperature: float,
+                  top_p: float,
+                  top_k: int,
+                  repeat_penalty: float,
+                  seed: Optional[int]) -> Dict[str, Any]:
+        """Settings that decide the reply to the conversation, as a cache key."""
+        return {
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            "top_k": top_k,
+            "repeat_penalty": repeat_penalty,
+            "seed": seed,
+            # The context size decides which history the model sees
+            "n_ctx": self.model.n_ctx(),
+            "context_policy": type(self.context_policy).__name__,
+        }
+    
+    def _cached_response(self, sampling: Dict[str, Any]) -> Optional[str]:
+        """Reply from the response cache for the current conversation."""
+        self.last_cache_hit = False
+        if self.response_cache is None:
+            return None
+        try:
+            response = self.response_cache.get(
+                self.model, self.conversation_history, sampling
+            )
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {e}")
+            return None
+        if response is not None:
+            self.last_cache_hit = True
+            logger.debug("Response served from cache")
+        return response
+    
+    def _store_response(self, sampling: Dict[str, Any], response: str):
+        """Remember the reply to the current conversation."""
+        if self.response_cache is None:
+            return
+        try:
+            self.response_cache.put(
+                self.model, self.conversation_history, sampling, response
+            )
+        except Exception as e:
+            logger.warning(f"Response cache update failed: {e}")
+    
+    def _fit_prompt(self, max_tokens: int) -> Tuple[List[int], List[str]]:
+        """
+        Tokenize the part of the conversation that fits next to max_tokens.
+        
+        The context policy chooses the window from cached per-message token
+        estimates; the rendered prompt is then checked exactly and the window
+        shrunk further if the estimate was short.
+        
+        Returns:
+            Tuple of (prompt tokens, stop strings)
+            
+        Raises:
+            ValueError: If even the latest message does not fit
+        """
+        budget = self.model.n_ctx() - max_tokens
+        if budget <= 0:
+            raise ValueError(
+                f"max_tokens ({max_tokens}) leaves no room in a "
+                f"{self.model.n_ctx()} token context"
+            )
+        
+        history = self.conversation_history
+        target = budget
+        while True:
+            window = self.context_policy.fit(
+                history, self._window, target, self._count_tokens
+            )
+            prompt_tokens, stop = tokenize_chat_prompt(
+                self.model, self.context_policy.messages(history, window)
+            )
+            if len(prompt_tokens) <= budget:
+                break
+            if window.start >= len(history) - 1:
+                raise ValueError(
+                    f"Prompt of {len(prompt_tokens)} tokens does not fit in "
+                    f"{budget} tokens left after reserving {max_tokens} "
+                    f"for the response"
+                )
+            # The per-message estimates were short by the overshoot
+            target -= len(prompt_tokens) - budget
+        
+        if window.start != self._window.start:
+            logger.info(
+                f"Context window now starts at message {window.start} of {len(history)}"
+            )
+        self._window = window
+        return prompt_tokens, stop
+    
+    def _count_tokens(self, message: Dict[str, str]) -> int:
+        """Estimated prompt tokens for one message, cached by content."""
+        return len(self.tokenizer.message_tokens(message)) + MESSAGE_OVERHEAD
+    
+    def count_tokens(
+        self, messages: Optional[List[Dict[str, str]]] = None, exact: bool = False
+    ) -> int:
+        """
+        Prompt tokens of a conversation with the model's chat template.
+        
+        Only messages not counted before are tokenized, see Tokenizer.count_messages.
+        
+        Args:
+            messages: Messages to count (default: the whole conversation history)
+            exact: Tokenize the rendered prompt instead of summing cached counts
+            
+        Returns:
+            Token count, including the generation prompt
+        """
+        return self.tokenizer.count_messages(
+            messages if messages is not None else self.conversation_history, exact
+        )
+    
+    def _prepare_kv_cache(self, prompt_tokens: List[int]):
+        """
+        Make sure this conversation's tokens are in the KV cache before a turn.
+        
+        Llama only re-evaluates the part of the prompt that differs from the
+        tokens already in its context, so each turn normally costs just the
+        new messages. If another session used the model since our last turn
+        the prefix is gone; it is restored from the snapshot when one is
+        kept, otherwise the history has to be evaluated again.
+        """
+        cached = self._cached_model_tokens()
+        if self._kv_tokens and _common_prefix_length(cached, self._kv_tokens) < len(
+            self._kv_tokens
+        ):
+            if self._kv_snapshot is not None:
+                logger.info("KV cache was used by another session, restoring snapshot")
+                self.model.load_state(self._kv_snapshot)
+                cached = self._cached_model_tokens()
+            else:
+                logger.info(
+                    "KV cache was used by another session, re-evaluating history"
+                )
+        
+        try:
+            # Dropped messages leave the kept ones further down the cache
+            if shift_context(self.model, prompt_tokens) > _common_prefix_length(
+                cached, prompt_tokens
+            ):
+                cached = self._cached_model_tokens()
+        except Exception as e:
+            logger.warning(f"Context shift failed, prompt will be re-evaluated: {e}")
+        
+        if self.prefix_cache is not None:
+            cached = self._restore_system_prefix(prompt_tokens, cached)
+        
+        self.last_prompt_tokens = len(prompt_tokens)
+        self.last_cached_tokens = _common_prefix_length(cached, prompt_tokens)
+        logger.debug(
+            f"Prompt tokens: {self.last_prompt_tokens}, "
+            f"reused from KV cache: {self.last_cached_tokens}"
+        )
+    
+    def _restore_system_prefix(
+        self, prompt_tokens: List[int], cached: List[int]
+    ) -> List[int]:
+        """
+        Load the system prompt state from the shared cache when it saves work.
+        
+        On a miss the system prompt is evaluated on its own and snapshotted so
+        later sessions with the same prompt can start from it.
+        
+        Returns:
+            Tokens held in the model's context afterwards
+        """
+        reused = _common_prefix_length(cached, prompt_tokens)
+        hit = self.prefix_cache.lookup(self.model, prompt_tokens)
+        if hit is not None:
+            n_tokens, state = hit
+            if n_tokens > reused:
+                logger.debug(
+                    f"Restoring {n_tokens} system prompt tokens from prefix cache"
+                )
+                self.model.load_state(state)
+                return self._cached_model_tokens()
+            return cached
+        
+        if self._system_prefix is None:
+            self._system_prefix = chat_prefix_tokens(
+                self.model, self.conversation_history[:1]
+            )
+        prefix = self._system_prefix
+        if not prefix or prompt_tokens[:len(prefix)] != prefix:
+            return cached
+        
+        evaluate_prefix(self.model, prefix)
+        self.prefix_cache.save(self.model, prefix)
+        return self._cached_model_tokens()
+    
+    def _record_metrics(self, metrics: RequestMetrics):
+        """Publish the metrics of a finished turn."""
+        self.last_metrics = metrics
+        self.metrics.observe(
+            metrics, model=os.path.basename(str(self.model.model_path))
+        )
+        if self.on_metrics is not None:
+            try:
+                self.on_metrics(metrics)
+            except Exception as e:
+                logger.warning(f"Metrics callback failed: {e}")
+        logger.debug(
+            f"Turn metrics: {metrics.prompt_tokens} prompt "
+            f"({metrics.cached_tokens} cached), "
+            f"{metrics.completion_tokens} completion tokens, "
+            f"TTFT {metrics.ttft_seconds:.3f}s, {metrics.tokens_per_second:.1f} tok/s"
+        )
+    
+    def _remember_kv(self):
+        """Record the tokens this turn left in the KV cache."""
+        self._kv_tokens = self._cached_model_tokens()
+        if self.snapshot_kv:
+            self._kv_snapshot = self.model.save_state()
+    
+    def _cached_model_tokens(self) -> List[int]:
+        """Tokens currently held in the model's context."""
+        return self.model.input_ids[:self.model.n_tokens].tolist()
+    
+    def save_session(self, path: str, compress: bool = False) -> bool:
+        """
+        Save the conversation and its KV state to a file.
+        
+        Args:
+            path: Destination session file
+            compress: zlib-compress the KV state (smaller file, slower resume)
+            
+        Returns:
+            True if the session was saved
+        """
+        state = None
+        if (
+            self._kv_tokens
+            and self._cached_model_tokens()[: len(self._kv_tokens)] == self._kv_tokens
+        ):
+            state = self.model.save_state()
+        elif self._kv_snapshot is not None:
+            state = self._kv_snapshot
+        else:
+            logger.info("KV cache does not hold this conversation, saving history only")
+        
+        try:
+            session.save_session(path, self.conversation_history, self.system_prompt,
+                                 self.model, state, compress=compress)
+            logger.info(f"Session saved to {path}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to save session: {e}")
+            return False
+    
+    @classmethod
+    def load_session(cls, model: Llama, path: str, **kwargs: Any) -> Optional["AIChat"]:
+        """
+        Resume a conversation saved with save_session.
+        
+        The saved KV state is loaded into the model so the next turn only
+        evaluates the new message. If the state cannot be used (different
+        model or llama.cpp build) the history is restored and evaluated on
+        the next turn instead.
+        
+        Args:
+            model: Loaded Llama model instance
+            path: Session file to read
+            **kwargs: Extra AIChat constructor arguments
+            
+        Returns:
+            Resumed chat or None if the file could not be read
+        """
+        try:
+            data = session.load_session(path, model)
+        except Exception as e:
+            logger.error(f"Failed to load session: {e}")
             return None
+        
+        chat = cls(model, system_prompt=data.system_prompt, **kwargs)
+        chat.conversation_history = data.history
+        if data.state is not None:
+            try:
+                model.load_state(data.state)
+                chat._remember_kv()
+                logger.info(f"Session resumed with {data.state.n_tokens} cached tokens")
+            except Exception as e:
+                logger.warning(
+                    f"Could not restore KV state, history will be re-evaluated: {e}"
+                )
+        return chat
     
     def reset_conversation(self):
         """Reset the conversation history."""
         self.conversation_history = [
             {"role": "system", "content": self.system_prompt}
         ]
+        self._window = ContextWindow()
+        self._kv_tokens = []
+        self._kv_snapshot = None
         logger.info("Conversation history reset")
     
     def get_conversation_history(self) -> List[Dict[str, str]]:
@@ -98,4 +656,109 @@ class AIChat:
             self.conversation_history[0]["content"] = new_prompt
         else:
             self.conversation_history.insert(0, {"role": "system", "content": new_prompt})
+        self._system_prefix = None
         logger.info("System prompt updated")
+
+
+def _common_prefix_length(a: Sequence[int], b: Sequence[int]) -> int:
+    """Length of the common prefix of two token sequences."""
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class AsyncAIChat:
+    """
+    asyncio interface to AIChat.
+    
+    Every llama.cpp call runs on the model's dedicated ModelWorker thread,
+    one request at a time, so the event loop is never blocked. Cancelling
+    a request (task cancellation, or leaving a stream early when the client
+    disconnects) stops generation at the next token.
+    """
+    
+    def __init__(self, model: Llama, **kwargs: Any):
+        """
+        Initialize the chat interface.
+        
+        Args:
+            model: Loaded Llama model instance
+            **kwargs: AIChat constructor arguments
+        """
+        self.chat = AIChat(model, **kwargs)
+        self.worker = ModelWorker.for_model(model)
+    
+    @classmethod
+    async def load_session(
+        cls, model: Llama, path: str, **kwargs: Any
+    ) -> Optional["AsyncAIChat"]:
+        """Resume a conversation saved with save_session, see AIChat.load_session."""
+        worker = ModelWorker.for_model(model)
+        chat = await worker.run(AIChat.load_session, model, path, **kwargs)
+        if chat is None:
+            return None
+        instance = cls.__new__(cls)
+        instance.chat = chat
+        instance.worker = worker
+        return instance
+    
+    @property
+    def model(self) -> Llama:
+        return self.chat.model
+    
+    @property
+    def last_metrics(self) -> Optional[RequestMetrics]:
+        return self.chat.last_metrics
+    
+    async def stream_response(
+        self, user_message: str, **kwargs: Any
+    ) -> AsyncIterator[str]:
+        """
+        Stream a response as it is generated.
+        
+        Args:
+            user_message: User's input message
+            **kwargs: Sampling arguments accepted by AIChat.stream_response
+            
+        Yields:
+            Text deltas of the AI response
+        """
+        async for delta in self.worker.stream(
+            lambda: self.chat.stream_response(user_message, **kwargs)
+        ):
+            yield delta
+    
+    async def get_response(self, user_message: str, **kwargs: Any) -> Optional[str]:
+        """
+        Get a complete response.
+        
+        Args:
+            user_message: User's input message
+            **kwargs: Sampling arguments accepted by AIChat.get_response
+            
+        Returns:
+            AI response text or None if error
+        """
+        parts = [delta async for delta in self.stream_response(user_message, **kwargs)]
+        return "".join(parts).strip() or None
+    
+    async def save_session(self, path: str, compress: bool = False) -> bool:
+        """Save the conversation and its KV state, see AIChat.save_session."""
+        return await self.worker.run(self.chat.save_session, path, compress)
+    
+    async def reset_conversation(self):
+        """Reset the conversation history once queued requests are done."""
+        await self.worker.run(self.chat.reset_conversation)
+    
+    def get_conversation_history(self) -> List[Dict[str, str]]:
+        """Get the current conversation history."""
+        return self.chat.get_conversation_history()
+    
+    def count_tokens(
+        self, messages: Optional[List[Dict[str, str]]] = None, exact: bool = False
+    ) -> int:
+        """Prompt tokens of a conversation, see AIChat.count_tokens."""
+        return self.chat.count_tokens(messages, exact)
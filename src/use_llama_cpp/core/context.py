@@ -0,0 +1,271 @@
+"""
+Context window management for AI Room application.
+
+Context policies decide which part of a growing conversation is sent to
+the model so that the prompt plus the requested completion always fits in
+the context window. When older messages are dropped, shift_context moves
+the KV entries of the messages that are kept instead of evaluating them
+again.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import llama_cpp
+from llama_cpp import Llama
+
+logger = logging.getLogger(__name__)
+
+Message = Dict[str, str]
+TokenCounter = Callable[[Message], int]
+Summarizer = Callable[[List[Message], Optional[str]], str]
+
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+
+@dataclass
+class ContextWindow:
+    """The part of the history currently sent to the model."""
+
+    # Index of the first message after the system message that is kept
+    start: int = 1
+    # Summary of the messages before start, if any
+    summary: Optional[str] = None
+
+
+class ContextPolicy:
+    """
+    Base policy: keep the whole history.
+
+    Subclasses drop messages from the front of the window. When they drop,
+    they drop down to low_water of the budget rather than just below it, so
+    the window (and the KV cache that matches it) stays put for several
+    turns instead of moving on every turn.
+    """
+
+    def __init__(self, low_water: float = 0.75):
+        """
+        Initialize the policy.
+
+        Args:
+            low_water: Fraction of the token budget to shrink to when dropping
+        """
+        self.low_water = low_water
+
+    def messages(self, history: List[Message], window: ContextWindow) -> List[Message]:
+        """Build the message list sent to the model for a window."""
+        if not history or history[0]["role"] != "system":
+            return history[window.start - 1:] if window.start > 1 else list(history)
+        system = history[0]
+        if window.summary:
+            system = {
+                "role": "system",
+                "content": f"{system['content']}\n\n{SUMMARY_HEADER}\n{window.summary}",
+            }
+        return [system] + history[window.start:]
+
+    def fit(self,
+            history: List[Message],
+            window: ContextWindow,
+            budget: int,
+            count: TokenCounter) -> ContextWindow:
+        """
+        Return the window to use so the prompt fits in `budget` tokens.
+
+        Args:
+            history: Full conversation history, system message first
+            window: Window used for the previous turn
+            budget: Tokens available for the prompt
+            count: Token count of a single message
+
+        Returns:
+            Window for this turn
+        """
+        return window
+
+    def _drop_until(self,
+                    history: List[Message],
+                    window: ContextWindow,
+                    target: int,
+                    count: TokenCounter) -> ContextWindow:
+        """Advance the window start until its messages fit in `target` tokens."""
+        start = max(window.start, 1)
+        total = sum(
+            count(m)
+            for m in self.messages(history, ContextWindow(start, window.summary))
+        )
+        last = len(history) - 1
+        while total > target and start < last:
+            total -= count(history[start])
+            start += 1
+            # Start on a user turn, many chat templates require alternating roles
+            while start < last and history[start]["role"] != "user":
+                total -= count(history[start])
+                start += 1
+        return ContextWindow(start, window.summary)
+
+    def _total(
+        self, history: List[Message], window: ContextWindow, count: TokenCounter
+    ) -> int:
+        return sum(count(m) for m in self.messages(history, window))
+
+
+class SlidingWindowPolicy(ContextPolicy):
+    """Drop the oldest turns once the conversation outgrows the budget."""
+
+    def fit(self, history, window, budget, count):
+        if self._total(history, window, count) <= budget:
+            return window
+        return self._drop_until(history, window, int(budget * self.low_water), count)
+
+
+class KeepLastNPolicy(ContextPolicy):
+    """Keep the system message and at most the last N messages."""
+
+    def __init__(self, n: int = 10, low_water: float = 0.75):
+        """
+        Initialize the policy.
+
+        Args:
+            n: Maximum number of non-system messages to keep
+            low_water: Fraction of the token budget to shrink to when dropping
+        """
+        super().__init__(low_water)
+        self.n = n
+
+    def fit(self, history, window, budget, count):
+        start = max(window.start, len(history) - self.n, 1)
+        while start < len(history) - 1 and history[start]["role"] != "user":
+            start += 1
+        window = ContextWindow(start, window.summary)
+        if self._total(history, window, count) <= budget:
+            return window
+        return self._drop_until(history, window, int(budget * self.low_water), count)
+
+
+class SummarizePolicy(ContextPolicy):
+    """Replace dropped turns with a running summary kept in the system message."""
+
+    def __init__(self, summarize: Summarizer, low_water: float = 0.6):
+        """
+        Initialize the policy.
+
+        Args:
+            summarize: Callable taking the dropped messages and the previous
+                summary (or None) and returning the new summary
+            low_water: Fraction of the token budget to shrink to when dropping
+        """
+        super().__init__(low_water)
+        self.summarize = summarize
+
+    def fit(self, history, window, budget, count):
+        if self._total(history, window, count) <= budget:
+            return window
+
+        target = int(budget * self.low_water)
+        new = self._drop_until(history, window, target, count)
+        if new.start == window.start:
+            return new
+
+        dropped = history[window.start:new.start]
+        try:
+            new.summary = self.summarize(dropped, window.summary)
+            logger.info(f"Summarized {len(dropped)} earlier messages")
+        except Exception as e:
+            logger.error(f"Failed to summarize history, dropping it instead: {e}")
+            new.summary = window.summary
+
+        # The summary itself takes room, drop more if it pushed us over
+        if self._total(history, new, count) > budget:
+            new = self._drop_until(history, new, target, count)
+        return new
+
+
+def model_summarizer(model: Llama, max_tokens: int = 160) -> Summarizer:
+    """
+    Build a summarizer for SummarizePolicy that asks the model itself.
+
+    Summarizing evaluates its own prompt, so the chat's next turn starts
+    from the system prompt instead of the cached conversation.
+
+    Args:
+        model: Loaded Llama model instance
+        max_tokens: Maximum length of the summary
+
+    Returns:
+        Summarizer callable
+    """
+    def summarize(messages: List[Message], previous: Optional[str]) -> str:
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        if previous:
+            transcript = f"Earlier summary: {previous}\n{transcript}"
+        response = model.create_chat_completion(
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Summarize the conversation in a few sentences. "
+                    "Keep names, facts and decisions.",
+                },
+                {"role": "user", "content": transcript},
+            ],
+            max_tokens=max_tokens,
+            temperature=0.0,
+        )
+        return response["choices"][0]["message"]["content"].strip()
+
+    return summarize
+
+
+def shift_context(model: Llama, prompt_tokens: List[int], min_match: int = 16) -> int:
+    """
+    Reuse KV entries of tokens that moved because earlier messages were dropped.
+
+    The cache holds [prefix][dropped][kept...] and the new prompt is
+    [prefix][kept...]. The dropped range is removed from the KV cache and the
+    kept tokens are shifted back into place, the same context shift llama.cpp
+    performs itself when a context fills up. Afterwards Llama's own prefix
+    matching finds prefix + kept and only evaluates the rest.
+
+    Args:
+        model: Loaded Llama model instance
+        prompt_tokens: Prompt about to be evaluated
+        min_match: Minimum kept tokens that must line up to bother shifting
+
+    Returns:
+        Number of prompt tokens now matching the KV cache
+    """
+    n_cached = model.n_tokens
+    cached = model.input_ids[:n_cached]
+    prompt = np.asarray(prompt_tokens, dtype=cached.dtype)
+    limit = min(n_cached, len(prompt))
+    mismatch = np.nonzero(cached[:limit] != prompt[:limit])[0]
+    prefix = int(mismatch[0]) if mismatch.size else limit
+    if prefix == len(prompt) or prefix == n_cached:
+        return prefix
+
+    rest = prompt[prefix:]
+    needed = min(min_match, len(rest))
+    best_offset, best_match = 0, 0
+    for offset in np.nonzero(cached[prefix + 1:] == rest[0])[0] + 1:
+        tail = cached[prefix + offset:]
+        n = min(len(tail), len(rest))
+        diff = np.nonzero(tail[:n] != rest[:n])[0]
+        match = int(diff[0]) if diff.size else n
+        if match > best_match:
+            best_offset, best_match = int(offset), match
+    if best_match < needed:
+        return prefix
+
+    if not llama_cpp.llama_memory_can_shift(model._ctx.memory):
+        logger.debug("Model does not support context shifting")
+        return prefix
+
+    start, end = prefix, prefix + best_offset
+    model._ctx.kv_cache_seq_rm(0, start, end)
+    model._ctx.kv_cache_seq_shift(0, end, n_cached, -best_offset)
+    model.input_ids[start:n_cached - best_offset] = model.input_ids[end:n_cached].copy()
+    model.n_tokens = n_cached - best_offset
+    logger.debug(f"Shifted context: dropped {best_offset} tokens, kept {best_match}")
+    return prefix + best_match
@@ -0,0 +1,181 @@
+"""
+Text embeddings for AI Room application.
+
+Embedder packs many texts into each llama.cpp batch, one sequence per
+text, and copies the vectors straight from llama.cpp's output buffer into
+a single float32 NumPy array. Texts are grouped by token length so that
+batches fill up evenly.
+"""
+
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import llama_cpp
+import numpy as np
+from llama_cpp import Llama
+
+logger = logging.getLogger(__name__)
+
+POOLING_TYPES: Dict[str, int] = {
+    "none": llama_cpp.LLAMA_POOLING_TYPE_NONE,
+    "mean": llama_cpp.LLAMA_POOLING_TYPE_MEAN,
+    "cls": llama_cpp.LLAMA_POOLING_TYPE_CLS,
+    "last": llama_cpp.LLAMA_POOLING_TYPE_LAST,
+}
+POOLING_NAMES = {value: name for name, value in POOLING_TYPES.items()}
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length in place; zero rows stay zero."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+class Embedder:
+    """Batched text embeddings from a Llama model created with embedding=True."""
+
+    def __init__(self, model: Llama, truncate: bool = True):
+        """
+        Initialize the embedder.
+
+        Args:
+            model: Loaded Llama model instance in embedding mode
+            truncate: Cut texts longer than a batch instead of raising
+
+        Raises:
+            ValueError: If the model was not created with embedding=True
+        """
+        if not model.context_params.embeddings:
+            raise ValueError("Model was not loaded in embedding mode (embedding=True)")
+        self.model = model
+        self.truncate = truncate
+        self.n_embd = model.n_embd()
+        # Non-causal models need a whole sequence in one micro-batch
+        self.max_tokens = min(
+            model.n_batch, model.context_params.n_ubatch, model.n_ctx()
+        )
+        self.max_sequences = max(1, model.context_params.n_seq_max)
+        self.model_pooling = POOLING_NAMES.get(model.pooling_type(), "none")
+        self.last_token_count = 0
+
+    def embed(self,
+              texts: Sequence[str],
+              pooling: Optional[str] = None,
+              normalize: bool = True) -> np.ndarray:
+        """
+        Embed texts.
+
+        Args:
+            texts: Texts to embed
+            pooling: "mean", "cls" or "last" to combine token vectors here when
+                the model returns per-token vectors; None uses the model's own
+                pooling, or mean if it has none. A model that pools itself
+                only supports its own method
+            normalize: Scale every vector to unit L2 norm
+
+        Returns:
+            Contiguous float32 array of shape (len(texts), n_embd)
+
+        Raises:
+            ValueError: For an unknown or unsupported pooling method, or a text
+                longer than a batch when truncate is off
+        """
+        pooling = self.resolve_pooling(pooling)
+        output = np.zeros((len(texts), self.n_embd), dtype=np.float32)
+        tokenized = [self._tokenize(text) for text in texts]
+        self.last_token_count = sum(len(tokens) for tokens in tokenized)
+
+        # Similar lengths together, so batches are filled evenly
+        order = sorted(range(len(texts)), key=lambda i: len(tokenized[i]))
+        batch: List[Tuple[int, List[int]]] = []
+        n_tokens = 0
+        for index in order:
+            tokens = tokenized[index]
+            if not tokens:
+                continue
+            if batch and (
+                n_tokens + len(tokens) > self.max_tokens
+                or len(batch) >= self.max_sequences
+            ):
+                self._decode(batch, output, pooling)
+                batch, n_tokens = [], 0
+            batch.append((index, tokens))
+            n_tokens += len(tokens)
+        if batch:
+            self._decode(batch, output, pooling)
+
+        self.model._ctx.kv_cache_clear()
+        self.model.reset()
+        return l2_normalize(output) if normalize else output
+
+    def resolve_pooling(self, pooling: Optional[str]) -> str:
+        """
+        Pooling method embed() applies for a requested one.
+
+        Raises:
+            ValueError: For an unknown method, or one other than the model's
+                own when the model pools itself
+        """
+        if pooling is not None and pooling not in POOLING_TYPES or pooling == "none":
+            raise ValueError(f"Unknown pooling {pooling!r}, expected mean, cls or last")
+        if self.model_pooling == "none":
+            return pooling or "mean"
+        if pooling not in (None, self.model_pooling):
+            raise ValueError(
+                f"Model pools with {self.model_pooling}; load it with pooling='none' "
+                f"to choose the pooling per request"
+            )
+        return self.model_pooling
+
+    def _tokenize(self, text: str) -> List[int]:
+        tokens = self.model.tokenize(text.encode("utf-8"))
+        if len(tokens) > self.max_tokens:
+            if not self.truncate:
+                raise ValueError(
+                    f"Text of {len(tokens)} tokens exceeds the batch size "
+                    f"of {self.max_tokens}"
+                )
+            logger.debug(
+                f"Truncating text of {len(tokens)} tokens to {self.max_tokens}"
+            )
+            tokens = tokens[:self.max_tokens]
+        return tokens
+
+    def _decode(
+        self,
+        batch: List[Tuple[int, List[int]]],
+        output: np.ndarray,
+        pooling: Optional[str],
+    ):
+        """Evaluate one batch of sequences and write their vectors into output."""
+        model = self.model
+        model._batch.reset()
+        for seq_id, (_, tokens) in enumerate(batch):
+            model._batch.add_sequence(tokens, seq_id, True)
+        model._ctx.kv_cache_clear()
+        model._ctx.decode(model._batch)
+
+        ctx = model._ctx.ctx
+        if self.model_pooling != "none":
+            for seq_id, (index, _) in enumerate(batch):
+                output[index] = np.ctypeslib.as_array(
+                    llama_cpp.llama_get_embeddings_seq(ctx, seq_id),
+                    shape=(self.n_embd,),
+                )
+            return
+
+        total = sum(len(tokens) for _, tokens in batch)
+        vectors = np.ctypeslib.as_array(
+            llama_cpp.llama_get_embeddings(ctx), shape=(total, self.n_embd)
+        )
+        start = 0
+        for index, tokens in batch:
+            rows = vectors[start:start + len(tokens)]
+            if pooling == "cls":
+                output[index] = rows[0]
+            elif pooling == "last":
+                output[index] = rows[-1]
+            else:
+                rows.mean(axis=0, out=output[index])
+            start += len(tokens)
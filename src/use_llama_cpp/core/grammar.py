@@ -0,0 +1,160 @@
+"""
+Constrained generation for AI Room application.
+
+A JSON schema or GBNF grammar restricts sampling to tokens that keep the
+output valid, so structured replies parse on the first attempt instead of
+being retried. Converting a schema to GBNF and checking that llama.cpp
+accepts the grammar happens once per distinct schema: GrammarCache keeps
+the resulting LlamaGrammar objects keyed by a hash of the schema.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+
+import llama_cpp
+from llama_cpp import Llama, LlamaGrammar
+from llama_cpp.llama_grammar import (
+    JSON_GBNF,
+    LLAMA_GRAMMAR_DEFAULT_ROOT,
+    json_schema_to_gbnf,
+)
+
+logger = logging.getLogger(__name__)
+
+# Any JSON value, for requests that want JSON without a schema
+ANY_JSON = JSON_GBNF
+
+Schema = Union[Dict[str, Any], str]
+
+
+def grammar_key(
+    json_schema: Optional[Schema] = None, gbnf: Optional[str] = None
+) -> str:
+    """
+    Hash identifying a schema or grammar.
+
+    Schemas are serialized with sorted keys, so dicts that differ only in
+    key order share an entry.
+    """
+    if json_schema is not None:
+        if isinstance(json_schema, str):
+            json_schema = json.loads(json_schema)
+        text = "schema:" + json.dumps(
+            json_schema, sort_keys=True, separators=(",", ":")
+        )
+    else:
+        text = "gbnf:" + (gbnf or "")
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def validate_grammar(model: Llama, gbnf: str, root: str = LLAMA_GRAMMAR_DEFAULT_ROOT):
+    """
+    Check that llama.cpp can parse a grammar.
+
+    llama-cpp-python passes grammars to llama.cpp unchecked and a grammar
+    that fails to parse leaves a null sampler in the sampling chain.
+
+    Raises:
+        ValueError: If the grammar does not parse
+    """
+    sampler = llama_cpp.llama_sampler_init_grammar(
+        model._model.vocab, gbnf.encode("utf-8"), root.encode("utf-8")
+    )
+    if not sampler:
+        raise ValueError("Grammar failed to parse")
+    llama_cpp.llama_sampler_free(sampler)
+
+
+class GrammarCache:
+    """LRU cache of grammars compiled from JSON schemas and GBNF."""
+
+    def __init__(self, capacity: int = 128):
+        """
+        Initialize the cache.
+
+        Args:
+            capacity: Grammars kept, least recently used are dropped
+        """
+        self.capacity = capacity
+        self._grammars: "OrderedDict[str, LlamaGrammar]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self,
+            json_schema: Optional[Schema] = None,
+            gbnf: Optional[str] = None,
+            model: Optional[Llama] = None) -> LlamaGrammar:
+        """
+        Grammar for a JSON schema or GBNF text, compiled on first use.
+
+        Args:
+            json_schema: JSON schema as a dict or JSON string
+            gbnf: GBNF grammar text, used when no schema is given
+            model: Model whose llama.cpp build validates new grammars
+                (skipped when None)
+
+        Returns:
+            Grammar to pass to create_completion
+
+        Raises:
+            ValueError: If neither or both are given, or the schema or grammar
+                is invalid
+        """
+        if (json_schema is None) == (gbnf is None):
+            raise ValueError("Pass exactly one of json_schema and gbnf")
+        try:
+            key = grammar_key(json_schema, gbnf)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid JSON schema: {e}") from e
+
+        with self._lock:
+            grammar = self._grammars.get(key)
+            if grammar is not None:
+                self._grammars.move_to_end(key)
+                self.hits += 1
+                return grammar
+            self.misses += 1
+
+        if json_schema is not None:
+            schema_text = (
+                json_schema if isinstance(json_schema, str) else json.dumps(json_schema)
+            )
+            try:
+                gbnf = json_schema_to_gbnf(schema_text)
+            except Exception as e:
+                raise ValueError(f"Unsupported JSON schema: {e}") from e
+        if isinstance(model, Llama):
+            validate_grammar(model, gbnf)
+        grammar = LlamaGrammar.from_string(gbnf, verbose=False)
+        logger.debug(f"Compiled grammar {key[:12]} ({len(gbnf)} characters)")
+
+        with self._lock:
+            self._grammars[key] = grammar
+            while len(self._grammars) > self.capacity:
+                self._grammars.popitem(last=False)
+        return grammar
+
+    def clear(self):
+        """Drop all compiled grammars."""
+        with self._lock:
+            self._grammars.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache usage statistics."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._grammars),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Shared by chat sessions and the server unless they are given their own
+default_grammar_cache = GrammarCache()
@@ -0,0 +1,196 @@
+"""
+Shared KV-cache snapshots for AI Room application.
+
+Most conversations start with one of a handful of system prompts. Rather
+than evaluating the same prompt for every new session, the llama.cpp state
+right after the prompt is saved once and loaded by later sessions.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_cpp import Llama, LlamaState
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    model_id: str
+    tokens: Tuple[int, ...]
+    state: LlamaState
+    nbytes: int
+
+
+def model_identity(model: Llama) -> str:
+    """Identify a model and context layout whose states are interchangeable."""
+    return f"{model.model_path}:{model.n_ctx()}:{model.n_batch}"
+
+
+def prefix_key(model: Llama, tokens: Sequence[int]) -> str:
+    """Hash a model identity and prompt tokens into a cache key."""
+    digest = hashlib.sha256(model_identity(model).encode("utf-8"))
+    digest.update(np.asarray(tokens, dtype=np.int32).tobytes())
+    return digest.hexdigest()
+
+
+def state_nbytes(state: LlamaState) -> int:
+    """Approximate memory held by a saved state."""
+    return int(state.llama_state_size) + state.input_ids.nbytes + state.scores.nbytes
+
+
+class PrefixStateCache:
+    """LRU cache of llama.cpp state snapshots for evaluated prompt prefixes."""
+
+    def __init__(self, capacity_bytes: int = 256 * 1024 * 1024):
+        """
+        Initialize the cache.
+
+        Args:
+            capacity_bytes: Memory budget for all snapshots together
+        """
+        self.capacity_bytes = capacity_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def size_bytes(self) -> int:
+        """Memory currently held by snapshots."""
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, item: Tuple[Llama, Sequence[int]]) -> bool:
+        model, tokens = item
+        return prefix_key(model, tokens) in self._entries
+
+    def save(self, model: Llama, tokens: Sequence[int]) -> bool:
+        """
+        Snapshot the model's current state as the state after `tokens`.
+
+        The caller must have just evaluated exactly these tokens. Cached logits
+        are only kept when the model computes them for every token, since they
+        are otherwise unused after a restore.
+
+        Args:
+            model: Model whose context holds the evaluated prefix
+            tokens: Prefix tokens the state corresponds to
+
+        Returns:
+            True if the snapshot was stored
+        """
+        state = model.save_state()
+        if not model._logits_all:
+            # load_state broadcasts this single row over the restored tokens
+            state.scores = np.zeros((1, state.scores.shape[1]), dtype=np.single)
+        nbytes = state_nbytes(state)
+        if nbytes > self.capacity_bytes:
+            logger.warning(f"Prefix state of {nbytes} bytes exceeds cache capacity")
+            return False
+
+        key = prefix_key(model, tokens)
+        with self._lock:
+            self._entries[key] = _Entry(
+                model_identity(model), tuple(tokens), state, nbytes
+            )
+            self._entries.move_to_end(key)
+            self._evict()
+        logger.debug(f"Cached prefix state for {len(tokens)} tokens ({nbytes} bytes)")
+        return True
+
+    def lookup(
+        self, model: Llama, tokens: Sequence[int]
+    ) -> Optional[Tuple[int, LlamaState]]:
+        """
+        Find the longest cached prefix of `tokens` for this model.
+
+        Args:
+            model: Model the state will be loaded into
+            tokens: Prompt tokens about to be evaluated
+
+        Returns:
+            Tuple of (prefix length, state) or None on a miss
+        """
+        model_id = model_identity(model)
+        tokens = tuple(tokens)
+        with self._lock:
+            best_key = None
+            best_len = 0
+            for key, entry in self._entries.items():
+                n = len(entry.tokens)
+                if (
+                    entry.model_id == model_id
+                    and best_len < n <= len(tokens)
+                    and tokens[:n] == entry.tokens
+                ):
+                    best_key, best_len = key, n
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return best_len, self._entries[best_key].state
+
+    def restore(self, model: Llama, tokens: Sequence[int]) -> int:
+        """
+        Load the longest cached prefix of `tokens` into the model.
+
+        Returns:
+            Number of prompt tokens restored (0 on a miss)
+        """
+        hit = self.lookup(model, tokens)
+        if hit is None:
+            return 0
+        n_tokens, state = hit
+        model.load_state(state)
+        return n_tokens
+
+    def clear(self):
+        """Drop all snapshots."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache usage statistics."""
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "capacity_bytes": self.capacity_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _evict(self):
+        """Drop least recently used snapshots until within budget."""
+        total = self.size_bytes
+        while total > self.capacity_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            total -= entry.nbytes
+            logger.debug(f"Evicted prefix state for {len(entry.tokens)} tokens")
+
+
+def evaluate_prefix(model: Llama, tokens: List[int]):
+    """
+    Bring the model's context to exactly `tokens`, reusing any matching prefix.
+
+    Args:
+        model: Loaded Llama model instance
+        tokens: Tokens the context should hold afterwards
+    """
+    cached = model.input_ids[:model.n_tokens]
+    n = 0
+    for a, b in zip(cached, tokens):
+        if a != b:
+            break
+        n += 1
+    # Llama.eval drops everything past n_tokens before evaluating
+    model.n_tokens = n
+    model.eval(tokens[n:])
@@ -0,0 +1,248 @@
+"""
+KV cache sizing for AI Room application.
+
+At long contexts the KV cache, not the weights, decides whether a model
+fits in memory. estimate_kv_memory() computes its size from GGUF metadata
+for a context length, number of parallel sequences and cache data type,
+together with the attention scratch buffer that flash attention avoids.
+plan_kv_cache() checks the total against a memory budget and, for
+settings left on auto, turns on flash attention and quantizes the cache
+until it fits, or refuses the configuration.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from ..utils.gguf import GGML_TYPES, GGUFFile
+
+logger = logging.getLogger(__name__)
+
+# KV cache types llama.cpp supports -> ggml type id
+KV_CACHE_TYPES = {
+    "f32": 0,
+    "f16": 1,
+    "bf16": 30,
+    "q8_0": 8,
+    "q5_1": 7,
+    "q5_0": 6,
+    "q4_1": 3,
+    "q4_0": 2,
+    "iq4_nl": 20,
+}
+
+# Cache types tried, in order, when the cache must shrink to fit
+DOWNGRADE_TYPES = ["q8_0", "q4_0"]
+
+# llama-cpp-python's default physical batch size
+DEFAULT_N_UBATCH = 512
+
+
+@dataclass
+class KVEstimate:
+    """Memory of a context's KV cache and attention buffers."""
+
+    kv_bytes: int
+    # Attention score matrix for one micro-batch, not needed with flash attention
+    attention_bytes: int
+    n_cells: int
+
+    @property
+    def total_bytes(self) -> int:
+        return self.kv_bytes + self.attention_bytes
+
+
+@dataclass
+class KVPlan:
+    """KV cache settings chosen for a context."""
+
+    type_k: str
+    type_v: str
+    flash_attn: bool
+    estimate: KVEstimate
+    notes: List[str] = field(default_factory=list)
+
+    def llama_params(self) -> Dict[str, Any]:
+        """Arguments for Llama()."""
+        return {
+            "type_k": KV_CACHE_TYPES[self.type_k],
+            "type_v": KV_CACHE_TYPES[self.type_v],
+            "flash_attn": self.flash_attn,
+        }
+
+
+def _row_bytes(cache_type: str, heads: int, head_size: int) -> int:
+    """Bytes of one layer's cache row of a ggml type."""
+    _, block_size, type_size = GGML_TYPES[KV_CACHE_TYPES[cache_type]]
+    return heads * head_size // block_size * type_size
+
+
+def _per_layer(value: Any, n_layer: int, default: int) -> List[int]:
+    """A per-layer metadata value, which GGUF stores as a number or an array."""
+    if isinstance(value, (list, tuple)) and len(value) == n_layer:
+        return [int(v) for v in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return [int(value)] * n_layer
+    # Arrays skipped while parsing: assume every layer has the full head count
+    return [default] * n_layer
+
+
+def estimate_kv_memory(gguf: GGUFFile,
+                       n_ctx: int,
+                       n_seq: int = 1,
+                       type_k: str = "f16",
+                       type_v: str = "f16",
+                       flash_attn: bool = False,
+                       n_ubatch: int = DEFAULT_N_UBATCH) -> KVEstimate:
+    """
+    Estimate the KV cache of a model from its GGUF metadata.
+
+    Every layer stores, per cell, n_head_kv x key_length K values and
+    n_head_kv x value_length V values in the cache type. Without flash
+    attention llama.cpp also materializes the f32 attention scores of a
+    micro-batch, n_head x cells x n_ubatch. Sliding-window and MLA models
+    cache less than this, so the estimate errs on the safe side for them.
+    Models without attention metadata are estimated at zero.
+
+    Args:
+        gguf: Parsed GGUF header
+        n_ctx: Context length per sequence
+        n_seq: Sequences decoded in parallel, each with its own n_ctx
+        type_k: Cache type of keys (see KV_CACHE_TYPES)
+        type_v: Cache type of values
+        flash_attn: Whether flash attention is enabled
+        n_ubatch: Physical batch size
+
+    Returns:
+        Estimated memory
+
+    Raises:
+        ValueError: For an unknown cache type, or a quantized type whose
+            block size does not divide the head size
+    """
+    for cache_type in (type_k, type_v):
+        if cache_type not in KV_CACHE_TYPES:
+            raise ValueError(
+                f"Unknown KV cache type {cache_type!r}, "
+                f"expected one of {', '.join(KV_CACHE_TYPES)}"
+            )
+
+    n_layer = int(gguf.block_count or 0)
+    n_embd = int(gguf.value("embedding_length", 0) or 0)
+    head_count = gguf.value("attention.head_count", 0)
+    n_head = max(_per_layer(head_count, n_layer, 0), default=0)
+    n_cells = n_ctx * n_seq
+    if not n_head:
+        # Recurrent models keep a fixed-size state instead of a KV cache
+        return KVEstimate(kv_bytes=0, attention_bytes=0, n_cells=n_cells)
+    n_head_kv = _per_layer(
+        gguf.value("attention.head_count_kv", head_count), n_layer, n_head
+    )
+    head_dim = n_embd // n_head
+    key_length = int(gguf.value("attention.key_length", head_dim))
+    value_length = int(gguf.value("attention.value_length", head_dim))
+    for cache_type, head_size in ((type_k, key_length), (type_v, value_length)):
+        block_size = GGML_TYPES[KV_CACHE_TYPES[cache_type]][1]
+        if head_size % block_size:
+            # llama.cpp refuses to create such a context
+            raise ValueError(
+                f"KV cache type {cache_type} has blocks of {block_size}, "
+                f"which do not divide the head size of {head_size}"
+            )
+
+    per_cell = sum(
+        _row_bytes(type_k, heads, key_length) + _row_bytes(type_v, heads, value_length)
+        for heads in n_head_kv
+    )
+    attention = 0 if flash_attn else n_head * n_cells * min(n_ubatch, n_cells) * 4
+    return KVEstimate(
+        kv_bytes=n_cells * per_cell, attention_bytes=attention, n_cells=n_cells
+    )
+
+
+def _quantized(cache_type: str) -> bool:
+    return cache_type not in ("f32", "f16", "bf16")
+
+
+def plan_kv_cache(gguf: GGUFFile,
+                  n_ctx: int,
+                  n_seq: int = 1,
+                  type_k: Optional[str] = None,
+                  type_v: Optional[str] = None,
+                  flash_attn: Optional[bool] = None,
+                  n_ubatch: int = DEFAULT_N_UBATCH,
+                  budget: Optional[int] = None,
+                  other_bytes: int = 0) -> KVPlan:
+    """
+    Choose KV cache types and flash attention for a memory budget.
+
+    Settings passed explicitly are kept. Those left as None start at f16
+    without flash attention and, while the total exceeds the budget, flash
+    attention is turned on, then the cache goes to q8_0 and then q4_0.
+    llama.cpp only quantizes the V cache with flash attention, so a
+    quantized type_v turns it on when flash_attn is None.
+
+    Args:
+        gguf: Parsed GGUF header
+        n_ctx: Context length per sequence
+        n_seq: Sequences decoded in parallel
+        type_k: Cache type of keys, None for auto
+        type_v: Cache type of values, None for auto
+        flash_attn: Flash attention, None for auto
+        n_ubatch: Physical batch size
+        budget: Bytes available for the cache and other_bytes, None for no limit
+        other_bytes: Memory needed besides the cache, e.g. the weights
+
+    Returns:
+        The plan; notes describe any downgrade
+
+    Raises:
+        ValueError: If a quantized V cache is requested with flash attention
+            off, an explicit cache type does not suit the model, or no
+            allowed configuration fits the budget
+    """
+    if type_v is not None and _quantized(type_v) and flash_attn is False:
+        raise ValueError(f"A {type_v} V cache needs flash attention")
+
+    k, v = type_k or "f16", type_v or "f16"
+    fa = flash_attn if flash_attn is not None else _quantized(v)
+    candidates = [(k, v, fa)]
+    if flash_attn is None and not fa:
+        candidates.append((k, v, True))
+        fa = True
+    if type_k is None or type_v is None:
+        for cache_type in DOWNGRADE_TYPES:
+            # Without flash attention only K can be quantized
+            candidates.append(
+                (type_k or cache_type, type_v or (cache_type if fa else "f16"), fa)
+            )
+
+    gb = 1024 ** 3
+    first = estimate_kv_memory(gguf, n_ctx, n_seq, *candidates[0], n_ubatch=n_ubatch)
+    smallest = first.total_bytes
+    for k, v, fa in candidates:
+        try:
+            estimate = estimate_kv_memory(gguf, n_ctx, n_seq, k, v, fa, n_ubatch)
+        except ValueError as e:
+            # Quantized types the model's head size does not allow
+            logger.debug(f"Skipping KV cache K {k}, V {v}: {e}")
+            continue
+        if budget is None or other_bytes + estimate.total_bytes <= budget:
+            plan = KVPlan(k, v, fa, estimate)
+            if (k, v, fa) != candidates[0]:
+                plan.notes.append(
+                    f"KV cache set to K {k}, V {v}, "
+                    f"flash attention {'on' if fa else 'off'} "
+                    f"to fit the {budget / gb:.2f} GB budget: "
+                    f"{first.total_bytes / gb:.2f} GB -> "
+                    f"{estimate.total_bytes / gb:.2f} GB"
+                )
+            return plan
+        smallest = min(smallest, estimate.total_bytes)
+
+    raise ValueError(
+        f"A context of {n_ctx} tokens x {n_seq} sequences needs "
+        f"{smallest / gb:.2f} GB for the KV cache and attention besides "
+        f"{other_bytes / gb:.2f} GB, over the budget of {budget / gb:.2f} GB; "
+        f"lower the context size or parallel sequences, or quantize the cache"
+    )
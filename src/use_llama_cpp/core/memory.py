@@ -0,0 +1,260 @@
+"""
+Memory placement of model weights for AI Room application.
+
+llama.cpp memory-maps the GGUF file (mmap), can lock the weights in RAM
+(mlock) so the kernel never pages them out, and can keep its threads on
+one NUMA node or spread them over all nodes. plan_memory() chooses these
+settings from the locked-memory limit, free memory and the NUMA topology,
+and downgrades requests that cannot work instead of failing at load time.
+mapping_stats() reports how much of the mapped model is resident, locked
+and on which node once it is loaded.
+"""
+
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from ..utils.hardware import NUMANode
+
+logger = logging.getLogger(__name__)
+
+# ggml_numa_strategy values (GGML_NUMA_STRATEGY_*)
+NUMA_STRATEGIES = {
+    "distribute": 1,
+    "isolate": 2,
+    "numactl": 3,
+}
+
+# Free memory kept aside when deciding whether to lock or bind
+HEADROOM = 1.1
+
+_SMAPS_HEADER = re.compile(r"^[0-9a-f]+-[0-9a-f]+ \S+ \S+ \S+ \S+\s*(.*)$")
+
+
+@dataclass
+class MemoryPlan:
+    """How the weights are loaded and where the inference threads run."""
+
+    use_mmap: bool
+    use_mlock: bool
+    # ggml_numa_strategy, 0 to leave NUMA handling off
+    numa_strategy: int = 0
+    # Node the process is bound to, with its CPUs
+    numa_node: Optional[int] = None
+    cpus: Optional[List[int]] = None
+    # Why requested settings were changed or may not perform well
+    notes: List[str] = field(default_factory=list)
+
+    def llama_params(self) -> Dict[str, Any]:
+        """Arguments for Llama()."""
+        params: Dict[str, Any] = {
+            "use_mmap": self.use_mmap,
+            "use_mlock": self.use_mlock,
+        }
+        if self.numa_strategy:
+            params["numa"] = self.numa_strategy
+        return params
+
+
+@dataclass
+class MappingStats:
+    """Pages of a memory-mapped file in this process."""
+
+    mapped_bytes: int
+    resident_bytes: int
+    locked_bytes: int
+    # Resident bytes per NUMA node (empty without /proc/self/numa_maps)
+    node_bytes: Dict[int, int] = field(default_factory=dict)
+
+    @property
+    def resident_fraction(self) -> float:
+        """Share of the mapping held in RAM."""
+        return self.resident_bytes / self.mapped_bytes if self.mapped_bytes else 0.0
+
+
+def plan_memory(model_bytes: int,
+                use_mmap: bool = True,
+                use_mlock: Optional[bool] = False,
+                numa: Optional[Union[str, int]] = None,
+                gpu_layers: int = 0,
+                nodes: Sequence[NUMANode] = (),
+                lock_limit: Optional[int] = None,
+                available: Optional[int] = None) -> MemoryPlan:
+    """
+    Choose mmap, mlock and NUMA settings for a model.
+
+    Args:
+        model_bytes: Size of the weights
+        use_mmap: Map the file instead of reading it into anonymous memory
+        use_mlock: Lock the weights in RAM; None locks when the limit and
+            free memory allow it
+        numa: None or "off", "distribute" (threads on every node),
+            "isolate" (threads on the starting node), "numactl" (respect
+            the CPU set given by numactl/taskset), a node number to bind
+            to, or "auto" to bind to the node with the most free memory
+            when the model fits there and distribute otherwise
+        gpu_layers: Layers offloaded to the GPU (-1 for all)
+        nodes: NUMA topology (utils.hardware.probe_numa_nodes)
+        lock_limit: RLIMIT_MEMLOCK in bytes, None when unlimited
+        available: Available memory in bytes, None when unknown
+
+    Returns:
+        The plan; settings that cannot work are turned off and explained in notes
+
+    Raises:
+        ValueError: For an unknown NUMA setting or node
+    """
+    plan = MemoryPlan(use_mmap=use_mmap, use_mlock=bool(use_mlock))
+    fully_offloaded = gpu_layers == -1
+    size = f"{model_bytes / 1024 ** 3:.2f} GB"
+
+    if use_mlock is None:
+        # Weights in VRAM do not need to stay in host memory
+        plan.use_mlock = not fully_offloaded
+    if plan.use_mlock and lock_limit is not None and lock_limit < model_bytes:
+        plan.use_mlock = False
+        plan.notes.append(
+            f"mlock disabled: the locked memory limit "
+            f"({lock_limit / 1024 ** 2:.0f} MB) is below the model size ({size}); "
+            f"raise it with `ulimit -l unlimited`, "
+            f"LimitMEMLOCK=infinity or `--ulimit memlock=-1`"
+        )
+    if plan.use_mlock and available is not None and model_bytes * HEADROOM > available:
+        plan.use_mlock = False
+        plan.notes.append(
+            f"mlock disabled: locking {size} would leave too little of the "
+            f"{available / 1024 ** 3:.2f} GB available memory"
+        )
+    if not use_mmap and available is not None and model_bytes > available:
+        plan.notes.append(f"Loading without mmap needs {size} of anonymous memory, "
+                          f"only {available / 1024 ** 3:.2f} GB is available")
+
+    if numa is None or numa == "off":
+        return plan
+    if isinstance(numa, str) and numa.isdigit():
+        numa = int(numa)
+    if isinstance(numa, str) and numa not in NUMA_STRATEGIES and numa != "auto":
+        raise ValueError(
+            f"Unknown NUMA setting {numa!r}, expected off, auto, a node number "
+            f"or one of {', '.join(NUMA_STRATEGIES)}"
+        )
+    if len(nodes) <= 1:
+        if numa != "auto":
+            plan.notes.append("NUMA setting ignored: this host has a single NUMA node")
+        return plan
+
+    if numa == "auto":
+        if fully_offloaded:
+            return plan
+        candidates = [node for node in nodes if node.cpus]
+        best = max(candidates, key=lambda node: node.memory_free, default=None)
+        if best is not None and best.memory_free >= model_bytes * HEADROOM:
+            numa = best.node_id
+        else:
+            numa = "distribute"
+
+    if isinstance(numa, str):
+        plan.numa_strategy = NUMA_STRATEGIES[numa]
+        return plan
+
+    node = next((node for node in nodes if node.node_id == numa), None)
+    if node is None or not node.cpus:
+        raise ValueError(f"NUMA node {numa} does not exist or has no CPUs")
+    # Threads confined to the node allocate, and first touch, local memory
+    plan.numa_strategy = NUMA_STRATEGIES["numactl"]
+    plan.numa_node = node.node_id
+    plan.cpus = list(node.cpus)
+    if node.memory_free < model_bytes:
+        plan.notes.append(
+            f"NUMA node {node.node_id} has {node.memory_free / 1024 ** 3:.2f} GB free, "
+            f"less than the model ({size}); part of it will be on other nodes"
+        )
+    return plan
+
+
+def bind_to_cpus(cpus: Sequence[int]) -> bool:
+    """
+    Restrict every thread of this process to the given CPUs.
+
+    Linux applies sched_setaffinity to a single thread, so each existing
+    thread is bound; threads started later inherit the mask.
+
+    Returns:
+        True if the affinity was set
+    """
+    if not hasattr(os, "sched_setaffinity"):
+        logger.warning("CPU affinity is not supported on this platform")
+        return False
+    try:
+        tids = [int(tid) for tid in os.listdir("/proc/self/task")]
+    except OSError:
+        tids = [0]
+    bound = False
+    for tid in tids:
+        try:
+            os.sched_setaffinity(tid, cpus)
+            bound = True
+        except OSError as e:
+            # Threads may exit while we iterate
+            logger.debug(f"Could not bind thread {tid}: {e}")
+    return bound
+
+
+def mapping_stats(path: str, proc_self: str = "/proc/self") -> Optional[MappingStats]:
+    """
+    Mapped, resident and locked bytes of a file mapped by this process.
+
+    Args:
+        path: Mapped file, e.g. the model path
+        proc_self: This process's proc directory
+
+    Returns:
+        Totals over every mapping of the file, or None if it is not mapped
+        (loaded without mmap) or /proc is unavailable
+    """
+    target = os.path.realpath(path)
+    totals = {"Size": 0, "Rss": 0, "Locked": 0}
+    found = False
+    try:
+        with open(os.path.join(proc_self, "smaps")) as f:
+            current = False
+            for line in f:
+                header = _SMAPS_HEADER.match(line)
+                if header:
+                    current = header.group(1) == target
+                    found = found or current
+                    continue
+                if current:
+                    key, _, value = line.partition(":")
+                    if key in totals:
+                        totals[key] += int(value.split()[0]) * 1024
+    except (OSError, ValueError) as e:
+        logger.debug(f"Could not read smaps: {e}")
+        return None
+    if not found:
+        return None
+
+    stats = MappingStats(totals["Size"], totals["Rss"], totals["Locked"])
+    try:
+        with open(os.path.join(proc_self, "numa_maps")) as f:
+            for line in f:
+                fields = line.split()
+                if f"file={target}" not in fields:
+                    continue
+                page_size = 4096
+                counts: Dict[int, int] = {}
+                for item in fields:
+                    key, _, value = item.partition("=")
+                    if key == "kernelpagesize_kB":
+                        page_size = int(value) * 1024
+                    elif key[:1] == "N" and key[1:].isdigit():
+                        counts[int(key[1:])] = int(value)
+                for node, pages in counts.items():
+                    stats.node_bytes[node] = (
+                        stats.node_bytes.get(node, 0) + pages * page_size
+                    )
+    except (OSError, ValueError) as e:
+        logger.debug(f"Could not read numa_maps: {e}")
+    return stats
@@ -0,0 +1,363 @@
+"""
+Request metrics for AI Room application.
+
+RequestTimer measures one generation: token counts, prefill and decode time
+(from llama.cpp's own performance counters when available), time to first
+token and throughput. MetricsRegistry aggregates those measurements into
+counters and histograms and renders them in the Prometheus text format.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+THROUGHPUT_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0, 320.0, 640.0)
+
+
+@dataclass
+class RequestMetrics:
+    """Token counts and timings of one generation request."""
+
+    prompt_tokens: int
+    completion_tokens: int
+    # Prompt tokens reused from the KV cache instead of evaluated
+    cached_tokens: int
+    prefill_seconds: float
+    ttft_seconds: float
+    decode_seconds: float
+    total_seconds: float
+    # "error" for requests that failed
+    finish_reason: Optional[str] = None
+    # Speculative decoding: tokens proposed by the drafter and accepted by the model
+    draft_tokens: int = 0
+    accepted_draft_tokens: int = 0
+
+    @property
+    def tokens_per_second(self) -> float:
+        """Decode throughput."""
+        return (
+            self.completion_tokens / self.decode_seconds
+            if self.decode_seconds > 0
+            else 0.0
+        )
+
+    @property
+    def failed(self) -> int:
+        """1 if the request failed, 0 otherwise."""
+        return int(self.finish_reason == "error")
+
+    @property
+    def draft_acceptance_rate(self) -> Optional[float]:
+        """Fraction of drafted tokens accepted, None without speculative decoding."""
+        return (
+            self.accepted_draft_tokens / self.draft_tokens
+            if self.draft_tokens
+            else None
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dictionary including the derived throughput."""
+        return {
+            **asdict(self),
+            "tokens_per_second": self.tokens_per_second,
+            "draft_acceptance_rate": self.draft_acceptance_rate,
+        }
+
+
+def _perf_counters(model: "Llama") -> Optional[Tuple[float, float, int, int]]:
+    """llama.cpp's cumulative (prompt ms, decode ms, prompt tokens, decode tokens)."""
+    try:
+        import llama_cpp
+        # Anything else (wrappers, test doubles) must not reach the C API
+        if not isinstance(model, llama_cpp.Llama):
+            return None
+        data = llama_cpp.llama_perf_context(model._ctx.ctx)
+        return data.t_p_eval_ms, data.t_eval_ms, data.n_p_eval, data.n_eval
+    except Exception:
+        return None
+
+
+def _draft_counters(model: "Llama") -> Optional[Tuple[int, int, int]]:
+    """Cumulative (proposed, settled, accepted) tokens of the model's drafter."""
+    draft = getattr(model, "draft_model", None)
+    counters = tuple(
+        getattr(draft, name, None)
+        for name in ("proposed_tokens", "drafted_tokens", "accepted_tokens")
+    )
+    return counters if all(isinstance(value, int) for value in counters) else None
+
+
+class RequestTimer:
+    """Measures a single request against a Llama model."""
+
+    def __init__(self, model: "Llama"):
+        """
+        Start timing.
+
+        Args:
+            model: Model the request runs on
+        """
+        self.model = model
+        self.started = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.chunks = 0
+        self._perf = _perf_counters(model)
+        self._draft = _draft_counters(model)
+
+    def token(self):
+        """Record a streamed chunk; the first one marks time to first token."""
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.chunks += 1
+
+    def finish(self,
+               prompt_tokens: Optional[int] = None,
+               completion_tokens: Optional[int] = None,
+               cached_tokens: Optional[int] = None,
+               finish_reason: Optional[str] = None) -> RequestMetrics:
+        """
+        Stop timing and build the metrics.
+
+        Counts that are not given are taken from llama.cpp's counters, or
+        from the number of streamed chunks when the counters are unavailable.
+        Cached tokens default to the prompt tokens llama.cpp did not evaluate.
+        llama.cpp counts speculative verification batches as prompt
+        processing, so requests that drafted tokens are timed as the caller
+        saw them instead, with prefill estimated from the prompt's share of
+        the batched tokens. Decode time the counters do not give is the wall
+        time after prefill.
+
+        Returns:
+            Metrics of the request
+        """
+        ended = time.perf_counter()
+        total = ended - self.started
+
+        proposed = draft_tokens = accepted_draft_tokens = 0
+        drafted = False
+        draft_after = _draft_counters(self.model)
+        if self._draft is not None and draft_after is not None:
+            proposed, draft_tokens, accepted_draft_tokens = (
+                b - a for a, b in zip(self._draft, draft_after)
+            )
+            drafted = proposed > 0
+
+        prefill = decode = None
+        evaluated_prompt = evaluated_decode = None
+        after = _perf_counters(self.model)
+        if self._perf is not None and after is not None:
+            delta = [b - a for a, b in zip(self._perf, after)]
+            # A reset of the counters in between makes the delta meaningless
+            if min(delta) >= 0 and not drafted:
+                prefill, decode = delta[0] / 1000, delta[1] / 1000
+                evaluated_prompt, evaluated_decode = int(delta[2]), int(delta[3])
+            elif min(delta) >= 0 and delta[2] and completion_tokens:
+                # Every generated token but the last and every rejected draft
+                # token was evaluated once; the other batched tokens are prompt
+                generated = completion_tokens - 1 + proposed - accepted_draft_tokens
+                evaluated_prompt = int(
+                    min(delta[2], max(0, delta[2] + delta[3] - generated))
+                )
+                prefill = delta[0] / 1000 * evaluated_prompt / delta[2]
+
+        if self.first_token is not None:
+            ttft = self.first_token - self.started
+            # Streaming: decode time as the client saw it, sampling included
+            decode = ended - self.first_token
+        else:
+            if decode is None and prefill is not None:
+                decode = max(0.0, total - prefill)
+            ttft = total - (decode or 0.0)
+        if prefill is None:
+            prefill = ttft
+
+        if cached_tokens is None:
+            known = prompt_tokens is not None and evaluated_prompt is not None
+            cached_tokens = max(0, prompt_tokens - evaluated_prompt) if known else 0
+        if prompt_tokens is None:
+            prompt_tokens = cached_tokens + (evaluated_prompt or 0)
+        if completion_tokens is None:
+            # The last sampled token is returned without being evaluated
+            completion_tokens = (
+                evaluated_decode + 1 if evaluated_decode else self.chunks
+            )
+
+        return RequestMetrics(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            prefill_seconds=prefill,
+            ttft_seconds=ttft,
+            decode_seconds=decode or 0.0,
+            total_seconds=total,
+            finish_reason=finish_reason,
+            draft_tokens=draft_tokens,
+            accepted_draft_tokens=accepted_draft_tokens,
+        )
+
+
+class MetricsRegistry:
+    """Thread-safe aggregate of request metrics in Prometheus form."""
+
+    # name -> (type, help, RequestMetrics attribute, histogram buckets)
+    METRICS = {
+        "requests_total": ("counter", "Completed generation requests.", None, None),
+        "request_errors_total": (
+            "counter",
+            "Generation requests that failed.",
+            "failed",
+            None,
+        ),
+        "prompt_tokens_total": (
+            "counter",
+            "Prompt tokens processed.",
+            "prompt_tokens",
+            None,
+        ),
+        "cached_prompt_tokens_total": (
+            "counter",
+            "Prompt tokens reused from the KV cache.",
+            "cached_tokens",
+            None,
+        ),
+        "completion_tokens_total": (
+            "counter",
+            "Tokens generated.",
+            "completion_tokens",
+            None,
+        ),
+        "draft_tokens_total": (
+            "counter",
+            "Tokens proposed by speculative drafting.",
+            "draft_tokens",
+            None,
+        ),
+        "accepted_draft_tokens_total": (
+            "counter",
+            "Drafted tokens accepted by the model.",
+            "accepted_draft_tokens",
+            None,
+        ),
+        "prefill_seconds": (
+            "histogram",
+            "Prompt processing time.",
+            "prefill_seconds",
+            LATENCY_BUCKETS,
+        ),
+        "time_to_first_token_seconds": (
+            "histogram",
+            "Time to first token.",
+            "ttft_seconds",
+            LATENCY_BUCKETS,
+        ),
+        "decode_seconds": (
+            "histogram",
+            "Token generation time.",
+            "decode_seconds",
+            LATENCY_BUCKETS,
+        ),
+        "request_duration_seconds": (
+            "histogram",
+            "Total request time.",
+            "total_seconds",
+            LATENCY_BUCKETS,
+        ),
+        "decode_tokens_per_second": (
+            "histogram",
+            "Token generation throughput.",
+            "tokens_per_second",
+            THROUGHPUT_BUCKETS,
+        ),
+    }
+
+    def __init__(self, namespace: str = "use_llama_cpp"):
+        """
+        Initialize the registry.
+
+        Args:
+            namespace: Prefix of every exported metric name
+        """
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        # metric name -> label values -> counter value or [bucket counts, sum, count]
+        self._values: Dict[str, Dict[Tuple[Tuple[str, str], ...], Any]] = {
+            name: {} for name in self.METRICS
+        }
+
+    def observe(self, metrics: RequestMetrics, **labels: str):
+        """
+        Add one request's metrics.
+
+        Args:
+            metrics: Metrics of a finished request
+            **labels: Prometheus labels, e.g. model="llama-3-8b"
+        """
+        key = tuple(sorted((name, str(value)) for name, value in labels.items()))
+        with self._lock:
+            for name, (kind, _, attribute, buckets) in self.METRICS.items():
+                value = 1 if attribute is None else getattr(metrics, attribute)
+                series = self._values[name]
+                if kind == "counter":
+                    series[key] = series.get(key, 0) + value
+                    continue
+                state = series.setdefault(key, [[0] * len(buckets), 0.0, 0])
+                for i, bound in enumerate(buckets):
+                    if value <= bound:
+                        state[0][i] += 1
+                state[1] += value
+                state[2] += 1
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, (kind, help_text, _, buckets) in self.METRICS.items():
+                full_name = f"{self.namespace}_{name}"
+                lines.append(f"# HELP {full_name} {help_text}")
+                lines.append(f"# TYPE {full_name} {kind}")
+                for key, state in sorted(self._values[name].items()):
+                    if kind == "counter":
+                        lines.append(f"{full_name}{_labels(key)} {_number(state)}")
+                        continue
+                    counts, total, count = state
+                    for bound, bucket_count in zip(buckets, counts):
+                        labels = _labels(key, le=_number(bound))
+                        lines.append(f"{full_name}_bucket{labels} {bucket_count}")
+                    lines.append(f"{full_name}_bucket{_labels(key, le='+Inf')} {count}")
+                    lines.append(f"{full_name}_sum{_labels(key)} {_number(total)}")
+                    lines.append(f"{full_name}_count{_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Drop all recorded values."""
+        with self._lock:
+            self._values = {name: {} for name in self.METRICS}
+
+
+def _number(value: float) -> str:
+    """Format a sample value the way Prometheus clients do."""
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(key: Tuple[Tuple[str, str], ...], **extra: str) -> str:
+    """Render a label set, escaping values per the exposition format."""
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+# Registry shared by default across AIChat instances and the server
+default_registry = MetricsRegistry()
@@ -4,17 +4,63 @@ Model loader for AI Room application with GPU acceleration support.
 
 import os
 import logging
-from typing import Optional, Dict, Any
-from llama_cpp import Llama
-import torch
+import threading
+import time
+from typing import TYPE_CHECKING, Optional, Dict, Any, Union
+
+from ..utils.gguf import GGUFError, GGUFFile, read_gguf
+from ..utils.hardware import (
+    available_memory,
+    describe_cpu,
+    llama_supports_gpu_offload,
+    locked_memory_limit,
+    probe_numa_nodes,
+    probe_nvidia_gpus,
+)
+from . import tuning
+from .kv_memory import DEFAULT_N_UBATCH, KVPlan, plan_kv_cache
+from .memory import MappingStats, MemoryPlan, bind_to_cpus, mapping_stats, plan_memory
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
+    from .speculative import SpeculativeDraft
+    from .tokenizer import Tokenizer
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_WARMUP_PROMPT = "Hello! How are you today?"
+
 
 class ModelLoader:
     """Handles loading and management of GGUF models with GPU acceleration."""
     
-    def __init__(self, model_path: str, gpu_layers: int = -1, context_size: int = 2048):
+    def __init__(self,
+                 model_path: str,
+                 gpu_layers: int = -1,
+                 context_size: int = 2048,
+                 n_threads: Optional[int] = None,
+                 n_threads_batch: Optional[int] = None,
+                 n_batch: int = 512,
+                 n_ubatch: Optional[int] = None,
+                 auto_tune: bool = False,
+                 calibrate: bool = False,
+                 tuning_cache: Optional[str] = None,
+                 prefetch: bool = False,
+                 warmup_tokens: int = 8,
+                 warmup_prompt: str = DEFAULT_WARMUP_PROMPT,
+                 draft_model_path: Optional[str] = None,
+                 prompt_lookup: bool = False,
+                 draft_tokens: int = 8,
+                 min_draft_acceptance: float = 0.3,
+                 embedding: bool = False,
+                 pooling: Optional[str] = None,
+                 use_mmap: bool = True,
+                 use_mlock: Optional[bool] = False,
+                 numa: Optional[Union[str, int]] = None,
+                 type_k: Optional[str] = None,
+                 type_v: Optional[str] = None,
+                 flash_attn: Optional[bool] = None,
+                 memory_budget: Optional[int] = None):
         """
         Initialize the model loader.
         
@@ -22,11 +68,80 @@ class ModelLoader:
             model_path: Path to the GGUF model file
             gpu_layers: Number of GPU layers to use (-1 for all, 0 for CPU only)
             context_size: Context window size
+            n_threads: Threads for decoding (default: llama.cpp's, or tuned)
+            n_threads_batch: Threads for prompt processing (default: llama.cpp's,
+                or tuned)
+            n_batch: Maximum tokens submitted to llama_decode at once
+            n_ubatch: Physical batch size (default: llama.cpp's)
+            auto_tune: Pick thread counts from the cgroup CPU quota and core topology
+            calibrate: With auto_tune, time thread counts on the loaded model
+                once and cache the fastest per host and model
+            tuning_cache: Calibration cache file
+                (default: ~/.cache/use_llama_cpp/tuning.json)
+            prefetch: Read the weights into the page cache in a background
+                thread while the model loads
+            warmup_tokens: Tokens decoded by warmup (0 to skip warmup)
+            warmup_prompt: Prompt evaluated by warmup
+            draft_model_path: Small GGUF model with the same vocabulary that
+                drafts tokens for speculative decoding
+            prompt_lookup: Draft tokens by n-gram lookup in the context
+                instead of with a draft model
+            draft_tokens: Tokens drafted per decode step
+            min_draft_acceptance: Acceptance rate below which drafting pauses
+            embedding: Load the model for embeddings (see core.embeddings.Embedder)
+            pooling: Pooling llama.cpp applies in embedding mode: "mean", "cls",
+                "last", or "none" to get token vectors and pool per request
+                (default: the model's own)
+            use_mmap: Memory-map the weights instead of reading them into RAM
+            use_mlock: Lock the weights in RAM so they are never paged out;
+                None locks when the locked memory limit and free memory allow
+            numa: NUMA placement: "distribute", "isolate", "numactl", a node
+                number to bind to, or "auto" (see core.memory.plan_memory)
+            type_k: KV cache type of keys, e.g. "f16", "q8_0" or "q4_0"
+                (default: f16, quantized if needed to fit memory_budget)
+            type_v: KV cache type of values; quantized types need flash attention
+            flash_attn: Use flash attention (default: on if needed to fit
+                memory_budget or for a quantized V cache)
+            memory_budget: Bytes the weights and KV cache may use (default:
+                available memory when running on CPU, no limit with GPU offload)
         """
         self.model_path = model_path
         self.gpu_layers = gpu_layers
         self.context_size = context_size
-        self.model: Optional[Llama] = None
+        self.n_threads = n_threads
+        self.n_threads_batch = n_threads_batch
+        self.n_batch = n_batch
+        self.n_ubatch = n_ubatch
+        self.auto_tune = auto_tune or calibrate
+        self.calibrate = calibrate
+        self.tuning_cache = tuning_cache or tuning.DEFAULT_CACHE_PATH
+        self.tuning: Optional[tuning.TuningConfig] = None
+        self.gguf: Optional[GGUFFile] = None
+        self.prefetch = prefetch
+        self.warmup_tokens = warmup_tokens
+        self.warmup_prompt = warmup_prompt
+        self.draft_model_path = draft_model_path
+        self.prompt_lookup = prompt_lookup
+        self.draft_tokens = draft_tokens
+        self.min_draft_acceptance = min_draft_acceptance
+        self.draft: Optional["SpeculativeDraft"] = None
+        self.embedding = embedding
+        self.pooling = pooling
+        self.use_mmap = use_mmap
+        self.use_mlock = use_mlock
+        self.numa = numa
+        self.memory_plan: Optional[MemoryPlan] = None
+        self.type_k = type_k
+        self.type_v = type_v
+        self.flash_attn = flash_attn
+        self.memory_budget = memory_budget
+        self.kv_plan: Optional[KVPlan] = None
+        self.model: Optional["Llama"] = None
+        # "unloaded", "loading", "warming", "ready" or "failed"
+        self.state = "unloaded"
+        # Set once the model is loaded and warm
+        self.ready = threading.Event()
+        self._prefetch_thread: Optional[threading.Thread] = None
         
     def validate_model_path(self) -> bool:
         """Validate that the model file exists and is accessible."""
@@ -41,49 +156,124 @@ class ModelLoader:
         logger.info(f"Model file found: {os.path.basename(self.model_path)}")
         logger.info(f"File size: {file_size:.2f} GB")
         
+        try:
+            self.gguf = read_gguf(self.model_path)
+        except (OSError, GGUFError) as e:
+            logger.error(f"Invalid GGUF file {self.model_path}: {e}")
+            return False
+        
+        # A truncated download parses fine but its last tensors are missing
+        end = max((t.offset + t.nbytes for t in self.gguf.tensors), default=0)
+        if end > self.gguf.file_size:
+            logger.error(
+                f"Model file is truncated: {self.gguf.file_size} of {end} bytes present"
+            )
+            return False
+        
+        logger.info(
+            f"Architecture: {self.gguf.architecture}, "
+            f"quantization: {self.gguf.quantization}, "
+            f"{self.gguf.tensor_count} tensors, "
+            f"trained context: {self.gguf.context_length}"
+        )
+        if self.gguf.context_length and self.context_size > self.gguf.context_length:
+            logger.warning(
+                f"Context size {self.context_size} exceeds the trained context "
+                f"length {self.gguf.context_length}"
+            )
+        
         return True
     
     def check_gpu_availability(self) -> bool:
         """Check if GPU is available and provide information."""
         logger.info("Checking GPU availability...")
         
-        if torch.cuda.is_available():
-            gpu_count = torch.cuda.device_count()
-            logger.info(f"CUDA is available! Found {gpu_count} GPU(s)")
-            
-            for i in range(gpu_count):
-                gpu_name = torch.cuda.get_device_name(i)
-                gpu_memory = torch.cuda.get_device_properties(i).total_memory / (1024**3)
-                logger.info(f"GPU {i}: {gpu_name} ({gpu_memory:.1f} GB)")
-            
-            torch.cuda.set_device(0)
-            logger.info(f"Using GPU device: {torch.cuda.current_device()}")
+        gpus = probe_nvidia_gpus()
+        if gpus and llama_supports_gpu_offload():
+            logger.info(f"CUDA is available! Found {len(gpus)} GPU(s)")
+            for gpu in gpus:
+                logger.info(f"GPU {gpu.index}: {gpu.name}")
             return True
+        
+        if gpus:
+            logger.warning("llama.cpp was built without GPU support, running on CPU")
         else:
             logger.warning("CUDA is not available")
-            return False
+        logger.info(f"CPU: {describe_cpu()}")
+        return False
     
-    def load_model(self) -> Optional[Llama]:
+    def load_model(self) -> Optional["Llama"]:
         """Load a GGUF model with GPU acceleration."""
         if not self.validate_model_path():
             return None
         
+        # Imported here so the package stays cheap to import
+        from llama_cpp import Llama
+        
         logger.info(f"Loading model: {os.path.basename(self.model_path)}")
         logger.info(f"GPU layers: {self.gpu_layers}")
         logger.info(f"Context size: {self.context_size}")
         
         try:
+            self.memory_plan = self._plan_memory()
+        except ValueError as e:
+            logger.error(f"Invalid memory settings: {e}")
+            return None
+        params = self._thread_params()
+        if self.memory_plan.cpus is not None and not self.auto_tune:
+            # Size the thread pools to the node we are bound to
+            config = tuning.recommend_config(gpu_layers=self.gpu_layers)
+            params.setdefault("n_threads", config.n_threads)
+            params.setdefault("n_threads_batch", config.n_threads_batch)
+        params.update(self.memory_plan.llama_params())
+        if self.embedding:
+            from .embeddings import POOLING_TYPES
+            
+            params["embedding"] = True
+            if self.pooling is not None:
+                params["pooling_type"] = POOLING_TYPES[self.pooling]
+            # Every sequence must fit in one micro-batch for non-causal models
+            params["n_ubatch"] = params["n_batch"]
+            logger.info(f"Embedding mode, pooling: {self.pooling or 'model default'}")
+        try:
+            self.kv_plan = self._plan_kv_cache(
+                params.get("n_ubatch") or min(params["n_batch"], DEFAULT_N_UBATCH)
+            )
+        except ValueError as e:
+            logger.error(f"Invalid KV cache settings: {e}")
+            return None
+        params.update(self.kv_plan.llama_params())
+        try:
+            self.draft = self._create_draft(params)
+            if self.draft is not None:
+                from .speculative import SpeculativeLlama as Llama
             self.model = Llama(
                 model_path=self.model_path,
                 n_gpu_layers=self.gpu_layers,
                 n_ctx=self.context_size,
-                n_batch=512,
                 verbose=False,
                 offload_kqv=True,
                 mul_mat_q=True,
+                draft_model=self.draft,
+                **params,
             )
             
             logger.info("Model loaded successfully!")
+            self._log_weight_stats()
+            self._check_draft()
+            logger.info(
+                f"Threads: {self.model.n_threads} decode, "
+                f"{self.model.n_threads_batch} prompt"
+            )
+            
+            explicit = self.n_threads is not None or self.n_threads_batch is not None
+            if (
+                self.calibrate
+                and not explicit
+                and self.tuning is not None
+                and self.tuning.source == "heuristic"
+            ):
+                self._calibrate()
             
             if self.gpu_layers > 0:
                 logger.info(f"Model configured to use {self.gpu_layers} GPU layers")
@@ -96,14 +286,351 @@ class ModelLoader:
             
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
+            self._close_draft()
             return None
     
-    def get_model(self) -> Optional[Llama]:
+    def _plan_memory(self) -> MemoryPlan:
+        """Decide mmap, mlock and NUMA settings and bind to a NUMA node if chosen."""
+        model_bytes = (
+            self.gguf.file_size if self.gguf else os.path.getsize(self.model_path)
+        )
+        plan = plan_memory(
+            model_bytes,
+            use_mmap=self.use_mmap,
+            use_mlock=self.use_mlock,
+            numa=self.numa,
+            # -1 is the default, also for builds that cannot offload
+            gpu_layers=self.gpu_layers if llama_supports_gpu_offload() else 0,
+            nodes=probe_numa_nodes(),
+            lock_limit=locked_memory_limit(),
+            available=available_memory(),
+        )
+        for note in plan.notes:
+            logger.warning(note)
+        if plan.cpus is not None and bind_to_cpus(plan.cpus):
+            logger.info(f"Bound to NUMA node {plan.numa_node} ({len(plan.cpus)} CPUs)")
+        logger.info(
+            f"Weights: mmap {'on' if plan.use_mmap else 'off'}, "
+            f"mlock {'on' if plan.use_mlock else 'off'}"
+        )
+        return plan
+    
+    def _plan_kv_cache(self, n_ubatch: int) -> KVPlan:
+        """Choose the KV cache types and flash attention for the context size."""
+        budget = self.memory_budget
+        offloaded = self.gpu_layers != 0 and llama_supports_gpu_offload()
+        if budget is None and not offloaded:
+            # With GPU offload the cache lives in VRAM, which this does not track
+            budget = available_memory()
+        gguf = self.gguf if self.gguf is not None else read_gguf(self.model_path)
+        plan = plan_kv_cache(
+            gguf,
+            self.context_size,
+            type_k=self.type_k,
+            type_v=self.type_v,
+            flash_attn=self.flash_attn,
+            n_ubatch=n_ubatch,
+            budget=budget,
+            other_bytes=gguf.tensor_bytes,
+        )
+        for note in plan.notes:
+            logger.warning(note)
+        logger.info(
+            f"KV cache: K {plan.type_k}, V {plan.type_v}, flash attention "
+            f"{'on' if plan.flash_attn else 'off'}, "
+            f"{plan.estimate.total_bytes / 1024 ** 2:.0f} MB with attention buffers"
+        )
+        return plan
+    
+    def weight_stats(self) -> Optional[MappingStats]:
+        """
+        Resident, locked and per-NUMA-node bytes of the mapped weights.
+        
+        Returns:
+            Current page statistics, or None when the model is not loaded
+            or was loaded without mmap
+        """
+        if self.model is None:
+            return None
+        return mapping_stats(self.model_path)
+    
+    def _log_weight_stats(self):
+        stats = self.weight_stats()
+        if stats is None:
+            return
+        gb = 1024 ** 3
+        logger.info(
+            f"Weights: {stats.mapped_bytes / gb:.2f} GB mapped, "
+            f"{stats.resident_bytes / gb:.2f} GB resident "
+            f"({stats.resident_fraction:.0%}), {stats.locked_bytes / gb:.2f} GB locked"
+        )
+        if len(stats.node_bytes) > 1 or self.memory_plan.numa_node is not None:
+            nodes = ", ".join(
+                f"node {node}: {size / gb:.2f} GB"
+                for node, size in sorted(stats.node_bytes.items())
+            )
+            logger.info(f"Resident weights by NUMA node: {nodes}")
+            node = self.memory_plan.numa_node
+            remote = (
+                stats.resident_bytes - stats.node_bytes.get(node, 0)
+                if node is not None
+                else 0
+            )
+            if remote > stats.resident_bytes / 2:
+                logger.warning(
+                    f"Most cached weight pages are not on NUMA node {node}; "
+                    f"they were read before binding. "
+                    f"Drop the page cache or load with use_mmap=False"
+                )
+    
+    def _create_draft(self, params: Dict[str, Any]) -> Optional["SpeculativeDraft"]:
+        """Drafter for speculative decoding, if one is configured."""
+        if self.draft_model_path is None and not self.prompt_lookup:
+            return None
+        
+        from .speculative import (
+            DraftModelDrafter,
+            PromptLookupDrafter,
+            SpeculativeDraft,
+        )
+        
+        if self.draft_model_path is not None:
+            logger.info(
+                f"Loading draft model: {os.path.basename(self.draft_model_path)}"
+            )
+            drafter = DraftModelDrafter.load(
+                self.draft_model_path,
+                n_ctx=self.context_size,
+                num_pred_tokens=self.draft_tokens,
+                n_gpu_layers=self.gpu_layers,
+                n_batch=params["n_batch"],
+                **{
+                    k: v
+                    for k, v in params.items()
+                    if k in ("n_threads", "n_threads_batch")
+                },
+            )
+        else:
+            drafter = PromptLookupDrafter(num_pred_tokens=self.draft_tokens)
+        logger.info(
+            f"Speculative decoding with {type(drafter).__name__}, "
+            f"{self.draft_tokens} tokens per draft"
+        )
+        return SpeculativeDraft(drafter, min_acceptance=self.min_draft_acceptance)
+    
+    def _check_draft(self):
+        """Turn speculative decoding off if the draft model tokenizes differently."""
+        from .speculative import DraftModelDrafter
+        
+        drafter = self.draft.drafter if self.draft is not None else None
+        if isinstance(drafter, DraftModelDrafter) and not drafter.compatible_with(
+            self.model
+        ):
+            logger.error(
+                "Draft model vocabulary differs from the target model, "
+                "speculative decoding disabled"
+            )
+            self.model.draft_model = None
+            self._close_draft()
+    
+    def _close_draft(self):
+        if self.draft is not None:
+            self.draft.close()
+            self.draft = None
+    
+    def _tuning_key(self) -> str:
+        """Cache key for calibrated settings of this model on this host."""
+        fingerprint = tuning.model_fingerprint(self.model_path)[:16]
+        return f"{tuning.host_key()}:{fingerprint}:{self.gpu_layers}"
+    
+    def _thread_params(self) -> Dict[str, Any]:
+        """Thread and batch arguments for Llama, tuned if requested."""
+        params: Dict[str, Any] = {"n_batch": self.n_batch}
+        if self.n_ubatch is not None:
+            params["n_ubatch"] = self.n_ubatch
+        
+        if self.auto_tune:
+            config = None
+            try:
+                config = tuning.load_cached_config(
+                    self._tuning_key(), self.tuning_cache
+                )
+            except OSError as e:
+                logger.warning(f"Could not read tuning cache: {e}")
+            if config is None:
+                config = tuning.recommend_config(gpu_layers=self.gpu_layers)
+            # Calibration only times thread counts, batch sizes stay as configured
+            self.tuning = config
+            params["n_threads"] = config.n_threads
+            params["n_threads_batch"] = config.n_threads_batch
+            logger.info(f"Auto-tuned threads ({config.source}): "
+                        f"{config.n_threads} decode, {config.n_threads_batch} prompt")
+        
+        # Explicit settings always win
+        if self.n_threads is not None:
+            params["n_threads"] = self.n_threads
+        if self.n_threads_batch is not None:
+            params["n_threads_batch"] = self.n_threads_batch
+        return params
+    
+    def _calibrate(self):
+        """Time thread counts on the loaded model and cache the fastest."""
+        try:
+            config = tuning.calibrate(self.model)
+        except Exception as e:
+            logger.warning(f"Calibration failed, keeping heuristic settings: {e}")
+            return
+        self.tuning = config
+        try:
+            tuning.save_cached_config(self._tuning_key(), config, self.tuning_cache)
+        except OSError as e:
+            logger.warning(f"Could not write tuning cache: {e}")
+    
+    def prefetch_weights(
+        self, chunk_bytes: int = 8 * 1024 * 1024
+    ) -> Optional[threading.Thread]:
+        """
+        Read the tensor data into the page cache in a background thread.
+        
+        llama.cpp memory-maps the weights, so pages that are already cached
+        are mapped without disk reads when the first requests touch them.
+        
+        Args:
+            chunk_bytes: Bytes read per call
+        
+        Returns:
+            The started daemon thread, or None if the file cannot be opened
+        """
+        offset = self.gguf.data_offset if self.gguf else 0
+        try:
+            f = open(self.model_path, "rb", buffering=0)
+        except OSError as e:
+            logger.warning(f"Cannot prefetch {self.model_path}: {e}")
+            return None
+        
+        def run():
+            started = time.perf_counter()
+            total = 0
+            try:
+                with f:
+                    if hasattr(os, "posix_fadvise"):
+                        # Let the kernel read ahead of us
+                        os.posix_fadvise(
+                            f.fileno(), offset, 0, os.POSIX_FADV_SEQUENTIAL
+                        )
+                        os.posix_fadvise(f.fileno(), offset, 0, os.POSIX_FADV_WILLNEED)
+                    f.seek(offset)
+                    buffer = bytearray(chunk_bytes)
+                    while True:
+                        n = f.readinto(buffer)
+                        if not n:
+                            break
+                        total += n
+            except OSError as e:
+                logger.warning(f"Prefetch of {self.model_path} stopped: {e}")
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"Prefetched {total / 1024 ** 3:.2f} GB of weights in {elapsed:.1f}s"
+            )
+        
+        self._prefetch_thread = threading.Thread(
+            target=run, name="weight-prefetch", daemon=True
+        )
+        self._prefetch_thread.start()
+        return self._prefetch_thread
+    
+    def warmup(self) -> float:
+        """
+        Run a short decode so the first real request does not pay for
+        allocator growth, kernel selection and cold caches.
+        
+        The KV cache is cleared afterwards.
+        
+        Returns:
+            Seconds the warmup took
+        """
+        if self.model is None or self.warmup_tokens <= 0:
+            return 0.0
+        
+        started = time.perf_counter()
+        if self.embedding:
+            from .embeddings import Embedder
+            
+            Embedder(self.model).embed([self.warmup_prompt])
+        else:
+            for _ in self.model.create_completion(
+                self.warmup_prompt,
+                max_tokens=self.warmup_tokens,
+                temperature=0.0,
+                stream=True,
+            ):
+                pass
+        self.model.reset()
+        elapsed = time.perf_counter() - started
+        logger.info(f"Warmup decoded {self.warmup_tokens} tokens in {elapsed:.2f}s")
+        return elapsed
+    
+    def load_and_warmup(self) -> Optional["Llama"]:
+        """
+        Load the model, warm it up and mark it ready.
+        
+        Returns:
+            Loaded Llama model instance or None on failure
+        """
+        self.ready.clear()
+        self.state = "loading"
+        if self.prefetch:
+            self.prefetch_weights()
+        
+        if self.load_model() is None:
+            self.state = "failed"
+            return None
+        
+        self.state = "warming"
+        try:
+            self.warmup()
+        except Exception as e:
+            # A failed warmup only costs speed on the first request
+            logger.warning(f"Warmup failed: {e}")
+        
+        self.state = "ready"
+        self.ready.set()
+        return self.model
+    
+    def start_background_load(self) -> threading.Thread:
+        """
+        Load and warm up the model in a daemon thread.
+        
+        Poll `state` or wait on `ready` to find out when it is done.
+        
+        Returns:
+            The started thread
+        """
+        self.state = "loading"
+        thread = threading.Thread(
+            target=self.load_and_warmup, name="model-load", daemon=True
+        )
+        thread.start()
+        return thread
+    
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until the model is ready; False on timeout."""
+        return self.ready.wait(timeout)
+    
+    def get_model(self) -> Optional["Llama"]:
         """Get the loaded model instance."""
         if self.model is None:
             self.model = self.load_model()
         return self.model
     
+    def get_tokenizer(self) -> Optional["Tokenizer"]:
+        """Shared tokenizer of the loaded model, None if it is not loaded."""
+        if self.model is None:
+            return None
+        from .tokenizer import Tokenizer
+        
+        return Tokenizer.for_model(self.model)
+    
     def is_loaded(self) -> bool:
         """Check if the model is loaded."""
         return self.model is not None
@@ -111,6 +638,13 @@ class ModelLoader:
     def unload_model(self):
         """Unload the model to free memory."""
         if self.model:
+            # Free llama.cpp's memory now, not when the last reference goes
+            close = getattr(self.model, "close", None)
+            if close is not None:
+                close()
             del self.model
             self.model = None
+            self._close_draft()
+            self.ready.clear()
+            self.state = "unloaded"
             logger.info("Model unloaded")
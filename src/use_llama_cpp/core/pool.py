@@ -0,0 +1,407 @@
+"""
+Multi-model pool for AI Room application.
+
+ModelPool loads GGUF models on demand by name and keeps the resident ones
+within a RAM and VRAM budget. Memory is estimated from GGUF metadata before
+loading (weights plus KV cache), least recently used idle models are
+evicted to make room, and models in use are reference counted so they are
+never unloaded in the middle of a request.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional
+
+from ..utils.gguf import GGUFError, read_gguf
+from ..utils.hardware import llama_supports_gpu_offload
+from .kv_memory import estimate_kv_memory
+from .model_loader import ModelLoader
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MemoryEstimate:
+    """Memory a loaded model is expected to occupy."""
+
+    ram_bytes: int
+    vram_bytes: int
+
+    def __add__(self, other: "MemoryEstimate") -> "MemoryEstimate":
+        return MemoryEstimate(
+            self.ram_bytes + other.ram_bytes, self.vram_bytes + other.vram_bytes
+        )
+
+
+def estimate_model_memory(model_path: str,
+                          context_size: int = 2048,
+                          gpu_layers: int = -1,
+                          gpu_offload: Optional[bool] = None,
+                          type_k: Optional[str] = None,
+                          type_v: Optional[str] = None) -> MemoryEstimate:
+    """
+    Estimate the RAM and VRAM a model needs without loading it.
+
+    Weights take the size of their tensor data in the GGUF file. The KV
+    cache is n_ctx x layers x KV heads x (key + value head size) elements
+    of the cache type (kv_memory.estimate_kv_memory). Offloaded layers
+    move their share of both to the GPU.
+
+    Args:
+        model_path: Path to the GGUF model file
+        context_size: Context window size the model will be loaded with
+        gpu_layers: Number of GPU layers (-1 for all, 0 for CPU only)
+        gpu_offload: Whether llama.cpp can offload to a GPU (detected if not given)
+        type_k: KV cache type of keys (f16 if not given)
+        type_v: KV cache type of values (f16 if not given)
+
+    Returns:
+        Estimated memory use
+    """
+    weights = os.path.getsize(model_path)
+    kv = 0
+    n_layer = 0
+    try:
+        gguf = read_gguf(model_path)
+        weights = gguf.tensor_bytes
+        n_layer = int(gguf.block_count or 0)
+    except (GGUFError, TypeError, ValueError) as e:
+        logger.warning(
+            f"Could not read GGUF header of {model_path}, "
+            f"estimating from file size: {e}"
+        )
+    else:
+        try:
+            kv = estimate_kv_memory(
+                gguf, context_size, type_k=type_k or "f16", type_v=type_v or "f16"
+            ).kv_bytes
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Could not estimate the KV cache of {model_path}: {e}")
+
+    if gpu_offload is None:
+        gpu_offload = llama_supports_gpu_offload()
+    if not gpu_offload or gpu_layers == 0:
+        share = 0.0
+    elif gpu_layers < 0 or not n_layer or gpu_layers >= n_layer:
+        share = 1.0
+    else:
+        share = gpu_layers / n_layer
+
+    total = weights + kv
+    vram = int(total * share)
+    return MemoryEstimate(ram_bytes=total - vram, vram_bytes=vram)
+
+
+@dataclass
+class _PoolEntry:
+    name: str
+    model_path: str
+    loader_kwargs: Dict[str, Any]
+    loader: Optional[ModelLoader] = None
+    estimate: Optional[MemoryEstimate] = None
+    refcount: int = 0
+    loading: bool = False
+    loads: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class ModelPool:
+    """Loads models by name on demand and keeps them within a memory budget."""
+
+    def __init__(self,
+                 models: Optional[Dict[str, str]] = None,
+                 ram_budget_bytes: Optional[int] = None,
+                 vram_budget_bytes: Optional[int] = None,
+                 max_models: Optional[int] = None,
+                 loader_factory: Callable[..., ModelLoader] = ModelLoader,
+                 gpu_offload: Optional[bool] = None,
+                 **loader_defaults: Any):
+        """
+        Initialize the pool.
+
+        Args:
+            models: Model names mapped to GGUF paths to register
+            ram_budget_bytes: RAM all resident models may use (None for no limit)
+            vram_budget_bytes: VRAM all resident models may use (None for no limit)
+            max_models: Maximum number of resident models (None for no limit)
+            loader_factory: Creates the ModelLoader for a model path
+            gpu_offload: Whether llama.cpp can offload to a GPU (detected if not given)
+            **loader_defaults: ModelLoader arguments shared by every model,
+                e.g. gpu_layers, context_size, type_k or type_v
+        """
+        self.ram_budget_bytes = ram_budget_bytes
+        self.vram_budget_bytes = vram_budget_bytes
+        self.max_models = max_models
+        self.loader_factory = loader_factory
+        self.gpu_offload = gpu_offload
+        self.loader_defaults = loader_defaults
+        self._entries: Dict[str, _PoolEntry] = {}
+        # Resident (or loading) models, least recently used first
+        self._resident: "OrderedDict[str, _PoolEntry]" = OrderedDict()
+        self._cond = threading.Condition()
+        self.evictions = 0
+
+        for name, model_path in (models or {}).items():
+            self.register(name, model_path)
+
+    def register(self, name: str, model_path: str, **loader_kwargs: Any):
+        """
+        Make a model available under a name.
+
+        Args:
+            name: Name used to acquire the model
+            model_path: Path to the GGUF model file
+            **loader_kwargs: ModelLoader arguments overriding the pool defaults
+        """
+        with self._cond:
+            if name in self._resident:
+                raise ValueError(f"Model {name} is loaded and cannot be re-registered")
+            self._entries[name] = _PoolEntry(
+                name, model_path, {**self.loader_defaults, **loader_kwargs}
+            )
+
+    def names(self) -> List[str]:
+        """Registered model names."""
+        return list(self._entries)
+
+    def loaded(self) -> List[str]:
+        """Resident model names, least recently used first."""
+        with self._cond:
+            return [name for name, entry in self._resident.items() if not entry.loading]
+
+    def used(self) -> MemoryEstimate:
+        """Estimated memory held by resident and loading models."""
+        with self._cond:
+            return self._used()
+
+    def acquire(self, name: str, timeout: Optional[float] = 30.0) -> Optional["Llama"]:
+        """
+        Get a loaded model, loading it and evicting idle models if needed.
+
+        Every successful acquire must be paired with a release.
+
+        Args:
+            name: Registered model name
+            timeout: Seconds to wait for models in use to be released when
+                there is no room (None waits indefinitely)
+
+        Returns:
+            Loaded Llama model instance, or None if unknown, too large for
+            the budget, not loadable, or no room was freed in time
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            entry = self._entries.get(name)
+            if entry is None:
+                logger.error(f"Unknown model: {name}")
+                return None
+
+            while True:
+                if entry.loader is not None and entry.loader.model is not None:
+                    return self._checkout(entry)
+                if not entry.loading:
+                    if entry.estimate is None:
+                        entry.estimate = self._estimate(entry)
+                    if not self._fits_alone(entry.estimate):
+                        logger.error(
+                            f"Model {name} needs more memory than the pool budget"
+                        )
+                        return None
+                    if self._make_room(entry.estimate):
+                        entry.loading = True
+                        self._resident[name] = entry
+                        break
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    logger.error(f"Timed out waiting for room to load model {name}")
+                    return None
+                self._cond.wait(remaining)
+
+        # Load outside the lock so other models stay usable meanwhile
+        logger.info(f"Loading pooled model {name}")
+        loader = None
+        model = None
+        try:
+            loader = self.loader_factory(entry.model_path, **entry.loader_kwargs)
+            model = loader.load_model()
+        except Exception as e:
+            logger.error(f"Failed to load pooled model {name}: {e}")
+
+        with self._cond:
+            entry.loading = False
+            if model is None:
+                self._resident.pop(name, None)
+                self._cond.notify_all()
+                return None
+            entry.loader = loader
+            entry.loads += 1
+            self._cond.notify_all()
+            return self._checkout(entry)
+
+    def release(self, name: str):
+        """
+        Return a model obtained from acquire.
+
+        Args:
+            name: Name the model was acquired under
+        """
+        with self._cond:
+            entry = self._entries.get(name)
+            if entry is None or entry.refcount == 0:
+                logger.warning(f"Release of model {name} that is not in use")
+                return
+            entry.refcount -= 1
+            entry.last_used = time.monotonic()
+            self._cond.notify_all()
+
+    @contextmanager
+    def use(self, name: str, timeout: Optional[float] = 30.0) -> Iterator["Llama"]:
+        """
+        Acquire a model for the duration of a with block.
+
+        Raises:
+            RuntimeError: If the model could not be acquired
+        """
+        model = self.acquire(name, timeout=timeout)
+        if model is None:
+            raise RuntimeError(f"Model {name} is not available")
+        try:
+            yield model
+        finally:
+            self.release(name)
+
+    def unload(self, name: str) -> bool:
+        """
+        Unload a model that is not in use.
+
+        Returns:
+            True if the model was unloaded
+        """
+        with self._cond:
+            entry = self._resident.get(name)
+            if entry is None or entry.loading:
+                return False
+            if entry.refcount > 0:
+                logger.warning(
+                    f"Not unloading model {name}: {entry.refcount} request(s) using it"
+                )
+                return False
+            self._unload(entry)
+            self._cond.notify_all()
+            return True
+
+    def close(self):
+        """Unload every model that is not in use."""
+        for name in list(self._resident):
+            self.unload(name)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool usage statistics."""
+        with self._cond:
+            used = self._used()
+            return {
+                "models": {
+                    name: {
+                        "loaded": entry.loader is not None,
+                        "in_use": entry.refcount,
+                        "loads": entry.loads,
+                        "ram_bytes": (
+                            entry.estimate.ram_bytes if entry.estimate else None
+                        ),
+                        "vram_bytes": (
+                            entry.estimate.vram_bytes if entry.estimate else None
+                        ),
+                    }
+                    for name, entry in self._entries.items()
+                },
+                "ram_used_bytes": used.ram_bytes,
+                "vram_used_bytes": used.vram_bytes,
+                "ram_budget_bytes": self.ram_budget_bytes,
+                "vram_budget_bytes": self.vram_budget_bytes,
+                "evictions": self.evictions,
+            }
+
+    def _estimate(self, entry: _PoolEntry) -> MemoryEstimate:
+        """Memory estimate for a registered model."""
+        if self.gpu_offload is None:
+            self.gpu_offload = llama_supports_gpu_offload()
+        try:
+            return estimate_model_memory(
+                entry.model_path,
+                context_size=entry.loader_kwargs.get("context_size", 2048),
+                gpu_layers=entry.loader_kwargs.get("gpu_layers", -1),
+                gpu_offload=self.gpu_offload,
+                type_k=entry.loader_kwargs.get("type_k"),
+                type_v=entry.loader_kwargs.get("type_v"),
+            )
+        except OSError as e:
+            # Let the loader report the missing file
+            logger.warning(f"Could not estimate memory of {entry.model_path}: {e}")
+            return MemoryEstimate(0, 0)
+
+    def _used(self) -> MemoryEstimate:
+        total = MemoryEstimate(0, 0)
+        for entry in self._resident.values():
+            total = total + entry.estimate
+        return total
+
+    def _fits(self, used: MemoryEstimate, count: int) -> bool:
+        if self.ram_budget_bytes is not None and used.ram_bytes > self.ram_budget_bytes:
+            return False
+        if (
+            self.vram_budget_bytes is not None
+            and used.vram_bytes > self.vram_budget_bytes
+        ):
+            return False
+        return self.max_models is None or count <= self.max_models
+
+    def _fits_alone(self, estimate: MemoryEstimate) -> bool:
+        return self._fits(estimate, 1)
+
+    def _make_room(self, estimate: MemoryEstimate) -> bool:
+        """Evict idle models, least recently used first, until `estimate` fits."""
+        idle = [
+            entry
+            for entry in self._resident.values()
+            if entry.refcount == 0 and not entry.loading
+        ]
+
+        # Evict nothing unless evicting enough is possible
+        used = self._used() + estimate
+        count = len(self._resident) + 1
+        victims = []
+        for entry in idle:
+            if self._fits(used, count):
+                break
+            victims.append(entry)
+            used = MemoryEstimate(used.ram_bytes - entry.estimate.ram_bytes,
+                                  used.vram_bytes - entry.estimate.vram_bytes)
+            count -= 1
+        if not self._fits(used, count):
+            return False
+
+        for entry in victims:
+            logger.info(f"Evicting idle model {entry.name} to make room")
+            self._unload(entry)
+            self.evictions += 1
+        return True
+
+    def _checkout(self, entry: _PoolEntry) -> "Llama":
+        entry.refcount += 1
+        entry.last_used = time.monotonic()
+        self._resident.move_to_end(entry.name)
+        return entry.loader.model
+
+    def _unload(self, entry: _PoolEntry):
+        entry.loader.unload_model()
+        entry.loader = None
+        self._resident.pop(entry.name, None)
@@ -0,0 +1,123 @@
+"""
+Chat prompt rendering for AI Room application.
+
+Turns a list of chat messages into the same prompt text and tokens that
+Llama.create_chat_completion would build, for code paths that drive
+llama.cpp directly instead of going through the high-level API.
+"""
+
+import logging
+import weakref
+from typing import Dict, List, Tuple
+from llama_cpp import Llama
+from llama_cpp import llama_chat_format
+
+logger = logging.getLogger(__name__)
+
+_formatters: "weakref.WeakKeyDictionary[Llama, llama_chat_format.ChatFormatter]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_chat_formatter(model: Llama) -> llama_chat_format.ChatFormatter:
+    """
+    Get the chat formatter used for a model.
+
+    The GGUF chat template is used when the model ships one, otherwise the
+    llama-2 format that llama-cpp-python also falls back to.
+
+    Args:
+        model: Loaded Llama model instance
+
+    Returns:
+        Chat formatter callable
+    """
+    formatter = _formatters.get(model)
+    if formatter is not None:
+        return formatter
+
+    template = model.metadata.get("tokenizer.chat_template")
+    if template:
+        eos_id = model.token_eos()
+        bos_id = model.token_bos()
+        formatter = llama_chat_format.Jinja2ChatFormatter(
+            template=template,
+            eos_token=model._model.token_get_text(eos_id) if eos_id != -1 else "",
+            bos_token=model._model.token_get_text(bos_id) if bos_id != -1 else "",
+            stop_token_ids=[eos_id],
+        )
+    else:
+        logger.debug("Model has no chat template, using llama-2 format")
+        formatter = llama_chat_format.format_llama2
+
+    _formatters[model] = formatter
+    return formatter
+
+
+def render_chat_prompt(
+    model: Llama, messages: List[Dict[str, str]]
+) -> Tuple[str, List[str], bool]:
+    """
+    Render chat messages into a prompt string.
+
+    Args:
+        model: Loaded Llama model instance
+        messages: Conversation messages with role and content
+
+    Returns:
+        Tuple of (prompt text, stop strings, whether special tokens are included)
+    """
+    result = get_chat_formatter(model)(messages=messages)
+    stop = result.stop or []
+    if isinstance(stop, str):
+        stop = [stop]
+    return result.prompt, [s for s in stop if s], result.added_special
+
+
+def tokenize_chat_prompt(
+    model: Llama, messages: List[Dict[str, str]]
+) -> Tuple[List[int], List[str]]:
+    """
+    Render and tokenize chat messages.
+
+    Args:
+        model: Loaded Llama model instance
+        messages: Conversation messages with role and content
+
+    Returns:
+        Tuple of (prompt tokens, stop strings)
+    """
+    prompt, stop, added_special = render_chat_prompt(model, messages)
+    tokens = model.tokenize(
+        prompt.encode("utf-8"), add_bos=not added_special, special=True
+    )
+    return tokens, stop
+
+
+def chat_prefix_tokens(model: Llama, messages: List[Dict[str, str]]) -> List[int]:
+    """
+    Tokens that every continuation of a conversation starts with.
+
+    The conversation is rendered followed by two different user turns and
+    the common token prefix is returned, so the result stops before any
+    token that depends on what is said next.
+
+    Args:
+        model: Loaded Llama model instance
+        messages: Conversation prefix, typically just the system message
+
+    Returns:
+        Stable prefix tokens
+    """
+    first, _ = tokenize_chat_prompt(
+        model, messages + [{"role": "user", "content": "a"}]
+    )
+    second, _ = tokenize_chat_prompt(
+        model, messages + [{"role": "user", "content": "b"}]
+    )
+    n = 0
+    for x, y in zip(first, second):
+        if x != y:
+            break
+        n += 1
+    return first[:n]
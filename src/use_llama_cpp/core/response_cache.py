@@ -0,0 +1,319 @@
+"""
+Response cache for AI Room application.
+
+Deterministic requests (temperature 0 or a fixed seed) always produce the
+same reply for the same model, conversation and sampling settings, so the
+reply can be stored and returned again without generating. Lookups go
+through three tiers:
+
+- an in-memory LRU of exact matches,
+- an optional sqlite file of exact matches shared across processes and restarts,
+- an optional semantic tier that matches the latest user message by
+  embedding similarity when everything before it is identical.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .tuning import model_fingerprint
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_messages(messages: Sequence[Dict[str, str]]) -> List[Tuple[str, str]]:
+    """Messages as (role, content) with runs of whitespace collapsed."""
+    return [
+        (
+            message["role"].strip().lower(),
+            _WHITESPACE.sub(" ", message["content"]).strip(),
+        )
+        for message in messages
+    ]
+
+
+def is_deterministic(params: Dict[str, Any]) -> bool:
+    """Whether sampling settings always produce the same output."""
+    return params.get("temperature", 1.0) <= 0 or params.get("seed") is not None
+
+
+def _digest(*parts: Any) -> str:
+    data = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Tiered cache of replies to deterministic requests."""
+
+    def __init__(self,
+                 capacity: int = 1024,
+                 path: Optional[str] = None,
+                 max_disk_entries: Optional[int] = 100_000,
+                 embedder: Optional[Callable[[str], Sequence[float]]] = None,
+                 similarity_threshold: float = 0.95,
+                 semantic_capacity: int = 4096):
+        """
+        Initialize the cache.
+
+        Args:
+            capacity: Replies kept in the in-memory LRU
+            path: sqlite file for the on-disk tier (None keeps the cache in memory)
+            max_disk_entries: Replies kept on disk, least recently used are
+                pruned (None for no limit)
+            embedder: Returns an embedding for a text; enables the semantic
+                tier. Embeddings are normalized here, any dimension works
+            similarity_threshold: Minimum cosine similarity of the latest user
+                message for a semantic hit
+            semantic_capacity: Messages indexed by the semantic tier
+        """
+        self.capacity = capacity
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.semantic_capacity = semantic_capacity
+
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, "
+                "response TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_used "
+                "ON responses (last_used)"
+            )
+            self._db.commit()
+
+        # Semantic tier: rows of unit vectors with the context and reply they belong to
+        self._vectors: Optional[np.ndarray] = None
+        self._semantic: List[Tuple[str, str]] = []
+        self._next_row = 0
+
+        self.hits = {"memory": 0, "disk": 0, "semantic": 0}
+        self.misses = 0
+
+    def get(
+        self, model: Any, messages: Sequence[Dict[str, str]], params: Dict[str, Any]
+    ) -> Optional[str]:
+        """
+        Look up the reply to a conversation.
+
+        Args:
+            model: Llama instance or model path
+            messages: Conversation ending with the message to reply to
+            params: Sampling settings of the request
+
+        Returns:
+            Cached reply or None on a miss (always None for non-deterministic settings)
+        """
+        if not is_deterministic(params):
+            return None
+        fingerprint = model_fingerprint(model)
+        normalized = normalize_messages(messages)
+        key = _digest(fingerprint, normalized, params)
+
+        with self._lock:
+            response = self._memory.get(key)
+            if response is not None:
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return response
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE responses SET last_used = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+                    self._db.commit()
+                    self._remember(key, row[0])
+                    self.hits["disk"] += 1
+                    return row[0]
+
+        if self.embedder is not None and normalized:
+            response = self._semantic_lookup(
+                _digest(fingerprint, normalized[:-1], params), normalized[-1][1]
+            )
+            if response is not None:
+                return response
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(
+        self,
+        model: Any,
+        messages: Sequence[Dict[str, str]],
+        params: Dict[str, Any],
+        response: str,
+    ) -> bool:
+        """
+        Store the reply to a conversation.
+
+        Args:
+            model: Llama instance or model path
+            messages: Conversation the reply answers
+            params: Sampling settings of the request
+            response: Generated reply
+
+        Returns:
+            True if stored (False for non-deterministic settings)
+        """
+        if not is_deterministic(params) or not response:
+            return False
+        fingerprint = model_fingerprint(model)
+        normalized = normalize_messages(messages)
+        key = _digest(fingerprint, normalized, params)
+
+        with self._lock:
+            self._remember(key, response)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO responses (key, response, last_used) "
+                        "VALUES (?, ?, ?)",
+                        (key, response, time.time()),
+                    )
+                    self._prune_disk()
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not write response cache {self.path}: {e}")
+
+        if self.embedder is not None and normalized:
+            self._semantic_add(
+                _digest(fingerprint, normalized[:-1], params),
+                normalized[-1][1],
+                response,
+            )
+        return True
+
+    def clear(self):
+        """Drop all cached replies, including the on-disk tier."""
+        with self._lock:
+            self._memory.clear()
+            self._vectors = None
+            self._semantic = []
+            self._next_row = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def close(self):
+        """Close the on-disk tier."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache usage statistics."""
+        with self._lock:
+            disk_entries = None
+            if self._db is not None:
+                disk_entries = self._db.execute(
+                    "SELECT COUNT(*) FROM responses"
+                ).fetchone()[0]
+            lookups = sum(self.hits.values()) + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+                "semantic_entries": len(self._semantic),
+                "hits": dict(self.hits),
+                "misses": self.misses,
+                "hit_rate": sum(self.hits.values()) / lookups if lookups else 0.0,
+            }
+
+    def _remember(self, key: str, response: str):
+        """Insert into the memory tier; the caller holds the lock."""
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self):
+        """Delete least recently used disk entries over the limit, under the lock."""
+        if self.max_disk_entries is None:
+            return
+        excess = (
+            self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            - self.max_disk_entries
+        )
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        try:
+            vector = np.asarray(self.embedder(text), dtype=np.float32).ravel()
+        except Exception as e:
+            logger.warning(f"Embedding failed, semantic cache skipped: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def _semantic_lookup(self, context: str, text: str) -> Optional[str]:
+        """Reply to the most similar message with the same preceding context."""
+        with self._lock:
+            if self._vectors is None:
+                return None
+        vector = self._embed(text)
+        if vector is None:
+            return None
+
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                return None
+            scores = self._vectors[:len(self._semantic)] @ vector
+            for row in np.argsort(scores)[::-1]:
+                if scores[row] < self.similarity_threshold:
+                    break
+                row_context, response = self._semantic[row]
+                if row_context == context:
+                    self.hits["semantic"] += 1
+                    logger.debug(
+                        f"Semantic cache hit with similarity {scores[row]:.3f}"
+                    )
+                    return response
+        return None
+
+    def _semantic_add(self, context: str, text: str, response: str):
+        """Index a message; the oldest row is overwritten once full."""
+        vector = self._embed(text)
+        if vector is None:
+            return
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._vectors = np.zeros(
+                    (self.semantic_capacity, vector.shape[0]), dtype=np.float32
+                )
+                self._semantic = []
+                self._next_row = 0
+            row = self._next_row
+            self._vectors[row] = vector
+            if row < len(self._semantic):
+                self._semantic[row] = (context, response)
+            else:
+                self._semantic.append((context, response))
+            self._next_row = (row + 1) % self.semantic_capacity
@@ -0,0 +1,523 @@
+"""
+Continuous batching scheduler for AI Room application.
+
+Several generation requests share one llama.cpp context, each in its own
+KV-cache sequence. Every step packs the next token of all decoding
+sequences, plus chunks of newly admitted prompts, into a single
+llama_decode call, so N concurrent sessions cost one forward pass per
+token instead of N. Requests join and leave at token boundaries.
+
+Optionally one extra sequence holds a shared prompt prefix (typically the
+system prompt). New requests that start with it get its KV cells copied
+instead of evaluating those tokens again.
+"""
+
+import codecs
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Deque, Dict, Iterator, List, Optional
+from collections import deque
+
+import llama_cpp
+import llama_cpp._internals as internals
+from llama_cpp import Llama
+
+from .prompt import tokenize_chat_prompt
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SamplingParams:
+    """Sampling settings for a scheduled request."""
+
+    max_tokens: int = 100
+    temperature: float = 0.3
+    top_p: float = 0.9
+    top_k: int = 40
+    seed: Optional[int] = None
+    stop: List[str] = field(default_factory=list)
+
+
+class ScheduledRequest:
+    """Handle for a request submitted to the BatchScheduler."""
+
+    def __init__(self, prompt_tokens: List[int], params: SamplingParams):
+        self.prompt_tokens = list(prompt_tokens)
+        self.params = params
+        self.output_tokens: List[int] = []
+        self.text = ""
+        self.finish_reason: Optional[str] = None
+        self.submitted_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._done = threading.Event()
+        self._deltas: "queue.Queue[Optional[str]]" = queue.Queue()
+
+    @property
+    def done(self) -> bool:
+        """Whether generation has finished."""
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> str:
+        """
+        Block until generation finishes.
+
+        Args:
+            timeout: Seconds to wait, None to wait forever
+
+        Returns:
+            Generated text (partial if the timeout expired)
+        """
+        self._done.wait(timeout)
+        return self.text
+
+    def stream(self) -> Iterator[str]:
+        """Yield text deltas as the scheduler produces them."""
+        while True:
+            delta = self._deltas.get()
+            if delta is None:
+                return
+            yield delta
+
+    def _emit(self, delta: str):
+        if delta:
+            self.text += delta
+            self._deltas.put(delta)
+
+    def _finish(self, reason: str):
+        self.finish_reason = reason
+        self.finished_at = time.perf_counter()
+        self._deltas.put(None)
+        self._done.set()
+
+
+class _Slot:
+    """Per-sequence decoding state."""
+
+    def __init__(
+        self, seq_id: int, request: ScheduledRequest, sampler: internals.LlamaSampler
+    ):
+        self.seq_id = seq_id
+        self.request = request
+        self.sampler = sampler
+        self.n_past = 0
+        self.n_prompt_done = 0
+        self.pending_token: Optional[int] = None
+        self.batch_index = -1
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.held = ""
+
+    @property
+    def prefilling(self) -> bool:
+        return self.n_prompt_done < len(self.request.prompt_tokens)
+
+
+class BatchScheduler:
+    """Interleaves decode steps of many requests into shared llama.cpp batches."""
+
+    def __init__(self,
+                 model: Llama,
+                 n_parallel: int = 4,
+                 context_per_sequence: Optional[int] = None,
+                 n_batch: Optional[int] = None,
+                 share_prefix: bool = False):
+        """
+        Initialize the scheduler.
+
+        A dedicated llama.cpp context is created on the model's weights with
+        room for n_parallel sequences, so the model's own context (used by
+        AIChat) is left untouched.
+
+        Args:
+            model: Loaded Llama model instance
+            n_parallel: Maximum number of sequences decoded together
+            context_per_sequence: Context tokens per sequence (defaults to the
+                model's n_ctx)
+            n_batch: Maximum tokens per llama_decode call (defaults to the
+                model's n_batch)
+            share_prefix: Reserve a sequence for set_shared_prefix; costs one
+                more sequence worth of context
+        """
+        self.model = model
+        self.n_parallel = n_parallel
+        self.context_per_sequence = context_per_sequence or model.n_ctx()
+        self.n_batch = n_batch or model.n_batch
+        if self.n_batch < n_parallel:
+            raise ValueError("n_batch must be at least n_parallel")
+
+        self.share_prefix = share_prefix
+        n_seq = n_parallel + 1 if share_prefix else n_parallel
+        params = llama_cpp.llama_context_params.from_buffer_copy(model.context_params)
+        params.n_ctx = self.context_per_sequence * n_seq
+        params.n_batch = self.n_batch
+        params.n_ubatch = min(params.n_ubatch, self.n_batch)
+        params.n_seq_max = n_seq
+        if hasattr(params, "kv_unified"):
+            params.kv_unified = True
+        self._ctx = internals.LlamaContext(
+            model=model._model, params=params, verbose=model.verbose
+        )
+        self._batch = internals.LlamaBatch(
+            n_tokens=self.n_batch, embd=0, n_seq_max=1, verbose=model.verbose
+        )
+
+        self._pending: Deque[ScheduledRequest] = deque()
+        self._slots: Dict[int, _Slot] = {}
+        self._lock = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        # The prefix sequence id comes right after the request sequences
+        self._prefix_seq = n_parallel
+        self._prefix_tokens: List[int] = []
+        self._next_prefix: Optional[List[int]] = None
+
+        self.prompt_tokens_processed = 0
+        self.prefix_tokens_reused = 0
+        self.tokens_generated = 0
+        self.busy_time = 0.0
+
+    def submit(
+        self, prompt_tokens: List[int], params: Optional[SamplingParams] = None
+    ) -> ScheduledRequest:
+        """
+        Queue a tokenized prompt for generation.
+
+        Args:
+            prompt_tokens: Prompt token ids
+            params: Sampling settings
+
+        Returns:
+            Handle to wait on or stream from
+        """
+        params = params or SamplingParams()
+        if not prompt_tokens:
+            raise ValueError("Prompt must contain at least one token")
+        if len(prompt_tokens) >= self.context_per_sequence:
+            raise ValueError(
+                f"Prompt has {len(prompt_tokens)} tokens but each sequence holds "
+                f"{self.context_per_sequence}"
+            )
+
+        request = ScheduledRequest(prompt_tokens, params)
+        with self._lock:
+            self._pending.append(request)
+            self._lock.notify()
+        return request
+
+    def submit_text(
+        self, prompt: str, params: Optional[SamplingParams] = None
+    ) -> ScheduledRequest:
+        """Queue a raw text prompt for generation."""
+        return self.submit(self.model.tokenize(prompt.encode("utf-8")), params)
+
+    def submit_chat(
+        self, messages: List[Dict[str, str]], params: Optional[SamplingParams] = None
+    ) -> ScheduledRequest:
+        """Queue a chat conversation, rendered with the model's chat template."""
+        params = params or SamplingParams()
+        tokens, stop = tokenize_chat_prompt(self.model, messages)
+        params = replace(
+            params, stop=list(params.stop) + [s for s in stop if s not in params.stop]
+        )
+        return self.submit(tokens, params)
+
+    def set_shared_prefix(self, tokens: List[int]):
+        """
+        Evaluate a prompt prefix once and share it with later requests.
+
+        The prefix is evaluated at the start of the next step. Requests
+        admitted afterwards whose prompt starts with it skip those tokens.
+        Requests already decoding keep their own copy, so the prefix can be
+        replaced at any time.
+
+        Args:
+            tokens: Prefix tokens, or an empty list to drop the shared prefix
+        """
+        if not self.share_prefix:
+            raise RuntimeError("Scheduler was created without share_prefix")
+        if len(tokens) >= self.context_per_sequence:
+            raise ValueError(
+                f"Prefix has {len(tokens)} tokens but each sequence holds "
+                f"{self.context_per_sequence}"
+            )
+        with self._lock:
+            self._next_prefix = list(tokens)
+
+    @property
+    def shared_prefix(self) -> List[int]:
+        """Tokens of the evaluated shared prefix."""
+        return list(self._prefix_tokens)
+
+    @property
+    def active_requests(self) -> int:
+        """Number of requests currently holding a sequence."""
+        return len(self._slots)
+
+    @property
+    def pending_requests(self) -> int:
+        """Number of requests waiting for a free sequence."""
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        """Aggregate throughput statistics."""
+        busy = self.busy_time or float("inf")
+        return {
+            "active_requests": self.active_requests,
+            "pending_requests": self.pending_requests,
+            "prompt_tokens": self.prompt_tokens_processed,
+            "generated_tokens": self.tokens_generated,
+            "prefix_tokens_reused": self.prefix_tokens_reused,
+            "busy_seconds": self.busy_time,
+            "prompt_tokens_per_second": self.prompt_tokens_processed / busy,
+            "generated_tokens_per_second": self.tokens_generated / busy,
+        }
+
+    def step(self) -> int:
+        """
+        Run one scheduling step: admit requests, decode one batch, sample.
+
+        Returns:
+            Number of tokens evaluated in this step (0 when idle)
+        """
+        with self._lock:
+            prefix, self._next_prefix = self._next_prefix, None
+        if prefix is not None:
+            self._evaluate_prefix(prefix)
+        with self._lock:
+            self._admit()
+        if not self._slots:
+            return 0
+
+        started = time.perf_counter()
+        n_tokens = self._fill_batch()
+        try:
+            self._ctx.decode(self._batch)
+        except Exception as e:
+            logger.error(f"Batch decode failed: {e}")
+            for slot in list(self._slots.values()):
+                self._release(slot, "error")
+            return 0
+
+        for slot in list(self._slots.values()):
+            if slot.batch_index >= 0:
+                self._sample(slot)
+
+        self.busy_time += time.perf_counter() - started
+        return n_tokens
+
+    def run_until_idle(self):
+        """Step until every submitted request has finished."""
+        while self.step() or self._pending:
+            pass
+
+    def start(self):
+        """Run the scheduling loop on a background thread."""
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._loop, name="batch-scheduler", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Batch scheduler started with {self.n_parallel} sequences")
+
+    def stop(self):
+        """Stop the background loop; unfinished requests are cancelled."""
+        with self._lock:
+            self._running = False
+            self._lock.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for slot in list(self._slots.values()):
+            self._release(slot, "cancelled")
+        while self._pending:
+            self._pending.popleft()._finish("cancelled")
+
+    def close(self):
+        """Stop the scheduler and free its llama.cpp context."""
+        self.stop()
+        self._batch.close()
+        self._ctx.close()
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                while self._running and not self._pending and not self._slots:
+                    self._lock.wait()
+                if not self._running:
+                    return
+            self.step()
+
+    def _admit(self):
+        """Move pending requests into free sequences."""
+        free = [
+            seq_id for seq_id in range(self.n_parallel) if seq_id not in self._slots
+        ]
+        while free and self._pending:
+            request = self._pending.popleft()
+            seq_id = free.pop(0)
+            slot = _Slot(seq_id, request, self._make_sampler(request.params))
+            n_prefix = len(self._prefix_tokens)
+            prompt = request.prompt_tokens
+            # At least one prompt token must still be decoded to get logits
+            if (
+                n_prefix
+                and len(prompt) > n_prefix
+                and prompt[:n_prefix] == self._prefix_tokens
+            ):
+                self._ctx.kv_cache_seq_cp(self._prefix_seq, seq_id, -1, -1)
+                slot.n_past = slot.n_prompt_done = n_prefix
+                self.prefix_tokens_reused += n_prefix
+            self._slots[seq_id] = slot
+
+    def _evaluate_prefix(self, tokens: List[int]):
+        """Decode the shared prefix into its own sequence."""
+        self._ctx.kv_cache_seq_rm(self._prefix_seq, -1, -1)
+        self._prefix_tokens = []
+        if not tokens:
+            return
+
+        started = time.perf_counter()
+        batch = self._batch.batch
+        for start in range(0, len(tokens), self.n_batch):
+            chunk = tokens[start:start + self.n_batch]
+            for i, token in enumerate(chunk):
+                batch.token[i] = token
+                batch.pos[i] = start + i
+                batch.n_seq_id[i] = 1
+                batch.seq_id[i][0] = self._prefix_seq
+                batch.logits[i] = False
+            batch.n_tokens = len(chunk)
+            try:
+                self._ctx.decode(self._batch)
+            except Exception as e:
+                logger.error(f"Shared prefix decode failed: {e}")
+                self._ctx.kv_cache_seq_rm(self._prefix_seq, -1, -1)
+                return
+
+        self._prefix_tokens = list(tokens)
+        self.prompt_tokens_processed += len(tokens)
+        self.busy_time += time.perf_counter() - started
+        logger.debug(f"Shared prefix of {len(tokens)} tokens evaluated")
+
+    def _make_sampler(self, params: SamplingParams) -> internals.LlamaSampler:
+        sampler = internals.LlamaSampler()
+        if params.temperature <= 0:
+            sampler.add_greedy()
+            return sampler
+        sampler.add_top_k(params.top_k)
+        sampler.add_top_p(params.top_p, 1)
+        sampler.add_temp(params.temperature)
+        sampler.add_dist(
+            params.seed if params.seed is not None else llama_cpp.LLAMA_DEFAULT_SEED
+        )
+        return sampler
+
+    def _fill_batch(self) -> int:
+        """Pack decode tokens first, then prompt chunks, into the shared batch."""
+        batch = self._batch.batch
+        batch.n_tokens = 0
+
+        def add(slot: _Slot, token: int, logits: bool):
+            i = batch.n_tokens
+            batch.token[i] = token
+            batch.pos[i] = slot.n_past
+            batch.n_seq_id[i] = 1
+            batch.seq_id[i][0] = slot.seq_id
+            batch.logits[i] = logits
+            batch.n_tokens += 1
+            slot.n_past += 1
+            if logits:
+                slot.batch_index = i
+
+        slots = sorted(self._slots.values(), key=lambda s: s.prefilling)
+        for slot in slots:
+            slot.batch_index = -1
+            if not slot.prefilling:
+                add(slot, slot.pending_token, True)
+
+        for slot in slots:
+            if not slot.prefilling:
+                continue
+            budget = self.n_batch - batch.n_tokens
+            if budget <= 0:
+                break
+            prompt = slot.request.prompt_tokens
+            chunk = prompt[slot.n_prompt_done:slot.n_prompt_done + budget]
+            for offset, token in enumerate(chunk):
+                last = slot.n_prompt_done + offset == len(prompt) - 1
+                add(slot, token, last)
+            slot.n_prompt_done += len(chunk)
+            self.prompt_tokens_processed += len(chunk)
+
+        return batch.n_tokens
+
+    def _sample(self, slot: _Slot):
+        """Sample the next token for a slot and check stop conditions."""
+        request = slot.request
+        token = slot.sampler.sample(self._ctx, slot.batch_index)
+        slot.sampler.accept(token)
+        self.tokens_generated += 1
+
+        if request.first_token_at is None:
+            request.first_token_at = time.perf_counter()
+
+        if llama_cpp.llama_vocab_is_eog(self.model._model.vocab, token):
+            self._flush(slot)
+            self._release(slot, "stop")
+            return
+
+        request.output_tokens.append(token)
+        slot.pending_token = token
+        piece = self.model.detokenize([token])
+        if self._emit_text(slot, slot.decoder.decode(piece)):
+            self._release(slot, "stop")
+        elif (
+            len(request.output_tokens) >= request.params.max_tokens
+            or slot.n_past >= self.context_per_sequence
+        ):
+            self._flush(slot)
+            self._release(slot, "length")
+
+    def _emit_text(self, slot: _Slot, text: str) -> bool:
+        """
+        Emit decoded text, holding back anything that could start a stop string.
+
+        Returns:
+            True if a stop string was found
+        """
+        text = slot.held + text
+        stops = slot.request.params.stop
+        for stop in stops:
+            index = text.find(stop)
+            if index != -1:
+                slot.request._emit(text[:index])
+                slot.held = ""
+                return True
+
+        hold = 0
+        for stop in stops:
+            for size in range(min(len(stop) - 1, len(text)), 0, -1):
+                if text.endswith(stop[:size]):
+                    hold = max(hold, size)
+                    break
+        slot.request._emit(text[:len(text) - hold])
+        slot.held = text[len(text) - hold:]
+        return False
+
+    def _flush(self, slot: _Slot):
+        slot.request._emit(slot.held + slot.decoder.decode(b"", final=True))
+        slot.held = ""
+
+    def _release(self, slot: _Slot, reason: str):
+        """Free a slot's sequence so a pending request can take it."""
+        self._ctx.kv_cache_seq_rm(slot.seq_id, -1, -1)
+        slot.sampler.close()
+        self._slots.pop(slot.seq_id, None)
+        slot.request._finish(reason)
+        logger.debug(f"Sequence {slot.seq_id} finished ({reason})")
@@ -0,0 +1,169 @@
+"""
+Chat session persistence for AI Room application.
+
+A session file holds the conversation history plus the llama.cpp state
+that the conversation left in the model's context, so a restarted process
+can continue the chat without evaluating the history again.
+
+File layout (little endian):
+
+    magic        4 bytes   b"ULCS"
+    version      uint16
+    flags        uint16    bit 0: KV state is zlib-compressed
+    header size  uint32
+    header       JSON      history, model identity, token and state sizes
+    tokens       int32 * n_tokens
+    state        llama.cpp state data (optionally compressed)
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_cpp import Llama, LlamaState
+
+from .kv_cache import model_identity
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"ULCS"
+VERSION = 1
+FLAG_COMPRESSED = 1
+_PREAMBLE = struct.Struct("<4sHHI")
+
+
+@dataclass
+class SessionData:
+    """Contents of a session file."""
+
+    history: List[Dict[str, str]]
+    system_prompt: str
+    model_id: str
+    tokens: np.ndarray
+    state: Optional[LlamaState]
+
+
+def save_session(path: str,
+                 history: List[Dict[str, str]],
+                 system_prompt: str,
+                 model: Llama,
+                 state: Optional[LlamaState],
+                 compress: bool = False):
+    """
+    Write a session file.
+
+    Args:
+        path: Destination file; written to a temporary file and renamed
+        history: Conversation history
+        system_prompt: Current system prompt
+        model: Model the state belongs to
+        state: Saved llama.cpp state for the conversation, or None for history only
+        compress: zlib-compress the KV state
+    """
+    tokens = np.asarray(state.input_ids[:state.n_tokens] if state else [], dtype="<i4")
+    payload = memoryview(state.llama_state)[:state.llama_state_size] if state else b""
+    flags = 0
+    if compress and payload:
+        payload = zlib.compress(payload, 1)
+        flags |= FLAG_COMPRESSED
+
+    header = json.dumps({
+        "history": history,
+        "system_prompt": system_prompt,
+        "model_id": model_identity(model),
+        "n_tokens": int(tokens.size),
+        "state_size": state.llama_state_size if state else 0,
+        "payload_size": len(payload),
+        "seed": state.seed if state else None,
+    }).encode("utf-8")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, VERSION, flags, len(header)))
+        f.write(header)
+        f.write(tokens.tobytes())
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def load_session(path: str, model: Llama) -> SessionData:
+    """
+    Read a session file.
+
+    The file is memory-mapped so an uncompressed KV state is handed to
+    llama.cpp straight from the page cache instead of being read into a
+    Python buffer first.
+
+    Args:
+        path: Session file to read
+        model: Model the session will be resumed on
+
+    Returns:
+        Session contents; state is None if the file has none or it was
+        saved for a different model or context size
+
+    Raises:
+        ValueError: If the file is not a session file
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    state = None
+    flags = 0
+    view = None
+    try:
+        magic, version, flags, header_size = _PREAMBLE.unpack_from(mapped, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a session file (or unsupported version): {path}")
+
+        offset = _PREAMBLE.size
+        header: Dict[str, Any] = json.loads(mapped[offset:offset + header_size])
+        offset += header_size
+        n_tokens = header["n_tokens"]
+        tokens = np.frombuffer(
+            mapped, dtype="<i4", count=n_tokens, offset=offset
+        ).astype(np.intc)
+        offset += n_tokens * 4
+
+        if header["model_id"] != model_identity(model):
+            logger.warning("Session was saved for a different model, KV state ignored")
+        elif header["state_size"]:
+            view = memoryview(mapped)[offset:offset + header["payload_size"]]
+            payload = zlib.decompress(view) if flags & FLAG_COMPRESSED else view
+            input_ids = np.zeros(model.n_ctx(), dtype=np.intc)
+            input_ids[:n_tokens] = tokens
+            state = LlamaState(
+                input_ids=input_ids,
+                # load_state broadcasts this row over the restored tokens
+                scores=np.zeros((1, model.n_vocab()), dtype=np.single),
+                n_tokens=n_tokens,
+                llama_state=payload,
+                llama_state_size=header["state_size"],
+                seed=header["seed"],
+            )
+    finally:
+        # An uncompressed state reads straight from the mapping, which is
+        # then unmapped once the state is dropped
+        if state is None or flags & FLAG_COMPRESSED:
+            if view is not None:
+                view.release()
+            try:
+                mapped.close()
+            except BufferError:
+                # A view is still exported; the mapping is closed with it
+                # and the exception being raised, if any, is kept
+                logger.debug("Session file mapping still in use, not closed")
+
+    return SessionData(
+        history=header["history"],
+        system_prompt=header["system_prompt"],
+        model_id=header["model_id"],
+        tokens=tokens,
+        state=state,
+    )
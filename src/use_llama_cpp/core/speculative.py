@@ -0,0 +1,319 @@
+"""
+Speculative decoding for AI Room application.
+
+Decoding on CPU is bound by memory bandwidth: evaluating several tokens in
+one batch costs little more than evaluating one. A drafter guesses the
+next few tokens cheaply, the target model verifies them in a single batch
+and keeps the prefix it agrees with, so each forward pass can yield more
+than one token. Output is unchanged; only speed depends on how often the
+guesses are right.
+
+Two drafters are provided:
+
+- PromptLookupDrafter finds the latest n-gram earlier in the context and
+  proposes what followed it. It needs no extra model and does well when the
+  output copies the input (summaries, code edits).
+- DraftModelDrafter runs a small GGUF model that shares the target's
+  vocabulary.
+
+SpeculativeDraft wraps either one, measures the acceptance rate and stops
+drafting while it is too low to pay off. SpeculativeLlama runs the target
+model without computing logits for every prompt token.
+"""
+
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Sequence, Tuple
+
+import llama_cpp
+import numpy as np
+import numpy.typing as npt
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel
+
+logger = logging.getLogger(__name__)
+
+_EMPTY = np.array([], dtype=np.intc)
+
+
+class PromptLookupDrafter(LlamaDraftModel):
+    """Drafts by copying what followed the latest n-gram earlier in the context."""
+
+    def __init__(self, max_ngram_size: int = 3, num_pred_tokens: int = 8):
+        """
+        Initialize the drafter.
+
+        Unlike llama-cpp-python's LlamaPromptLookupDecoding, which takes the
+        first occurrence, the most recent one is used: while copying a
+        passage it is the one being copied.
+
+        Args:
+            max_ngram_size: Longest n-gram matched, shorter ones are tried after
+            num_pred_tokens: Tokens proposed per match
+        """
+        self.max_ngram_size = max_ngram_size
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(
+        self, input_ids: npt.NDArray[np.intc], /, **kwargs: Any
+    ) -> npt.NDArray[np.intc]:
+        length = len(input_ids)
+        for size in range(min(self.max_ngram_size, length - 1), 0, -1):
+            # Windows starting before the final n-gram itself
+            windows = np.lib.stride_tricks.sliding_window_view(input_ids[:-1], size)
+            matches = np.flatnonzero((windows == input_ids[-size:]).all(axis=1))
+            if len(matches):
+                start = matches[-1] + size
+                return input_ids[start:start + self.num_pred_tokens]
+        return _EMPTY
+
+
+class DraftModelDrafter(LlamaDraftModel):
+    """Drafts greedily with a small model sharing the target's vocabulary."""
+
+    def __init__(self, model: Llama, num_pred_tokens: int = 8):
+        """
+        Initialize the drafter.
+
+        Args:
+            model: Loaded draft model; its context must be as large as the target's
+            num_pred_tokens: Tokens proposed per call
+        """
+        self.model = model
+        self.num_pred_tokens = num_pred_tokens
+
+    @classmethod
+    def load(
+        cls, model_path: str, n_ctx: int, num_pred_tokens: int = 8, **kwargs: Any
+    ) -> "DraftModelDrafter":
+        """
+        Load a draft GGUF model.
+
+        Args:
+            model_path: Path to the draft GGUF model
+            n_ctx: Context size, the same as the target's
+            num_pred_tokens: Tokens proposed per call
+            **kwargs: Further Llama arguments (n_gpu_layers, n_threads, ...)
+
+        Returns:
+            Drafter owning the loaded model
+        """
+        model = Llama(model_path=model_path, n_ctx=n_ctx, verbose=False, **kwargs)
+        return cls(model, num_pred_tokens)
+
+    def compatible_with(self, target: Llama) -> bool:
+        """Whether the draft model tokenizes like the target."""
+        if self.model.n_vocab() != target.n_vocab():
+            return False
+        if (self.model.token_bos(), self.model.token_eos()) != (
+            target.token_bos(),
+            target.token_eos(),
+        ):
+            return False
+        sample = "def main():\n    print('Hello, world!')  # 123"
+        return self.model.tokenize(sample.encode("utf-8")) == target.tokenize(
+            sample.encode("utf-8")
+        )
+
+    def __call__(
+        self, input_ids: npt.NDArray[np.intc], /, **kwargs: Any
+    ) -> npt.NDArray[np.intc]:
+        model = self.model
+        tokens = input_ids.tolist()
+        n_draft = min(self.num_pred_tokens, model.n_ctx() - len(tokens) - 1)
+        if n_draft <= 0 or not tokens:
+            return _EMPTY
+
+        # Keep the matching prefix of the previous call in the KV cache, but
+        # evaluate at least the last token to get fresh logits
+        cached = model.input_ids[:model.n_tokens]
+        n = 0
+        limit = min(len(cached), len(tokens) - 1)
+        while n < limit and cached[n] == tokens[n]:
+            n += 1
+        model.n_tokens = n
+        model.eval(tokens[n:])
+
+        draft = []
+        for _ in range(n_draft):
+            logits = np.ctypeslib.as_array(
+                model._ctx.get_logits_ith(-1), shape=(model.n_vocab(),)
+            )
+            token = int(np.argmax(logits))
+            if llama_cpp.llama_vocab_is_eog(model._model.vocab, token):
+                break
+            draft.append(token)
+            model.eval([token])
+        return np.array(draft, dtype=np.intc)
+
+    def close(self):
+        """Free the draft model."""
+        self.model.close()
+
+
+class SpeculativeDraft(LlamaDraftModel):
+    """Drafter wrapper that tracks acceptance and pauses drafting that does not pay."""
+
+    def __init__(self,
+                 drafter: LlamaDraftModel,
+                 min_acceptance: float = 0.3,
+                 window: int = 32,
+                 pause_steps: int = 256):
+        """
+        Initialize the wrapper.
+
+        Args:
+            drafter: Drafter that proposes tokens
+            min_acceptance: Acceptance rate below which drafting is paused;
+                rejected tokens cost batch compute and the drafter's own time
+            window: Number of recent drafts the rate is measured over
+            pause_steps: Decode steps without drafting before trying again,
+                since the content being generated may have changed
+        """
+        self.drafter = drafter
+        self.min_acceptance = min_acceptance
+        self.window = window
+        self.pause_steps = pause_steps
+
+        # Proposed counts drafts when made; drafted and accepted once verified
+        self.proposed_tokens = 0
+        self.drafted_tokens = 0
+        self.accepted_tokens = 0
+        self.paused_count = 0
+        self._recent: Deque[Tuple[int, int]] = deque(maxlen=window)
+        self._paused_for = 0
+        # Length of the context and the draft proposed for it, settled on the next call
+        self._last_length = 0
+        self._last_draft = _EMPTY
+
+    @property
+    def enabled(self) -> bool:
+        """Whether drafting is currently active."""
+        return self._paused_for == 0
+
+    @property
+    def acceptance_rate(self) -> float:
+        """Fraction of drafted tokens the target model accepted."""
+        return (
+            self.accepted_tokens / self.drafted_tokens if self.drafted_tokens else 0.0
+        )
+
+    @property
+    def max_tokens(self) -> int:
+        """Most tokens proposed by one draft."""
+        return getattr(self.drafter, "num_pred_tokens", 16)
+
+    def stats(self) -> Dict[str, Any]:
+        """Acceptance statistics."""
+        recent_drafted = sum(d for d, _ in self._recent)
+        return {
+            "drafted_tokens": self.drafted_tokens,
+            "accepted_tokens": self.accepted_tokens,
+            "acceptance_rate": self.acceptance_rate,
+            "recent_acceptance_rate": (
+                sum(a for _, a in self._recent) / recent_drafted
+                if recent_drafted
+                else None
+            ),
+            "enabled": self.enabled,
+            "paused_count": self.paused_count,
+        }
+
+    def __call__(
+        self, input_ids: npt.NDArray[np.intc], /, **kwargs: Any
+    ) -> npt.NDArray[np.intc]:
+        self._settle(input_ids)
+
+        if self._paused_for > 0:
+            self._paused_for -= 1
+            if self._paused_for == 0:
+                logger.debug("Resuming speculative drafting")
+            return _EMPTY
+
+        try:
+            draft = np.asarray(self.drafter(input_ids, **kwargs), dtype=np.intc)
+        except Exception as e:
+            logger.warning(f"Drafter failed, decoding without a draft: {e}")
+            draft = _EMPTY
+        self._last_length = len(input_ids)
+        # The drafter may return a view of input_ids, which generation overwrites
+        self._last_draft = draft.copy()
+        self.proposed_tokens += len(draft)
+        return draft
+
+    def _settle(self, input_ids: npt.NDArray[np.intc]):
+        """Count how much of the previous draft the target accepted."""
+        draft, start = self._last_draft, self._last_length
+        self._last_draft = _EMPTY
+        if not len(draft):
+            return
+        # Generation after a full accept adds the draft plus one sampled token;
+        # anything else is a new request
+        produced = len(input_ids) - start
+        if produced < 1 or produced > len(draft) + 1:
+            return
+        # The last produced token is the target's own, sampled after the
+        # accepted prefix (a correction or, after a full accept, a bonus token)
+        accepted = 0
+        while (
+            accepted < produced - 1 and input_ids[start + accepted] == draft[accepted]
+        ):
+            accepted += 1
+
+        self.drafted_tokens += len(draft)
+        self.accepted_tokens += accepted
+        self._recent.append((len(draft), accepted))
+
+        if len(self._recent) == self.window:
+            drafted = sum(d for d, _ in self._recent)
+            rate = sum(a for _, a in self._recent) / drafted
+            if rate < self.min_acceptance:
+                logger.info(
+                    f"Speculative acceptance {rate:.0%} is below "
+                    f"{self.min_acceptance:.0%}, pausing drafting for "
+                    f"{self.pause_steps} steps"
+                )
+                self._recent.clear()
+                self._paused_for = self.pause_steps
+                self.paused_count += 1
+
+    def close(self):
+        """Release the wrapped drafter."""
+        close = getattr(self.drafter, "close", None)
+        if close is not None:
+            close()
+
+
+class SpeculativeLlama(Llama):
+    """
+    Llama that only computes logits at every position for verification batches.
+
+    llama-cpp-python turns on logits for all tokens whenever a draft model
+    is set. That includes the prompt, where projecting every token onto the
+    vocabulary costs more than the rest of prefill for long prompts. Here
+    batches no longer than a draft plus the sampled token get all logits,
+    longer ones only the last. Sampling reads logits from the context, so
+    the scores buffer is not filled and logprobs are not available, as
+    without speculative decoding.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        logits_all = kwargs.get("logits_all", False)
+        super().__init__(*args, **kwargs)
+        self._logits_all = logits_all
+
+    def eval(self, tokens: Sequence[int]):
+        draft = self.draft_model
+        if draft is None or self._logits_all:
+            return super().eval(tokens)
+
+        verify = len(tokens) <= getattr(draft, "max_tokens", 16) + 1
+        self._ctx.kv_cache_seq_rm(-1, self.n_tokens, -1)
+        for i in range(0, len(tokens), self.n_batch):
+            batch = tokens[i:i + self.n_batch]
+            n_past = self.n_tokens
+            self._batch.set_batch(batch=batch, n_past=n_past, logits_all=verify)
+            self._ctx.decode(self._batch)
+            self.input_ids[n_past:n_past + len(batch)] = batch
+            self.n_tokens += len(batch)
+            self._requires_eval = False
@@ -0,0 +1,175 @@
+"""
+Tokenization for AI Room application.
+
+Tokenizer tokenizes, detokenizes and counts texts in batches. llama.cpp
+tokenizes with the vocabulary only, not the context, so these calls do
+not have to wait for a running generation. Token IDs are kept in an LRU
+cache keyed by a hash of the text: counting a conversation that grew by
+one turn only tokenizes the new message. The chat template's own tokens
+(role markers, separators, BOS and the generation prompt) are counted by
+rendering the conversation with empty messages.
+
+A tokenizer only holds a weak reference to its model, so the tokenizers
+shared per model do not keep unloaded models alive.
+"""
+
+import hashlib
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence, Tuple
+
+from llama_cpp import Llama
+
+from .prompt import tokenize_chat_prompt
+
+logger = logging.getLogger(__name__)
+
+_tokenizers: "weakref.WeakKeyDictionary[Llama, Tokenizer]" = weakref.WeakKeyDictionary()
+_tokenizers_lock = threading.Lock()
+
+
+class Tokenizer:
+    """Batched tokenization with an LRU cache of token IDs per text."""
+
+    def __init__(self, model: Llama, capacity: int = 4096):
+        """
+        Initialize the tokenizer.
+
+        Args:
+            model: Loaded Llama model instance
+            capacity: Texts whose token IDs are kept, least recently used are dropped
+        """
+        self._model = weakref.ref(model)
+        self.capacity = capacity
+        self._tokens: "OrderedDict[Tuple[str, bool, bool], Tuple[int, ...]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def model(self) -> Llama:
+        """The model, raising ReferenceError once it was garbage-collected."""
+        model = self._model()
+        if model is None:
+            raise ReferenceError("The tokenizer's model was garbage-collected")
+        return model
+
+    @classmethod
+    def for_model(cls, model: Llama) -> "Tokenizer":
+        """The shared tokenizer of a model, created on first use."""
+        with _tokenizers_lock:
+            tokenizer = _tokenizers.get(model)
+            if tokenizer is None:
+                tokenizer = _tokenizers[model] = cls(model)
+            return tokenizer
+
+    def tokenize(
+        self, texts: Sequence[str], add_bos: bool = False, special: bool = False
+    ) -> List[List[int]]:
+        """
+        Tokenize texts.
+
+        Args:
+            texts: Texts to tokenize
+            add_bos: Prepend the BOS token if the model uses one
+            special: Parse special tokens such as <|im_start|> in the text
+
+        Returns:
+            Token IDs of every text
+        """
+        return [list(self._cached(text, add_bos, special)) for text in texts]
+
+    def detokenize(
+        self, token_lists: Sequence[Sequence[int]], special: bool = False
+    ) -> List[str]:
+        """
+        Turn token IDs back into text.
+
+        Args:
+            token_lists: Token IDs of every text
+            special: Render special tokens instead of dropping them
+
+        Returns:
+            Text of every token list; invalid UTF-8 is replaced
+        """
+        return [
+            self.model.detokenize(list(tokens), special=special).decode(
+                "utf-8", errors="replace"
+            )
+            for tokens in token_lists
+        ]
+
+    def count(
+        self, texts: Sequence[str], add_bos: bool = False, special: bool = False
+    ) -> List[int]:
+        """Number of tokens of every text, see tokenize()."""
+        return [len(self._cached(text, add_bos, special)) for text in texts]
+
+    def message_tokens(self, message: Dict[str, str]) -> List[int]:
+        """Token IDs of a chat message's content, without template tokens."""
+        return list(self._cached(message["content"], False, False))
+
+    def count_messages(
+        self, messages: List[Dict[str, str]], exact: bool = False
+    ) -> int:
+        """
+        Prompt tokens of a conversation rendered with the model's chat template.
+
+        The count is the template tokens plus the cached content tokens of
+        every message. Tokens can merge across a content boundary, so it may
+        differ from the rendered prompt by a token or two per message.
+
+        Args:
+            messages: Conversation messages with role and content
+            exact: Render and tokenize the whole prompt instead, bypassing the cache
+
+        Returns:
+            Tokens the prompt takes, including the generation prompt
+        """
+        if exact:
+            return len(tokenize_chat_prompt(self.model, messages)[0])
+        empty = [{**message, "content": ""} for message in messages]
+        template, _ = tokenize_chat_prompt(self.model, empty)
+        return len(template) + sum(
+            len(self._cached(m["content"], False, False)) for m in messages
+        )
+
+    def _cached(self, text: str, add_bos: bool, special: bool) -> Tuple[int, ...]:
+        """Token IDs of a text, tokenized on first use."""
+        key = (hashlib.sha256(text.encode("utf-8")).hexdigest(), add_bos, special)
+        with self._lock:
+            tokens = self._tokens.get(key)
+            if tokens is not None:
+                self._tokens.move_to_end(key)
+                self.hits += 1
+                return tokens
+            self.misses += 1
+
+        tokens = tuple(
+            self.model.tokenize(text.encode("utf-8"), add_bos=add_bos, special=special)
+        )
+        with self._lock:
+            self._tokens[key] = tokens
+            while len(self._tokens) > self.capacity:
+                self._tokens.popitem(last=False)
+        return tokens
+
+    def clear(self):
+        """Drop all cached token IDs."""
+        with self._lock:
+            self._tokens.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache usage statistics."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._tokens),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,300 @@
+"""
+Thread auto-tuning for AI Room application.
+
+llama-cpp-python defaults to os.cpu_count() // 2 decode threads and
+os.cpu_count() prompt threads. Both are wrong in containers whose cgroup
+CPU quota is below the host's core count (threads then fight over the
+quota) and often wrong on hyperthreaded hosts, where decoding is memory
+bound and extra sibling threads only add contention.
+
+recommend_config picks settings from the cgroup quota and core topology.
+calibrate measures candidate thread counts on the loaded model and the
+result is cached per host and model, so the sweep runs once.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from ..utils.hardware import CPUInfo, probe_cpu
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "use_llama_cpp",
+    "tuning.json",
+)
+
+# Bytes hashed from the start, middle and end of a model file
+FINGERPRINT_SAMPLE_BYTES = 1024 * 1024
+
+_fingerprints: Dict[Tuple[str, int, int], str] = {}
+_fingerprints_lock = threading.Lock()
+
+_CALIBRATION_TEXT = (
+    "The quick brown fox jumps over the lazy dog while the cat sleeps in the sun. "
+)
+
+
+@dataclass
+class TuningConfig:
+    """Thread settings passed to Llama."""
+
+    n_threads: int
+    n_threads_batch: int
+    # Where the settings came from: "heuristic", "calibrated" or "cache"
+    source: str = "heuristic"
+
+
+def cgroup_cpu_limit(cgroup_root: str = "/sys/fs/cgroup") -> Optional[float]:
+    """
+    Read the CPU quota of this process's cgroup.
+
+    Args:
+        cgroup_root: Mount point of the cgroup filesystem
+
+    Returns:
+        Number of CPUs the quota allows, or None if unlimited or unknown
+    """
+    # cgroup v2: "quota period" or "max period"
+    try:
+        with open(os.path.join(cgroup_root, "cpu.max")) as f:
+            quota, period = f.read().split()[:2]
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+
+    # cgroup v1: quota of -1 means unlimited
+    for directory in ("cpu", "cpu,cpuacct", "cpuacct,cpu"):
+        try:
+            with open(os.path.join(cgroup_root, directory, "cpu.cfs_quota_us")) as f:
+                quota = int(f.read())
+            with open(os.path.join(cgroup_root, directory, "cpu.cfs_period_us")) as f:
+                period = int(f.read())
+        except (OSError, ValueError):
+            continue
+        return quota / period if quota > 0 and period > 0 else None
+    return None
+
+
+def available_cpus(
+    cpu: Optional[CPUInfo] = None, cgroup_limit: Optional[float] = None
+) -> int:
+    """CPUs this process can actually keep busy: affinity capped by the cgroup quota."""
+    cpu = cpu or probe_cpu()
+    available = cpu.usable_cores
+    if cgroup_limit is not None:
+        available = min(available, max(1, math.floor(cgroup_limit)))
+    return max(1, available)
+
+
+def recommend_config(cpu: Optional[CPUInfo] = None,
+                     cgroup_limit: Optional[float] = None,
+                     gpu_layers: int = 0) -> TuningConfig:
+    """
+    Pick thread counts from CPU topology and the cgroup quota.
+
+    Decoding one token at a time is memory bound, so it gets one thread per
+    physical core; prompt processing is compute bound and gets every CPU the
+    quota allows.
+
+    Args:
+        cpu: CPU information (probed if not given)
+        cgroup_limit: CPU quota in CPUs (read from the cgroup if not given)
+        gpu_layers: Layers offloaded to the GPU (-1 for all)
+
+    Returns:
+        Recommended settings
+    """
+    cpu = cpu or probe_cpu()
+    if cgroup_limit is None:
+        cgroup_limit = cgroup_cpu_limit()
+    available = available_cpus(cpu, cgroup_limit)
+
+    # Share of the physical cores we may run on
+    threads_per_core = max(1, cpu.logical_cores // max(1, cpu.physical_cores))
+    decode = max(1, min(available, cpu.usable_cores // threads_per_core))
+
+    if gpu_layers != 0:
+        # The GPU does the heavy lifting; CPU threads mostly feed it
+        decode = min(decode, 4)
+        available = min(available, 4)
+
+    return TuningConfig(n_threads=decode, n_threads_batch=available)
+
+
+def model_fingerprint(model: Any) -> str:
+    """
+    Identify a model file by content rather than by path.
+
+    Hashing a multi-gigabyte file would take seconds, so the size and three
+    samples (header, middle and end of the tensor data) are hashed instead.
+    Results are remembered per path, size and modification time.
+
+    Args:
+        model: Llama instance or model path
+
+    Returns:
+        Hex digest
+    """
+    path = str(getattr(model, "model_path", model))
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return hashlib.sha256(path.encode("utf-8")).hexdigest()
+
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _fingerprints_lock:
+        fingerprint = _fingerprints.get(key)
+    if fingerprint is not None:
+        return fingerprint
+
+    digest = hashlib.sha256(str(stat.st_size).encode("ascii"))
+    with open(path, "rb") as f:
+        last = stat.st_size - FINGERPRINT_SAMPLE_BYTES
+        for offset in (0, stat.st_size // 2, last):
+            f.seek(max(offset, 0))
+            digest.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+    fingerprint = digest.hexdigest()
+    with _fingerprints_lock:
+        _fingerprints[key] = fingerprint
+    return fingerprint
+
+
+def host_key(
+    cpu: Optional[CPUInfo] = None, cgroup_limit: Optional[float] = None
+) -> str:
+    """Identify the host and the share of it this process gets."""
+    cpu = cpu or probe_cpu()
+    return (
+        f"{socket.gethostname()}:{cpu.model_name}:{available_cpus(cpu, cgroup_limit)}"
+    )
+
+
+def _load_cache(path: str) -> Dict[str, Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_cached_config(
+    key: str, path: str = DEFAULT_CACHE_PATH
+) -> Optional[TuningConfig]:
+    """Look up calibrated settings for a (host, model) key."""
+    entry = _load_cache(path).get(key)
+    if entry is None:
+        return None
+    try:
+        return TuningConfig(**{**entry, "source": "cache"})
+    except TypeError:
+        logger.warning(f"Ignoring malformed tuning cache entry for {key}")
+        return None
+
+
+def save_cached_config(key: str, config: TuningConfig, path: str = DEFAULT_CACHE_PATH):
+    """Store calibrated settings for a (host, model) key."""
+    cache = _load_cache(path)
+    cache[key] = asdict(config)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def thread_candidates(limit: int) -> List[int]:
+    """Thread counts worth measuring up to `limit`."""
+    candidates = {limit, max(1, limit // 2), max(1, (3 * limit) // 4)}
+    n = 1
+    while n < limit:
+        candidates.add(n)
+        n *= 2
+    return sorted(candidates)
+
+
+def set_threads(model: "Llama", n_threads: int, n_threads_batch: int):
+    """Change a loaded model's thread counts without recreating its context."""
+    import llama_cpp
+
+    llama_cpp.llama_set_n_threads(model._ctx.ctx, n_threads, n_threads_batch)
+    model.n_threads = model.context_params.n_threads = n_threads
+    model.n_threads_batch = model.context_params.n_threads_batch = n_threads_batch
+
+
+def calibrate(model: "Llama",
+              candidates: Optional[List[int]] = None,
+              prompt_tokens: int = 128,
+              decode_tokens: int = 16) -> TuningConfig:
+    """
+    Measure thread counts on the loaded model and keep the fastest.
+
+    Prompt processing and decoding are timed separately for every candidate,
+    so n_threads and n_threads_batch are chosen independently. The model's
+    KV cache is cleared afterwards.
+
+    Args:
+        model: Loaded Llama model instance
+        candidates: Thread counts to try (default: thread_candidates of the
+            available CPUs)
+        prompt_tokens: Prompt length used to time prompt processing
+        decode_tokens: Tokens decoded one at a time to time decoding
+
+    Returns:
+        Fastest settings, applied to the model
+    """
+    candidates = candidates or thread_candidates(
+        available_cpus(cgroup_limit=cgroup_cpu_limit())
+    )
+    text = _CALIBRATION_TEXT * (prompt_tokens // 8 + 1)
+    tokens = model.tokenize(text.encode("utf-8"))[
+        : min(prompt_tokens, model.n_batch, model.n_ctx() - decode_tokens)
+    ]
+
+    best_prefill = best_decode = None
+    for n in candidates:
+        set_threads(model, n, n)
+        model.reset()
+        start = time.perf_counter()
+        model.eval(tokens)
+        prefill = len(tokens) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for token in tokens[:decode_tokens]:
+            model.eval([token])
+        decode = decode_tokens / (time.perf_counter() - start)
+
+        logger.debug(
+            f"{n} threads: prompt {prefill:.1f} tok/s, decode {decode:.1f} tok/s"
+        )
+        if best_prefill is None or prefill > best_prefill[1]:
+            best_prefill = (n, prefill)
+        if best_decode is None or decode > best_decode[1]:
+            best_decode = (n, decode)
+
+    model.reset()
+    config = TuningConfig(
+        n_threads=best_decode[0],
+        n_threads_batch=best_prefill[0],
+        source="calibrated",
+    )
+    set_threads(model, config.n_threads, config.n_threads_batch)
+    logger.info(
+        f"Calibrated threads: decode {config.n_threads} ({best_decode[1]:.1f} tok/s), "
+        f"prompt {config.n_threads_batch} ({best_prefill[1]:.1f} tok/s)"
+    )
+    return config
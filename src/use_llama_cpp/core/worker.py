@@ -0,0 +1,147 @@
+"""
+Per-model inference threads for AI Room application.
+
+llama.cpp contexts are not thread-safe and a generation must not be
+interleaved with other calls on the same context. ModelWorker gives every
+model a single owner thread: callers submit jobs to its queue and the
+thread runs them one after the other. Async callers await the results
+without blocking their event loop.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_workers: "weakref.WeakKeyDictionary[Any, ModelWorker]" = weakref.WeakKeyDictionary()
+_workers_lock = threading.Lock()
+
+_DONE = object()
+
+
+class ModelWorker:
+    """Single thread that owns every llama.cpp call on one model."""
+
+    def __init__(self, name: str = "inference"):
+        """
+        Start the worker thread.
+
+        Args:
+            name: Thread name
+        """
+        self._jobs: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def for_model(cls, model: Any) -> "ModelWorker":
+        """The shared worker of a model, created on first use."""
+        with _workers_lock:
+            worker = _workers.get(model)
+            if worker is None or not worker.is_alive():
+                worker = cls(name=f"inference-{id(model):x}")
+                _workers[model] = worker
+                # The thread goes away with the model
+                weakref.finalize(model, worker.close, False)
+            return worker
+
+    def is_alive(self) -> bool:
+        """Whether the thread still accepts jobs."""
+        return self._thread.is_alive()
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """
+        Queue a call on the worker thread.
+
+        Returns:
+            Future with the call's result; cancelling it before it starts
+            skips the call
+        """
+        future: Future = Future()
+        self._jobs.put((future, fn, args, kwargs))
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a call on the worker thread and await its result."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    async def stream(
+        self, make_iterator: Callable[[], Iterator[Any]]
+    ) -> AsyncIterator[Any]:
+        """
+        Drive a blocking iterator on the worker thread and yield its items.
+
+        The whole iteration is one job, so nothing else runs on the model in
+        between items. When the consumer stops early (break, aclose, task
+        cancellation) the iterator is closed at its next item, which stops
+        llama.cpp from decoding further tokens.
+
+        Args:
+            make_iterator: Creates the iterator on the worker thread
+
+        Yields:
+            Items of the iterator
+        """
+        loop = asyncio.get_running_loop()
+        items: "asyncio.Queue[Any]" = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def put(item: Any):
+            try:
+                loop.call_soon_threadsafe(items.put_nowait, item)
+            except RuntimeError:
+                # The consumer's event loop is gone
+                cancelled.set()
+
+        def produce():
+            iterator = make_iterator()
+            try:
+                for item in iterator:
+                    if cancelled.is_set():
+                        logger.debug("Stream cancelled by consumer")
+                        break
+                    put(item)
+            except Exception as e:
+                put(e)
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+                put(_DONE)
+
+        job = self.submit(produce)
+        try:
+            while True:
+                item = await items.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            cancelled.set()
+            job.cancel()
+
+    def close(self, wait: bool = True):
+        """Stop the thread after the queued jobs."""
+        self._jobs.put(None)
+        if wait and threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            future, fn, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
@@ -0,0 +1,18 @@
+"""
+OpenAI-compatible HTTP server for AI Room application.
+"""
+
+from typing import TYPE_CHECKING
+
+from .._lazy import lazy_attributes
+
+if TYPE_CHECKING:
+    from .app import InferenceServer
+    from .workers import PreforkServer
+
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    "InferenceServer": ".app",
+    "PreforkServer": ".workers",
+})
+
+__all__ = ["InferenceServer", "PreforkServer"]
@@ -0,0 +1,715 @@
+"""
+OpenAI-compatible HTTP server for AI Room application.
+
+Serves /v1/chat/completions, /v1/completions and, for models loaded in
+embedding mode, /v1/embeddings from a single loaded model.
+Requests are placed on a bounded queue and executed one at a time on a
+dedicated inference thread; when the queue is full new requests are
+rejected with HTTP 429 so clients can back off.
+
+Given a ModelLoader instead of a model, the server answers health checks
+while the model loads in the background and only accepts completions (and
+reports ready on /ready) once the model is warm.
+
+Structured output is requested with an OpenAI response_format, or with
+llama.cpp server style "json_schema" or "grammar" (GBNF) fields; the
+compiled grammars are cached across requests.
+
+/tokenize and /detokenize convert between text and token IDs, and count
+the prompt tokens of chat messages, without waiting for the queue.
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+from llama_cpp import Llama, LlamaGrammar
+
+from ..core.embeddings import Embedder
+from ..core.grammar import ANY_JSON, GrammarCache, default_grammar_cache
+from ..core.metrics import MetricsRegistry, RequestTimer, default_registry
+from ..core.tokenizer import Tokenizer
+
+if TYPE_CHECKING:
+    from ..core.model_loader import ModelLoader
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+# Request fields forwarded to llama.cpp, everything else is ignored
+SAMPLING_PARAMS = {
+    "max_tokens", "temperature", "top_p", "top_k", "min_p", "stop", "seed",
+    "presence_penalty", "frequency_penalty", "repeat_penalty",
+}
+CHAT_PARAMS = SAMPLING_PARAMS | {"messages"}
+COMPLETION_PARAMS = SAMPLING_PARAMS | {"prompt", "suffix", "echo"}
+
+_DONE = object()
+
+
+class HTTPError(Exception):
+    """Error that is reported to the client as an OpenAI-style error body."""
+
+    def __init__(
+        self, status: int, message: str, error_type: str = "invalid_request_error"
+    ):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.error_type = error_type
+
+
+@dataclass
+class _Job:
+    """A queued inference request."""
+
+    method: Callable[..., Any]
+    params: Dict[str, Any]
+    stream: bool
+    output: "asyncio.Queue[Any]" = field(default_factory=asyncio.Queue)
+    cancelled: bool = False
+    # Record completion metrics (not meaningful for embeddings)
+    metrics: bool = True
+
+
+class InferenceServer:
+    """Minimal OpenAI-compatible HTTP server around one loaded Llama model."""
+
+    def __init__(self,
+                 model: Optional[Llama] = None,
+                 model_name: str = "local-model",
+                 host: str = "127.0.0.1",
+                 port: int = 8000,
+                 max_queue_size: int = 16,
+                 metrics: Optional[MetricsRegistry] = None,
+                 loader: Optional["ModelLoader"] = None,
+                 grammar_cache: Optional[GrammarCache] = None):
+        """
+        Initialize the server.
+
+        Args:
+            model: Loaded Llama model instance shared by all requests
+            model_name: Model id reported by /v1/models and in responses
+            host: Interface to bind
+            port: TCP port to bind (0 picks a free port)
+            max_queue_size: Requests allowed to wait before returning 429
+            metrics: Registry exported on /metrics (default: the shared
+                default_registry)
+            loader: Loader whose model is served once it is ready, instead of
+                `model`
+            grammar_cache: Compiled grammars for structured output
+                (default: the shared default_grammar_cache)
+        """
+        if max_queue_size < 1:
+            raise ValueError("max_queue_size must be at least 1")
+        if model is None and loader is None:
+            raise ValueError("Either model or loader is required")
+
+        self._model = model
+        self.loader = loader
+        self.model_name = model_name
+        self.host = host
+        self.port = port
+        self.max_queue_size = max_queue_size
+        self.metrics = metrics if metrics is not None else default_registry
+        self.grammar_cache = (
+            grammar_cache if grammar_cache is not None else default_grammar_cache
+        )
+        self._queue: Optional[asyncio.Queue] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._worker: Optional[asyncio.Task] = None
+        # llama.cpp contexts are not thread-safe, so all calls share one thread
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="inference"
+        )
+        self._active = 0
+        self._embedder: Optional[Embedder] = None
+        self._routes: Dict[
+            Tuple[str, str],
+            Callable[[Dict[str, Any], asyncio.StreamWriter], Awaitable[None]],
+        ] = {
+            ("POST", "/v1/chat/completions"): self._handle_chat_completions,
+            ("POST", "/v1/completions"): self._handle_completions,
+            ("POST", "/v1/embeddings"): self._handle_embeddings,
+            ("POST", "/tokenize"): self._handle_tokenize,
+            ("POST", "/detokenize"): self._handle_detokenize,
+            ("GET", "/v1/models"): self._handle_models,
+            ("GET", "/health"): self._handle_health,
+            ("GET", "/ready"): self._handle_ready,
+            ("GET", "/metrics"): self._handle_metrics,
+        }
+
+    @property
+    def model(self) -> Optional[Llama]:
+        """Model requests run on, None until the loader is ready."""
+        if self._model is not None:
+            return self._model
+        return self.loader.model if self.ready else None
+
+    @property
+    def ready(self) -> bool:
+        """Whether completions are accepted."""
+        return self._model is not None or self.loader.ready.is_set()
+
+    @property
+    def status(self) -> str:
+        """'ok' when ready, otherwise the loader state ('loading', 'failed', ...)."""
+        return "ok" if self.ready else self.loader.state
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests waiting or currently running."""
+        waiting = self._queue.qsize() if self._queue else 0
+        return waiting + self._active
+
+    async def start(self):
+        """Bind the listening socket and start the inference worker."""
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._worker_loop())
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Serving {self.model_name} on http://{self.host}:{self.port}")
+
+    async def serve_forever(self):
+        """Start the server and serve requests until cancelled."""
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        """Stop accepting connections and shut down the worker."""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._executor.shutdown(wait=False)
+        logger.info("Server stopped")
+
+    def run(self):
+        """Run the server in a new event loop until interrupted."""
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            logger.info("Shutting down server")
+
+    async def _worker_loop(self):
+        """Execute queued jobs one at a time on the inference thread."""
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            self._active += 1
+            try:
+                if not job.cancelled:
+                    await self._run_job(loop, job)
+            finally:
+                self._active -= 1
+                self._queue.task_done()
+
+    async def _run_job(self, loop: asyncio.AbstractEventLoop, job: _Job):
+        """Run a single job, forwarding results or chunks to its output queue."""
+        try:
+            if not job.stream:
+                call = (
+                    self._call_with_metrics
+                    if job.metrics
+                    else lambda job: job.method(**job.params)
+                )
+                result = await loop.run_in_executor(self._executor, call, job)
+                await job.output.put(result)
+                return
+
+            timer = await loop.run_in_executor(self._executor, RequestTimer, self.model)
+            chunks: Iterator[Dict[str, Any]] = await loop.run_in_executor(
+                self._executor, lambda: job.method(stream=True, **job.params)
+            )
+            finish_reason = None
+            try:
+                while not job.cancelled:
+                    chunk = await loop.run_in_executor(
+                        self._executor, next, chunks, _DONE
+                    )
+                    if chunk is _DONE:
+                        break
+                    timer.token()
+                    finish_reason = (
+                        chunk["choices"][0].get("finish_reason") or finish_reason
+                    )
+                    await job.output.put(chunk)
+            finally:
+                await loop.run_in_executor(
+                    self._executor, getattr(chunks, "close", lambda: None)
+                )
+            metrics = await loop.run_in_executor(
+                self._executor, lambda: timer.finish(finish_reason=finish_reason)
+            )
+            self.metrics.observe(metrics, model=self.model_name)
+            await job.output.put(_DONE)
+        except Exception as e:
+            logger.error(f"Error generating completion: {e}")
+            await job.output.put(e)
+
+    def _call_with_metrics(self, job: _Job) -> Dict[str, Any]:
+        """Run a non-streaming job on the inference thread and record its metrics."""
+        timer = RequestTimer(self.model)
+        result = job.method(**job.params)
+        try:
+            usage = result.get("usage") or {}
+            choices = result.get("choices") or [{}]
+            self.metrics.observe(timer.finish(
+                prompt_tokens=usage.get("prompt_tokens"),
+                completion_tokens=usage.get("completion_tokens"),
+                finish_reason=choices[0].get("finish_reason"),
+            ), model=self.model_name)
+        except Exception as e:
+            logger.warning(f"Could not record request metrics: {e}")
+        return result
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """Serve a single HTTP request on a new connection."""
+        try:
+            try:
+                method, path, body = await self._read_request(reader)
+                handler = self._routes.get((method, path))
+                if handler is None:
+                    if any(route_path == path for _, route_path in self._routes):
+                        raise HTTPError(405, f"Method {method} not allowed for {path}")
+                    raise HTTPError(404, f"Unknown endpoint: {path}")
+                payload = self._parse_json(body) if method == "POST" else {}
+                if payload.get("stream"):
+                    # Streams notice a disconnect when a chunk fails to write,
+                    # so a client that half-closes still reads its stream
+                    await handler(payload, writer)
+                else:
+                    await self._until_disconnected(reader, handler(payload, writer))
+            except HTTPError as e:
+                self._write_json(
+                    writer,
+                    e.status,
+                    {
+                        "error": {
+                            "message": e.message,
+                            "type": e.error_type,
+                            "code": e.status,
+                        }
+                    },
+                )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            logger.debug("Client disconnected")
+        except Exception as e:
+            logger.error(f"Error handling request: {e}")
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _until_disconnected(reader: asyncio.StreamReader,
+                                  handling: Awaitable[None]):
+        """
+        Run a request handler, cancelling it if the client closes the connection.
+
+        One request is served per connection, so the request stream reaching
+        EOF before the response is written means the client went away. A
+        client that only half-closes its write side looks the same until a
+        write fails, so half-close is not supported for non-streaming
+        requests; streaming requests are not watched and rely on failed
+        writes instead.
+        """
+        task = asyncio.ensure_future(handling)
+        closed = asyncio.ensure_future(reader.read())
+        try:
+            await asyncio.wait({task, closed}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+        if closed.done() and not closed.cancelled() and closed.exception():
+            logger.debug(f"Connection error while waiting: {closed.exception()}")
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise ConnectionError("Client closed the connection")
+        await task
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader
+    ) -> Tuple[str, str, bytes]:
+        """Read the request line, headers and body of an HTTP/1.1 request."""
+        request_line = await reader.readline()
+        try:
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], body
+
+    @staticmethod
+    def _parse_json(body: bytes) -> Dict[str, Any]:
+        """Decode a JSON object request body."""
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "Request body is not valid JSON")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        return payload
+
+    def _write_head(
+        self, writer: asyncio.StreamWriter, status: int, headers: Dict[str, str]
+    ):
+        """Write the status line and headers of a response."""
+        lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}"]
+        headers = {
+            **headers,
+            "X-Queue-Depth": str(self.queue_depth),
+            "Connection": "close",
+        }
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    def _write_json(
+        self, writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any]
+    ):
+        """Write a complete JSON response."""
+        body = json.dumps(payload).encode("utf-8")
+        self._write_head(writer, status, {
+            "Content-Type": "application/json",
+            "Content-Length": str(len(body)),
+        })
+        writer.write(body)
+
+    def _require_model(self) -> Llama:
+        """The model to run a request on, or 503 while it is loading."""
+        model = self.model
+        if model is None:
+            raise HTTPError(
+                503, f"Model is not ready ({self.status}), retry later", "server_error"
+            )
+        return model
+
+    def _grammar(
+        self, model: Llama, payload: Dict[str, Any]
+    ) -> Dict[str, LlamaGrammar]:
+        """Completion arguments with the cached grammar for structured output."""
+        json_schema, gbnf = payload.get("json_schema"), payload.get("grammar")
+        response_format = payload.get("response_format")
+        if isinstance(response_format, dict):
+            if response_format.get("type") == "json_schema":
+                json_schema = (response_format.get("json_schema") or {}).get("schema")
+            elif response_format.get("type") == "json_object":
+                json_schema = response_format.get("schema")
+                gbnf = ANY_JSON if json_schema is None else None
+        if json_schema is None and gbnf is None:
+            return {}
+        if json_schema is not None and gbnf is not None:
+            raise HTTPError(400, "Pass only one of 'json_schema' and 'grammar'")
+        try:
+            return {"grammar": self.grammar_cache.get(json_schema, gbnf, model=model)}
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+
+    async def _handle_chat_completions(
+        self, payload: Dict[str, Any], writer: asyncio.StreamWriter
+    ):
+        """Handle POST /v1/chat/completions."""
+        model = self._require_model()
+        if not isinstance(payload.get("messages"), list) or not payload["messages"]:
+            raise HTTPError(400, "'messages' must be a non-empty list")
+        params = {k: v for k, v in payload.items() if k in CHAT_PARAMS}
+        params.update(self._grammar(model, payload))
+        await self._submit(
+            model.create_chat_completion, params, bool(payload.get("stream")), writer
+        )
+
+    async def _handle_completions(
+        self, payload: Dict[str, Any], writer: asyncio.StreamWriter
+    ):
+        """Handle POST /v1/completions."""
+        model = self._require_model()
+        if not isinstance(payload.get("prompt"), str):
+            raise HTTPError(400, "'prompt' must be a string")
+        params = {k: v for k, v in payload.items() if k in COMPLETION_PARAMS}
+        params.update(self._grammar(model, payload))
+        await self._submit(
+            model.create_completion, params, bool(payload.get("stream")), writer
+        )
+
+    async def _handle_embeddings(
+        self, payload: Dict[str, Any], writer: asyncio.StreamWriter
+    ):
+        """Handle POST /v1/embeddings."""
+        model = self._require_model()
+        texts = payload.get("input")
+        if isinstance(texts, str):
+            texts = [texts]
+        if (
+            not isinstance(texts, list)
+            or not texts
+            or not all(isinstance(t, str) for t in texts)
+        ):
+            raise HTTPError(
+                400, "'input' must be a string or a non-empty list of strings"
+            )
+        encoding_format = payload.get("encoding_format", "float")
+        if encoding_format not in ("float", "base64"):
+            raise HTTPError(400, "'encoding_format' must be 'float' or 'base64'")
+
+        try:
+            if self._embedder is None or self._embedder.model is not model:
+                self._embedder = Embedder(model)
+            embedder = self._embedder
+            pooling = embedder.resolve_pooling(payload.get("pooling"))
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        normalize = payload.get("normalize", True) is not False
+
+        def embed(texts: List[str]) -> Dict[str, Any]:
+            vectors = embedder.embed(texts, pooling=pooling, normalize=normalize)
+            if encoding_format == "base64":
+                encoded = [
+                    base64.b64encode(v.astype("<f4").tobytes()).decode("ascii")
+                    for v in vectors
+                ]
+            else:
+                encoded = vectors.tolist()
+            return {
+                "object": "list",
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": e}
+                    for i, e in enumerate(encoded)
+                ],
+                "usage": {
+                    "prompt_tokens": embedder.last_token_count,
+                    "total_tokens": embedder.last_token_count,
+                },
+            }
+
+        await self._submit(embed, {"texts": texts}, False, writer, metrics=False)
+
+    async def _handle_tokenize(
+        self, payload: Dict[str, Any], writer: asyncio.StreamWriter
+    ):
+        """Handle POST /tokenize: token IDs of content, or prompt tokens of messages."""
+        tokenizer = Tokenizer.for_model(self._require_model())
+        loop = asyncio.get_running_loop()
+        messages = payload.get("messages")
+        if messages is not None:
+            if not isinstance(messages, list) or not all(
+                isinstance(m, dict)
+                and isinstance(m.get("role"), str)
+                and isinstance(m.get("content"), str)
+                for m in messages
+            ):
+                raise HTTPError(
+                    400,
+                    "'messages' must be a list of messages "
+                    "with string role and content",
+                )
+            exact = payload.get("exact", False) is True
+            try:
+                count = await loop.run_in_executor(
+                    None, tokenizer.count_messages, messages, exact
+                )
+            except Exception as e:
+                raise HTTPError(400, f"Could not apply the chat template: {e}")
+            self._write_json(writer, 200, {"count": count})
+            return
+
+        content = payload.get("content")
+        texts = [content] if isinstance(content, str) else content
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            raise HTTPError(
+                400,
+                "'content' must be a string or a list of strings, or 'messages' a list",
+            )
+        add_special = payload.get("add_special", False) is True
+        tokens = await loop.run_in_executor(
+            None,
+            lambda: tokenizer.tokenize(texts, add_bos=add_special, special=add_special),
+        )
+        if isinstance(content, str):
+            self._write_json(
+                writer, 200, {"tokens": tokens[0], "count": len(tokens[0])}
+            )
+        else:
+            self._write_json(
+                writer, 200, {"tokens": tokens, "count": [len(t) for t in tokens]}
+            )
+
+    async def _handle_detokenize(
+        self, payload: Dict[str, Any], writer: asyncio.StreamWriter
+    ):
+        """Handle POST /detokenize: text of a token list, or of several lists."""
+        tokenizer = Tokenizer.for_model(self._require_model())
+        tokens = payload.get("tokens")
+        batched = (
+            isinstance(tokens, list)
+            and bool(tokens)
+            and all(isinstance(t, list) for t in tokens)
+        )
+        token_lists = tokens if batched else [tokens]
+        if not all(
+            isinstance(t, list) and all(isinstance(i, int) for i in t)
+            for t in token_lists
+        ):
+            raise HTTPError(
+                400, "'tokens' must be a list of token IDs or a list of such lists"
+            )
+        n_vocab = tokenizer.model.n_vocab()
+        if any(not 0 <= i < n_vocab for t in token_lists for i in t):
+            raise HTTPError(400, f"Token IDs must be between 0 and {n_vocab - 1}")
+        texts = await asyncio.get_running_loop().run_in_executor(
+            None, tokenizer.detokenize, token_lists
+        )
+        self._write_json(writer, 200, {"content": texts if batched else texts[0]})
+
+    async def _handle_models(
+        self, payload: Dict[str, Any], writer: asyncio.StreamWriter
+    ):
+        """Handle GET /v1/models."""
+        self._write_json(writer, 200, {
+            "object": "list",
+            "data": [{"id": self.model_name, "object": "model", "owned_by": "local"}],
+        })
+
+    async def _handle_health(
+        self, payload: Dict[str, Any], writer: asyncio.StreamWriter
+    ):
+        """Handle GET /health: alive while loading, 503 only if loading failed."""
+        status = self.status
+        self._write_json(writer, 503 if status == "failed" else 200, {
+            "status": status,
+            "model": self.model_name,
+            "queue_depth": self.queue_depth,
+            "max_queue_size": self.max_queue_size,
+        })
+
+    async def _handle_ready(
+        self, payload: Dict[str, Any], writer: asyncio.StreamWriter
+    ):
+        """Handle GET /ready: 200 once the model is loaded and warm, 503 before."""
+        self._write_json(
+            writer,
+            200 if self.ready else 503,
+            {"ready": self.ready, "status": self.status},
+        )
+
+    async def _handle_metrics(
+        self, payload: Dict[str, Any], writer: asyncio.StreamWriter
+    ):
+        """Handle GET /metrics in the Prometheus text format."""
+        gauges = [
+            f"# HELP {self.metrics.namespace}_queue_depth Requests waiting or running.",
+            f"# TYPE {self.metrics.namespace}_queue_depth gauge",
+            f"{self.metrics.namespace}_queue_depth {self.queue_depth}",
+        ]
+        body = (self.metrics.render() + "\n".join(gauges) + "\n").encode("utf-8")
+        self._write_head(writer, 200, {
+            "Content-Type": "text/plain; version=0.0.4; charset=utf-8",
+            "Content-Length": str(len(body)),
+        })
+        writer.write(body)
+
+    async def _submit(self,
+                      method: Callable[..., Any],
+                      params: Dict[str, Any],
+                      stream: bool,
+                      writer: asyncio.StreamWriter,
+                      metrics: bool = True):
+        """Queue a job and write its result (or SSE stream) to the client."""
+        job = _Job(method=method, params=params, stream=stream, metrics=metrics)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise HTTPError(429, "Server is busy, retry later", "rate_limit_error")
+
+        if not stream:
+            try:
+                result = await job.output.get()
+            except asyncio.CancelledError:
+                # Skip the job if it is still queued when the client goes away
+                job.cancelled = True
+                raise
+            if isinstance(result, Exception):
+                raise HTTPError(500, str(result), "server_error")
+            self._write_json(writer, 200, self._with_model_name(result))
+            return
+
+        self._write_head(writer, 200, {
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+        })
+        started = time.perf_counter()
+        try:
+            while True:
+                chunk = await job.output.get()
+                if chunk is _DONE:
+                    break
+                if isinstance(chunk, Exception):
+                    error = {"error": {"message": str(chunk), "type": "server_error"}}
+                    writer.write(f"data: {json.dumps(error)}\n\n".encode("utf-8"))
+                    break
+                writer.write(
+                    f"data: {json.dumps(self._with_model_name(chunk))}\n\n".encode(
+                        "utf-8"
+                    )
+                )
+                await writer.drain()
+            writer.write(b"data: [DONE]\n\n")
+            logger.debug(f"Stream finished in {time.perf_counter() - started:.2f}s")
+        except (ConnectionError, asyncio.CancelledError):
+            # Stop generating as soon as the client goes away
+            job.cancelled = True
+            raise
+
+    def _with_model_name(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        """Report the served model name instead of the local file path."""
+        return {**response, "model": self.model_name}
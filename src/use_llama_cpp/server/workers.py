@@ -0,0 +1,593 @@
+"""
+Pre-fork worker pool for the OpenAI-compatible server.
+
+One process drives one llama.cpp context and Python-side work serializes
+on the GIL, so a single server cannot use a large host. PreforkServer
+validates the model and memory-maps it once in the parent, then forks
+worker processes. Each one is pinned to its own set of CPUs and runs an
+InferenceServer on a private port. The weights are file-backed
+read-only pages, so all workers share one copy in the page cache. The
+parent accepts client connections and routes every request to the
+worker with the fewest outstanding tokens.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import stat
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Set
+
+from ..core import tuning
+from ..core.memory import bind_to_cpus
+from ..core.metrics import MetricsRegistry
+from ..utils.hardware import NUMANode, probe_numa_nodes
+from .app import HTTPError, InferenceServer
+
+if TYPE_CHECKING:
+    from multiprocessing.connection import Connection
+    from multiprocessing.process import BaseProcess
+
+    from ..core.model_loader import ModelLoader
+
+logger = logging.getLogger(__name__)
+
+# Endpoints forwarded to a worker, everything else is answered by the parent
+PROXIED_PATHS = (
+    "/v1/chat/completions",
+    "/v1/completions",
+    "/v1/embeddings",
+    "/tokenize",
+    "/detokenize",
+)
+
+# Rough bytes per token, for estimating the prompt length of a request
+BYTES_PER_TOKEN = 4
+
+# Seconds between checks of the worker processes
+MONITOR_INTERVAL = 0.25
+
+
+@dataclass
+class _Worker:
+    """A forked worker process and its routing state."""
+
+    index: int
+    cpus: Optional[List[int]]
+    process: Optional["BaseProcess"] = None
+    conn: Optional["Connection"] = None
+    port: Optional[int] = None
+    # "starting", "ready", "failed" (could not load) or "exited"
+    state: str = "starting"
+    outstanding_tokens: int = 0
+    active: int = 0
+    restarts: int = 0
+
+
+def partition_cpus(n_workers: int,
+                   cpus: Optional[Sequence[int]] = None,
+                   nodes: Optional[Sequence[NUMANode]] = None) -> List[List[int]]:
+    """
+    Split the CPUs this process may use into one set per worker.
+
+    When the workers divide evenly over several NUMA nodes each set stays
+    within one node, so a worker's threads and memory are local.
+
+    Args:
+        n_workers: Number of workers
+        cpus: CPUs to split (default: this process's affinity)
+        nodes: NUMA topology (probed if not given)
+
+    Returns:
+        One non-empty CPU list per worker; sets are shared round-robin when
+        there are more workers than CPUs
+    """
+    if cpus is None:
+        try:
+            cpus = sorted(os.sched_getaffinity(0))
+        except AttributeError:
+            cpus = list(range(os.cpu_count() or 1))
+    cpus = list(cpus)
+    nodes = probe_numa_nodes() if nodes is None else nodes
+
+    groups = [cpus]
+    if len(nodes) > 1 and n_workers % len(nodes) == 0:
+        allowed = set(cpus)
+        per_node = [[cpu for cpu in node.cpus if cpu in allowed] for node in nodes]
+        if all(per_node):
+            groups = per_node
+
+    per_group = n_workers // len(groups)
+    sets = []
+    for group in groups:
+        for i in range(per_group):
+            chunk = group[i * len(group) // per_group:(i + 1) * len(group) // per_group]
+            sets.append(chunk or [group[i % len(group)]])
+    return sets
+
+
+def merge_metrics(texts: Dict[str, str]) -> str:
+    """
+    Combine Prometheus texts of several workers, labelling samples with the worker.
+
+    Args:
+        texts: Exposition text per worker id
+
+    Returns:
+        One exposition with every metric family listed once
+    """
+    families: Dict[str, List[str]] = {}
+    headers: Dict[str, List[str]] = {}
+    for worker, text in texts.items():
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# "):
+                parts = line.split(" ", 3)
+                family = parts[2] if len(parts) > 2 else family
+                if family not in headers:
+                    headers[family] = []
+                    families[family] = []
+                if line not in headers[family]:
+                    headers[family].append(line)
+                continue
+            if not line.strip() or family is None:
+                continue
+            name, _, rest = line.partition(" ")
+            label = f'worker="{worker}"'
+            if "{" in name:
+                name = name.replace("{", "{" + label + ",", 1)
+            else:
+                name = name + "{" + label + "}"
+            families[family].append(f"{name} {rest}")
+    lines: List[str] = []
+    for family, header in headers.items():
+        lines.extend(header)
+        lines.extend(families[family])
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def _close_inherited_sockets():
+    """
+    Close the sockets a forked worker inherited from the parent.
+
+    Otherwise the listening socket stays bound and client connections stay
+    open after the parent closes them.
+    """
+    fd_dir = "/proc/self/fd" if os.path.isdir("/proc/self/fd") else "/dev/fd"
+    try:
+        fds = [int(fd) for fd in os.listdir(fd_dir)]
+    except OSError:
+        return
+    for fd in fds:
+        try:
+            if stat.S_ISSOCK(os.fstat(fd).st_mode):
+                os.close(fd)
+        except OSError:
+            pass
+
+
+def _worker_main(loader: "ModelLoader",
+                 index: int,
+                 cpus: Optional[List[int]],
+                 conn: "Connection",
+                 model_name: str,
+                 max_queue_size: int):
+    """Entry point of a forked worker: load the model and serve on a private port."""
+    _close_inherited_sockets()
+
+    if cpus:
+        bind_to_cpus(cpus)
+        if loader.n_threads is None and not loader.auto_tune:
+            # Sized to the pinned CPUs, not the whole host
+            config = tuning.recommend_config(gpu_layers=loader.gpu_layers)
+            loader.n_threads = config.n_threads
+            loader.n_threads_batch = loader.n_threads_batch or config.n_threads_batch
+        if loader.numa is None and len(probe_numa_nodes()) > 1:
+            loader.numa = "numactl"
+    # The parent already brought the weights into the page cache
+    loader.prefetch = False
+    logger.info(f"Worker {index} loading the model")
+
+    if loader.load_and_warmup() is None:
+        conn.send(("failed", loader.state))
+        return
+
+    server = InferenceServer(
+        loader.model,
+        model_name=model_name,
+        host="127.0.0.1",
+        port=0,
+        max_queue_size=max_queue_size,
+        metrics=MetricsRegistry(),
+    )
+
+    async def serve():
+        await server.start()
+        conn.send(("ready", server.port))
+        try:
+            await server._server.serve_forever()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loader.unload_model()
+
+
+class PreforkServer(InferenceServer):
+    """OpenAI-compatible front end balancing requests over pre-forked workers."""
+
+    def __init__(self,
+                 loader: "ModelLoader",
+                 n_workers: int = 2,
+                 model_name: str = "local-model",
+                 host: str = "127.0.0.1",
+                 port: int = 8000,
+                 max_queue_size: int = 16,
+                 metrics: Optional[MetricsRegistry] = None,
+                 cpu_sets: Optional[List[List[int]]] = None,
+                 pin_cpus: bool = True,
+                 default_max_tokens: int = 256):
+        """
+        Initialize the pool.
+
+        Args:
+            loader: Loader describing the model; each worker loads through a copy
+            n_workers: Worker processes to fork
+            model_name: Model id reported by /v1/models and in responses
+            host: Interface to bind
+            port: TCP port to bind (0 picks a free port)
+            max_queue_size: Requests each worker lets wait before returning 429
+            metrics: Registry for the parent's own gauges
+            cpu_sets: CPUs per worker (default: partition_cpus)
+            pin_cpus: Pin each worker to its CPU set
+            default_max_tokens: Completion length assumed for routing when a
+                request does not set max_tokens
+        """
+        if n_workers < 1:
+            raise ValueError("n_workers must be at least 1")
+        super().__init__(
+            model_name=model_name,
+            host=host,
+            port=port,
+            max_queue_size=max_queue_size,
+            metrics=metrics,
+            loader=loader,
+        )
+        self.n_workers = n_workers
+        self.cpu_sets = cpu_sets
+        self.pin_cpus = pin_cpus
+        self.default_max_tokens = default_max_tokens
+        self._workers: List[_Worker] = []
+        self._weights: Optional[mmap.mmap] = None
+        self._monitor: Optional[asyncio.Task] = None
+        self._stopping = False
+        for path in PROXIED_PATHS:
+            self._routes[("POST", path)] = functools.partial(self._proxy, path)
+
+    @property
+    def workers(self) -> List[Dict[str, Any]]:
+        """State of every worker."""
+        return [
+            {
+                "index": w.index,
+                "pid": w.process.pid if w.process else None,
+                "state": w.state,
+                "cpus": w.cpus,
+                "outstanding_tokens": w.outstanding_tokens,
+                "active": w.active,
+                "restarts": w.restarts,
+            }
+            for w in self._workers
+        ]
+
+    @property
+    def ready(self) -> bool:
+        """Whether at least one worker accepts requests."""
+        return any(w.state == "ready" for w in self._workers)
+
+    @property
+    def status(self) -> str:
+        """'ok' with a ready worker, 'failed' with none left, else 'loading'."""
+        if self.ready:
+            return "ok"
+        if self._workers and all(
+            w.state in ("failed", "exited") for w in self._workers
+        ):
+            return "failed"
+        return "loading"
+
+    @property
+    def queue_depth(self) -> int:
+        """Requests in progress across all workers."""
+        return sum(w.active for w in self._workers)
+
+    def start_workers(self) -> bool:
+        """
+        Validate and map the model, then fork the workers.
+
+        Returns:
+            False if the model file is invalid or forking is unsupported
+        """
+        if "fork" not in multiprocessing.get_all_start_methods():
+            logger.error(
+                "The worker pool needs fork(), which this platform does not support"
+            )
+            return False
+        if not self.loader.validate_model_path():
+            return False
+
+        self._map_weights()
+        sets = self.cpu_sets or (
+            partition_cpus(self.n_workers) if self.pin_cpus else None
+        )
+        self._workers = [
+            _Worker(index=i, cpus=sets[i % len(sets)] if sets else None)
+            for i in range(self.n_workers)
+        ]
+        for worker in self._workers:
+            self._spawn(worker)
+        return True
+
+    async def start(self):
+        """Fork the workers if needed, bind the listening socket and watch them."""
+        if not self._workers and not self.start_workers():
+            raise RuntimeError("Worker pool could not be started")
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._monitor = asyncio.create_task(self._monitor_workers())
+        logger.info(f"Serving {self.model_name} on http://{self.host}:{self.port} "
+                    f"with {self.n_workers} worker processes")
+
+    async def stop(self):
+        """Stop accepting connections and terminate the workers."""
+        self._stopping = True
+        if self._monitor:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+        await super().stop()
+        for worker in self._workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self._workers:
+            if worker.process is not None:
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.kill()
+        if self._weights is not None:
+            self._weights.close()
+            self._weights = None
+
+    def _map_weights(self):
+        """Map the model file and ask the kernel to read it ahead for the workers."""
+        try:
+            with open(self.loader.model_path, "rb") as f:
+                self._weights = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(self._weights, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+                self._weights.madvise(mmap.MADV_WILLNEED)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not map {self.loader.model_path}: {e}")
+
+    def _spawn(self, worker: _Worker):
+        """Fork the process of a worker."""
+        context = multiprocessing.get_context("fork")
+        parent_conn, child_conn = context.Pipe(duplex=False)
+        worker.process = context.Process(
+            target=_worker_main,
+            args=(
+                self.loader,
+                worker.index,
+                worker.cpus,
+                child_conn,
+                self.model_name,
+                self.max_queue_size,
+            ),
+            name=f"inference-worker-{worker.index}",
+            daemon=True,
+        )
+        worker.process.start()
+        child_conn.close()
+        worker.conn = parent_conn
+        worker.port = None
+        worker.state = "starting"
+        logger.info(
+            f"Started worker {worker.index} "
+            f"(pid {worker.process.pid}, CPUs {worker.cpus})"
+        )
+
+    async def _monitor_workers(self):
+        """Collect readiness messages and restart workers that exit after starting."""
+        while True:
+            for worker in self._workers:
+                if worker.process is None:
+                    continue
+                try:
+                    while worker.conn.poll():
+                        message, value = worker.conn.recv()
+                        if message == "ready":
+                            worker.port, worker.state = value, "ready"
+                            logger.info(f"Worker {worker.index} ready on port {value}")
+                        else:
+                            worker.state = "failed"
+                            logger.error(
+                                f"Worker {worker.index} could not load "
+                                f"the model ({value})"
+                            )
+                except (EOFError, OSError):
+                    pass
+
+                if (
+                    worker.state in ("starting", "ready")
+                    and not worker.process.is_alive()
+                ):
+                    was_ready = worker.state == "ready"
+                    worker.state = "exited"
+                    logger.warning(
+                        f"Worker {worker.index} exited with code "
+                        f"{worker.process.exitcode}"
+                    )
+                    # A worker that never got ready would fail again the same way
+                    if was_ready and not self._stopping:
+                        worker.restarts += 1
+                        self._spawn(worker)
+            await asyncio.sleep(MONITOR_INTERVAL)
+
+    def _estimate_tokens(self, payload: Dict[str, Any]) -> int:
+        """Tokens a request is expected to cost: prompt plus completion budget."""
+        prompt = (
+            payload.get("messages")
+            or payload.get("prompt")
+            or payload.get("input")
+            or ""
+        )
+        prompt_tokens = len(json.dumps(prompt)) // BYTES_PER_TOKEN
+        if "input" in payload:
+            return prompt_tokens
+        max_tokens = payload.get("max_tokens")
+        return prompt_tokens + (
+            max_tokens if isinstance(max_tokens, int) else self.default_max_tokens
+        )
+
+    def _choose(self, exclude: Set[int]) -> Optional[_Worker]:
+        """The ready worker with the fewest outstanding tokens."""
+        candidates = [
+            w for w in self._workers if w.state == "ready" and w.index not in exclude
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda w: (w.outstanding_tokens, w.active))
+
+    async def _proxy(
+        self, path: str, payload: Dict[str, Any], writer: asyncio.StreamWriter
+    ):
+        """Forward a request to the least loaded worker and relay its response."""
+        body = json.dumps(payload).encode("utf-8")
+        # Tokenization does not generate, it costs about nothing
+        cost = self._estimate_tokens(payload) if path.startswith("/v1/") else 0
+        tried: Set[int] = set()
+        while True:
+            worker = self._choose(tried)
+            if worker is None:
+                if tried:
+                    raise HTTPError(
+                        429, "All workers are busy, retry later", "rate_limit_error"
+                    )
+                raise HTTPError(
+                    503,
+                    f"No worker is ready ({self.status}), retry later",
+                    "server_error",
+                )
+            tried.add(worker.index)
+
+            worker.outstanding_tokens += cost
+            worker.active += 1
+            upstream: Optional[asyncio.StreamWriter] = None
+            try:
+                try:
+                    reader, upstream = await asyncio.open_connection(
+                        "127.0.0.1", worker.port
+                    )
+                    upstream.write(
+                        f"POST {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                        f"Content-Type: application/json\r\n"
+                        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1")
+                        + body
+                    )
+                    await upstream.drain()
+                    status_line = await reader.readline()
+                except OSError as e:
+                    logger.warning(f"Worker {worker.index} unreachable: {e}")
+                    continue
+                # A worker with a full queue: try the next one
+                if b" 429 " in status_line[:16]:
+                    continue
+
+                writer.write(status_line)
+                while True:
+                    chunk = await reader.read(64 * 1024)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+                return
+            finally:
+                worker.outstanding_tokens -= cost
+                worker.active -= 1
+                if upstream is not None:
+                    upstream.close()
+
+    async def _fetch_metrics(self, worker: _Worker) -> str:
+        """The /metrics text of one worker."""
+        reader, writer = await asyncio.open_connection("127.0.0.1", worker.port)
+        try:
+            writer.write(
+                b"GET /metrics HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Length: 0\r\n\r\n"
+            )
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        return response.partition(b"\r\n\r\n")[2].decode("utf-8")
+
+    async def _handle_health(
+        self, payload: Dict[str, Any], writer: asyncio.StreamWriter
+    ):
+        """Handle GET /health with the state of every worker."""
+        status = self.status
+        self._write_json(writer, 503 if status == "failed" else 200, {
+            "status": status,
+            "model": self.model_name,
+            "queue_depth": self.queue_depth,
+            "workers": self.workers,
+        })
+
+    async def _handle_metrics(
+        self, payload: Dict[str, Any], writer: asyncio.StreamWriter
+    ):
+        """Handle GET /metrics: metrics labelled by worker, plus routing gauges."""
+        ready = [w for w in self._workers if w.state == "ready"]
+        results = await asyncio.gather(
+            *(self._fetch_metrics(w) for w in ready), return_exceptions=True
+        )
+        texts = {}
+        for worker, result in zip(ready, results):
+            if isinstance(result, Exception):
+                logger.warning(
+                    f"Could not read metrics of worker {worker.index}: {result}"
+                )
+            else:
+                texts[str(worker.index)] = result
+
+        namespace = self.metrics.namespace
+        gauges = [
+            f"# HELP {namespace}_workers_ready Worker processes accepting requests.",
+            f"# TYPE {namespace}_workers_ready gauge",
+            f"{namespace}_workers_ready {len(ready)}",
+            f"# HELP {namespace}_worker_outstanding_tokens "
+            "Estimated tokens routed to a worker and not finished.",
+            f"# TYPE {namespace}_worker_outstanding_tokens gauge",
+        ]
+        gauges.extend(
+            f'{namespace}_worker_outstanding_tokens{{worker="{w.index}"}} '
+            f"{w.outstanding_tokens}"
+            for w in self._workers
+        )
+        body = (merge_metrics(texts) + "\n".join(gauges) + "\n").encode("utf-8")
+        self._write_head(writer, 200, {
+            "Content-Type": "text/plain; version=0.0.4; charset=utf-8",
+            "Content-Length": str(len(body)),
+        })
+        writer.write(body)
@@ -2,6 +2,15 @@
 Utility functions and classes for AI Room application.
 """
 
-from .gpu_checker import GPUChecker
+from typing import TYPE_CHECKING
+
+from .._lazy import lazy_attributes
+
+if TYPE_CHECKING:
+    from .gpu_checker import GPUChecker
+
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    "GPUChecker": ".gpu_checker",
+})
 
 __all__ = ["GPUChecker"]
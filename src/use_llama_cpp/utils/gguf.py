@@ -0,0 +1,391 @@
+"""
+GGUF header parsing for AI Room application.
+
+Reads the metadata key/value pairs and the tensor table of a GGUF file
+through a memory map, without loading the model. Only the header pages are
+touched, so even multi-gigabyte files are parsed in milliseconds. Large
+arrays (the tokenizer vocabulary) are skipped unless asked for.
+"""
+
+import glob
+import logging
+import mmap
+import os
+import re
+import struct
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GGUF_MAGIC = b"GGUF"
+DEFAULT_ALIGNMENT = 32
+
+# GGUF value type id -> struct format (strings and arrays are handled apart)
+_SCALAR_FORMATS = {
+    0: "B", 1: "b", 2: "H", 3: "h", 4: "I", 5: "i",
+    6: "f", 7: "?", 10: "Q", 11: "q", 12: "d",
+}
+_STRING = 8
+_ARRAY = 9
+_STRUCTS = {fmt: struct.Struct("<" + fmt) for fmt in list(_SCALAR_FORMATS.values())}
+
+_SHARD = re.compile(r"-(\d{5})-of-\d{5}\.gguf$")
+
+# ggml tensor type id -> (name, elements per block, bytes per block)
+GGML_TYPES = {
+    0: ("F32", 1, 4),
+    1: ("F16", 1, 2),
+    2: ("Q4_0", 32, 18),
+    3: ("Q4_1", 32, 20),
+    6: ("Q5_0", 32, 22),
+    7: ("Q5_1", 32, 24),
+    8: ("Q8_0", 32, 34),
+    9: ("Q8_1", 32, 36),
+    10: ("Q2_K", 256, 84),
+    11: ("Q3_K", 256, 110),
+    12: ("Q4_K", 256, 144),
+    13: ("Q5_K", 256, 176),
+    14: ("Q6_K", 256, 210),
+    15: ("Q8_K", 256, 292),
+    16: ("IQ2_XXS", 256, 66),
+    17: ("IQ2_XS", 256, 74),
+    18: ("IQ3_XXS", 256, 98),
+    19: ("IQ1_S", 256, 50),
+    20: ("IQ4_NL", 32, 18),
+    21: ("IQ3_S", 256, 110),
+    22: ("IQ2_S", 256, 82),
+    23: ("IQ4_XS", 256, 136),
+    24: ("I8", 1, 1),
+    25: ("I16", 1, 2),
+    26: ("I32", 1, 4),
+    27: ("I64", 1, 8),
+    28: ("F64", 1, 8),
+    29: ("IQ1_M", 256, 56),
+    30: ("BF16", 1, 2),
+    34: ("TQ1_0", 256, 54),
+    35: ("TQ2_0", 256, 66),
+    39: ("MXFP4", 32, 17),
+}
+
+# general.file_type -> quantization name as used in model file names
+FILE_TYPES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 7: "Q8_0", 8: "Q5_0", 9: "Q5_1",
+    10: "Q2_K", 11: "Q3_K_S", 12: "Q3_K_M", 13: "Q3_K_L", 14: "Q4_K_S", 15: "Q4_K_M",
+    16: "Q5_K_S", 17: "Q5_K_M", 18: "Q6_K", 19: "IQ2_XXS", 20: "IQ2_XS", 21: "Q2_K_S",
+    22: "IQ3_XS", 23: "IQ3_XXS", 24: "IQ1_S", 25: "IQ4_NL", 26: "IQ3_S", 27: "IQ3_M",
+    28: "IQ2_S", 29: "IQ2_M", 30: "IQ4_XS", 31: "IQ1_M", 32: "BF16", 36: "TQ1_0",
+    37: "TQ2_0", 38: "MXFP4_MOE",
+}
+
+
+class GGUFError(ValueError):
+    """The file is not a readable GGUF file."""
+
+
+@dataclass
+class GGUFArray:
+    """An array value whose items were skipped."""
+
+    item_type: int
+    length: int
+
+
+@dataclass
+class GGUFTensor:
+    """One entry of the tensor table."""
+
+    name: str
+    shape: Tuple[int, ...]
+    ggml_type: int
+    # Absolute offset of the tensor data in the file
+    offset: int
+    nbytes: int
+
+    @property
+    def type_name(self) -> str:
+        """ggml type name, e.g. "Q4_K"."""
+        return GGML_TYPES.get(self.ggml_type, (f"type{self.ggml_type}",))[0]
+
+    @property
+    def n_elements(self) -> int:
+        """Number of values in the tensor."""
+        count = 1
+        for dim in self.shape:
+            count *= dim
+        return count
+
+
+@dataclass
+class GGUFFile:
+    """Header of a GGUF file."""
+
+    path: str
+    version: int
+    file_size: int
+    metadata: Dict[str, Any]
+    tensors: List[GGUFTensor] = field(default_factory=list)
+    tensor_count: int = 0
+    # Offset of the first tensor's data
+    data_offset: int = 0
+
+    def value(self, name: str, default: Optional[Any] = None) -> Any:
+        """Architecture-specific value, e.g. "block_count" -> "llama.block_count"."""
+        return self.metadata.get(f"{self.architecture}.{name}", default)
+
+    @property
+    def architecture(self) -> str:
+        return self.metadata.get("general.architecture", "unknown")
+
+    @property
+    def name(self) -> str:
+        return (
+            self.metadata.get("general.name")
+            or os.path.splitext(os.path.basename(self.path))[0]
+        )
+
+    @property
+    def context_length(self) -> Optional[int]:
+        """Context length the model was trained with."""
+        return self.value("context_length")
+
+    @property
+    def block_count(self) -> Optional[int]:
+        return self.value("block_count")
+
+    @property
+    def quantization(self) -> str:
+        """Quantization name from general.file_type, e.g. "Q4_K_M"."""
+        file_type = self.metadata.get("general.file_type")
+        if file_type is None:
+            return "unknown"
+        return FILE_TYPES.get(file_type, f"type{file_type}")
+
+    @property
+    def chat_template(self) -> Optional[str]:
+        return self.metadata.get("tokenizer.chat_template")
+
+    @property
+    def parameter_count(self) -> int:
+        """Number of weights, from the tensor table."""
+        return sum(tensor.n_elements for tensor in self.tensors)
+
+    @property
+    def tensor_bytes(self) -> int:
+        """Bytes of tensor data, or the file size if tensors were not read."""
+        if not self.tensors:
+            return self.file_size
+        return sum(tensor.nbytes for tensor in self.tensors)
+
+    def summary(self) -> Dict[str, Any]:
+        """Plain dictionary describing the model, e.g. for listings."""
+        return {
+            "path": self.path,
+            "name": self.name,
+            "architecture": self.architecture,
+            "quantization": self.quantization,
+            "context_length": self.context_length,
+            "block_count": self.block_count,
+            "parameters": self.parameter_count,
+            "tensors": self.tensor_count,
+            "file_size": self.file_size,
+            "chat_template": self.chat_template is not None,
+        }
+
+
+class _Reader:
+    """Sequential little-endian reads from a buffer."""
+
+    def __init__(self, buffer: Any, count_format: str = "Q"):
+        self.buffer = buffer
+        self.pos = 0
+        self.count_format = count_format
+
+    def unpack(self, fmt: str) -> Any:
+        unpacker = _STRUCTS[fmt]
+        try:
+            value = unpacker.unpack_from(self.buffer, self.pos)[0]
+        except struct.error:
+            raise GGUFError("Unexpected end of file") from None
+        self.pos += unpacker.size
+        return value
+
+    def count(self) -> int:
+        return self.unpack(self.count_format)
+
+    def string(self) -> str:
+        length = self.count()
+        end = self.pos + length
+        if end > len(self.buffer):
+            raise GGUFError("Unexpected end of file")
+        value = self.buffer[self.pos:end].decode("utf-8", "replace")
+        self.pos = end
+        return value
+
+    def value(self, value_type: int, arrays: bool) -> Any:
+        if value_type in _SCALAR_FORMATS:
+            return self.unpack(_SCALAR_FORMATS[value_type])
+        if value_type == _STRING:
+            return self.string()
+        if value_type == _ARRAY:
+            item_type = self.unpack("I")
+            length = self.count()
+            return self.array(item_type, length, arrays)
+        raise GGUFError(f"Unknown GGUF value type {value_type}")
+
+    def array(self, item_type: int, length: int, keep: bool) -> Any:
+        if item_type in _SCALAR_FORMATS:
+            fmt = _SCALAR_FORMATS[item_type]
+            size = struct.calcsize(fmt) * length
+            if self.pos + size > len(self.buffer):
+                raise GGUFError("Unexpected end of file")
+            # Fixed-size items are unpacked in one call or skipped outright
+            items = (
+                list(struct.unpack_from(f"<{length}{fmt}", self.buffer, self.pos))
+                if keep
+                else None
+            )
+            self.pos += size
+        elif item_type == _STRING and not keep:
+            # The vocabulary is most of the header; walk it with locals only
+            unpack_from, width = (
+                _STRUCTS[self.count_format].unpack_from,
+                _STRUCTS[self.count_format].size,
+            )
+            buffer, pos = self.buffer, self.pos
+            try:
+                for _ in range(length):
+                    pos += width + unpack_from(buffer, pos)[0]
+            except struct.error:
+                raise GGUFError("Unexpected end of file") from None
+            if pos > len(buffer):
+                raise GGUFError("Unexpected end of file")
+            self.pos = pos
+            items = None
+        else:
+            items = [self.value(item_type, keep) for _ in range(length)]
+        return items if keep else GGUFArray(item_type, length)
+
+
+def _parse(
+    buffer: Any, path: str, file_size: int, tensors: bool, arrays: bool
+) -> GGUFFile:
+    if buffer[:4] != GGUF_MAGIC:
+        raise GGUFError(f"Not a GGUF file: {path}")
+    reader = _Reader(buffer)
+    reader.pos = 4
+    version = reader.unpack("I")
+    if version == 0 or version > 0xFFFF:
+        raise GGUFError(
+            f"Unsupported GGUF version {version} (big-endian files are not supported)"
+        )
+    # Version 1 used 32-bit counts and lengths
+    if version == 1:
+        reader.count_format = "I"
+    tensor_count = reader.count()
+    kv_count = reader.count()
+
+    metadata = {}
+    for _ in range(kv_count):
+        key = reader.string()
+        metadata[key] = reader.value(reader.unpack("I"), arrays)
+
+    gguf = GGUFFile(
+        path=path,
+        version=version,
+        file_size=file_size,
+        metadata=metadata,
+        tensor_count=tensor_count,
+    )
+    if not tensors:
+        return gguf
+
+    table = []
+    for _ in range(tensor_count):
+        name = reader.string()
+        n_dims = reader.unpack("I")
+        shape = tuple(reader.count() for _ in range(n_dims))
+        ggml_type = reader.unpack("I")
+        table.append((name, shape, ggml_type, reader.unpack("Q")))
+
+    alignment = (
+        metadata.get("general.alignment", DEFAULT_ALIGNMENT) or DEFAULT_ALIGNMENT
+    )
+    gguf.data_offset = (reader.pos + alignment - 1) // alignment * alignment
+
+    # Sizes of unknown types fall back to the distance to the next tensor
+    ends = sorted(offset for *_, offset in table) + [file_size - gguf.data_offset]
+    for name, shape, ggml_type, offset in table:
+        count = 1
+        for dim in shape:
+            count *= dim
+        if ggml_type in GGML_TYPES:
+            _, block_size, type_size = GGML_TYPES[ggml_type]
+            nbytes = count // block_size * type_size
+        else:
+            nbytes = next(end for end in ends if end > offset) - offset
+        gguf.tensors.append(
+            GGUFTensor(name, shape, ggml_type, gguf.data_offset + offset, nbytes)
+        )
+    return gguf
+
+
+def read_gguf(path: str, tensors: bool = True, arrays: bool = False) -> GGUFFile:
+    """
+    Parse the header of a GGUF file.
+
+    Args:
+        path: Path to the GGUF file
+        tensors: Also read the tensor table
+        arrays: Read array values (e.g. the vocabulary) instead of
+            returning GGUFArray placeholders
+
+    Returns:
+        Parsed header
+
+    Raises:
+        GGUFError: If the file is not GGUF or is truncated
+        OSError: If the file cannot be read
+    """
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size < 4:
+            raise GGUFError(f"Not a GGUF file: {path}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return _parse(buffer, path, file_size, tensors, arrays)
+
+
+def read_metadata(path: str) -> Dict[str, Any]:
+    """Metadata key/value pairs of a GGUF file, arrays included."""
+    return read_gguf(path, tensors=False, arrays=True).metadata
+
+
+def list_models(directory: str, recursive: bool = True) -> List[GGUFFile]:
+    """
+    Parse every GGUF file in a directory.
+
+    Files that cannot be parsed are logged and skipped. Only the first
+    shard of split models ("-00001-of-00003.gguf") is listed.
+
+    Args:
+        directory: Directory to scan
+        recursive: Also scan subdirectories
+
+    Returns:
+        Parsed headers sorted by path
+    """
+    pattern = (
+        os.path.join(directory, "**", "*.gguf")
+        if recursive
+        else os.path.join(directory, "*.gguf")
+    )
+    models = []
+    for path in sorted(glob.glob(pattern, recursive=recursive)):
+        shard = _SHARD.search(path)
+        if shard and shard.group(1) != "00001":
+            continue
+        try:
+            models.append(read_gguf(path))
+        except (OSError, GGUFError) as e:
+            logger.warning(f"Skipping {path}: {e}")
+    return models
@@ -1,37 +1,59 @@
 """
 GPU availability and information checking utilities.
+
+Availability comes from llama.cpp and the NVIDIA driver's /proc entries, so
+no GPU framework is needed. When the optional torch extra is installed it
+is used for per-device memory details and device selection.
 """
 
 import logging
-import torch
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
+
+from .hardware import (
+    CPUInfo,
+    describe_cpu,
+    llama_supports_gpu_offload,
+    probe_cpu,
+    probe_nvidia_gpus,
+    torch_available,
+)
 
 logger = logging.getLogger(__name__)
 
 
+def _torch():
+    """The torch module if the optional extra is installed and sees CUDA, else None."""
+    # Importing torch takes seconds, skip it on hosts without an NVIDIA GPU
+    if not probe_nvidia_gpus() or not torch_available():
+        return None
+    import torch
+    return torch if torch.cuda.is_available() else None
+
+
 class GPUChecker:
     """Utility class for checking GPU availability and information."""
     
     @staticmethod
     def is_cuda_available() -> bool:
-        """Check if CUDA is available."""
-        return torch.cuda.is_available()
+        """Check if llama.cpp can offload to an NVIDIA GPU on this host."""
+        return bool(probe_nvidia_gpus()) and llama_supports_gpu_offload()
     
     @staticmethod
     def get_gpu_count() -> int:
         """Get the number of available GPUs."""
-        if torch.cuda.is_available():
-            return torch.cuda.device_count()
-        return 0
+        return len(probe_nvidia_gpus())
     
     @staticmethod
-    def get_gpu_info() -> List[Dict[str, any]]:
+    def get_gpu_info() -> List[Dict[str, Any]]:
         """Get detailed information about all available GPUs."""
-        gpu_info = []
-        
-        if not torch.cuda.is_available():
-            return gpu_info
+        torch = _torch()
+        if torch is None:
+            return [
+                {'index': gpu.index, 'name': gpu.name, 'bus_id': gpu.bus_id}
+                for gpu in probe_nvidia_gpus()
+            ]
         
+        gpu_info = []
         for i in range(torch.cuda.device_count()):
             props = torch.cuda.get_device_properties(i)
             gpu_info.append({
@@ -45,18 +67,26 @@ class GPUChecker:
         
         return gpu_info
     
+    @staticmethod
+    def get_cpu_info() -> CPUInfo:
+        """Get CPU topology and SIMD features."""
+        return probe_cpu()
+    
     @staticmethod
     def get_current_gpu() -> Optional[int]:
         """Get the current GPU device index."""
-        if torch.cuda.is_available():
+        torch = _torch()
+        if torch is not None:
             return torch.cuda.current_device()
-        return None
+        return 0 if probe_nvidia_gpus() else None
     
     @staticmethod
     def set_gpu_device(device_index: int) -> bool:
         """Set the current GPU device."""
-        if not torch.cuda.is_available():
-            logger.warning("CUDA is not available")
+        torch = _torch()
+        if torch is None:
+            logger.warning("Selecting a GPU device requires the torch extra; "
+                           "use llama.cpp's main_gpu setting instead")
             return False
         
         if device_index >= torch.cuda.device_count():
@@ -73,8 +103,9 @@ class GPUChecker:
     
     @staticmethod
     def get_memory_info(device_index: int = None) -> Optional[Dict[str, float]]:
-        """Get memory information for a specific GPU device."""
-        if not torch.cuda.is_available():
+        """Get memory information for a GPU device (requires the torch extra)."""
+        torch = _torch()
+        if torch is None:
             return None
         
         if device_index is None:
@@ -97,19 +128,26 @@ class GPUChecker:
     @staticmethod
     def print_gpu_summary():
         """Print a summary of GPU information."""
-        if not torch.cuda.is_available():
-            print("❌ CUDA is not available")
+        gpus = GPUChecker.get_gpu_info()
+        if not gpus or not llama_supports_gpu_offload():
+            if gpus:
+                print(f"❌ Found {len(gpus)} GPU(s) but llama.cpp was built "
+                      f"without GPU support")
+            else:
+                print("❌ CUDA is not available")
+            print(f"🧠 CPU: {describe_cpu()}")
             return
         
-        gpu_count = torch.cuda.device_count()
-        print(f"✅ CUDA is available! Found {gpu_count} GPU(s)")
+        print(f"✅ CUDA is available! Found {len(gpus)} GPU(s)")
         
-        for i in range(gpu_count):
-            gpu_name = torch.cuda.get_device_name(i)
-            gpu_memory = torch.cuda.get_device_properties(i).total_memory / (1024**3)
-            print(f"   GPU {i}: {gpu_name} ({gpu_memory:.1f} GB)")
+        for gpu in gpus:
+            if 'memory_total_gb' in gpu:
+                print(f"   GPU {gpu['index']}: {gpu['name']} "
+                      f"({gpu['memory_total_gb']:.1f} GB)")
+            else:
+                print(f"   GPU {gpu['index']}: {gpu['name']}")
         
-        current_device = torch.cuda.current_device()
+        current_device = GPUChecker.get_current_gpu()
         print(f"🎯 Using GPU device: {current_device}")
         
         # Print memory info for current device
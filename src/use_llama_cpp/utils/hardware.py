@@ -0,0 +1,281 @@
+"""
+Torch-free hardware probing for AI Room application.
+
+Answers the questions the loader needs (can llama.cpp offload to a GPU,
+which GPUs are there, what CPU are we on) from llama.cpp itself, /proc, /sys
+and os, so CPU-only deployments do not need PyTorch installed.
+"""
+
+import glob
+import importlib.util
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# CPU flags that matter for llama.cpp kernels, as named in /proc/cpuinfo
+SIMD_FLAGS = [
+    "sse3", "ssse3", "avx", "avx2", "fma", "f16c",
+    "avx512f", "avx512bw", "avx512vl", "avx512_vnni", "avx512_bf16", "avx_vnni",
+    "amx_int8", "amx_bf16",
+    # aarch64 names
+    "neon", "asimd", "asimddp", "sve", "sve2", "i8mm",
+]
+
+# Linux reports some features under older names
+_FLAG_ALIASES = {"pni": "sse3"}
+
+
+@dataclass
+class CPUInfo:
+    """CPU topology and features of this host."""
+
+    model_name: str
+    logical_cores: int
+    physical_cores: int
+    # CPUs this process may run on (affinity, cpusets)
+    usable_cores: int
+    numa_nodes: int
+    features: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class NUMANode:
+    """A NUMA node with the CPUs and memory attached to it."""
+
+    node_id: int
+    cpus: List[int]
+    memory_total: int
+    memory_free: int
+
+
+@dataclass
+class GPUDevice:
+    """A GPU found without going through a GPU framework."""
+
+    index: int
+    name: str
+    bus_id: str
+
+
+def llama_supports_gpu_offload() -> bool:
+    """Whether the installed llama.cpp build can offload layers to a GPU."""
+    try:
+        import llama_cpp
+        return bool(llama_cpp.llama_supports_gpu_offload())
+    except Exception as e:
+        logger.debug(f"Could not query llama.cpp GPU support: {e}")
+        return False
+
+
+def llama_system_info() -> str:
+    """llama.cpp's own summary of the backends and CPU features it was built with."""
+    try:
+        import llama_cpp
+        return llama_cpp.llama_print_system_info().decode("utf-8", "replace").strip()
+    except Exception as e:
+        logger.debug(f"Could not query llama.cpp system info: {e}")
+        return ""
+
+
+def probe_nvidia_gpus(proc_root: str = "/proc") -> List[GPUDevice]:
+    """
+    List NVIDIA GPUs from the kernel driver's /proc entries.
+
+    Args:
+        proc_root: Root of the proc filesystem
+
+    Returns:
+        Devices in PCI bus order (the default CUDA enumeration order)
+    """
+    devices = []
+    paths = sorted(
+        glob.glob(
+            os.path.join(proc_root, "driver", "nvidia", "gpus", "*", "information")
+        )
+    )
+    for index, path in enumerate(paths):
+        name = "NVIDIA GPU"
+        try:
+            with open(path) as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key.strip() == "Model":
+                        name = value.strip()
+                        break
+        except OSError as e:
+            logger.debug(f"Could not read {path}: {e}")
+        devices.append(GPUDevice(index, name, os.path.basename(os.path.dirname(path))))
+    return devices
+
+
+def probe_cpu(proc_root: str = "/proc", sys_root: str = "/sys") -> CPUInfo:
+    """
+    Probe CPU model, core counts, NUMA nodes and SIMD features.
+
+    Args:
+        proc_root: Root of the proc filesystem
+        sys_root: Root of the sysfs filesystem
+
+    Returns:
+        CPU information; fields fall back to os.cpu_count() where /proc is
+        unavailable
+    """
+    logical = os.cpu_count() or 1
+    model_name = "unknown"
+    flags: Set[str] = set()
+    cores: Set[tuple] = set()
+    processors = 0
+
+    try:
+        with open(os.path.join(proc_root, "cpuinfo")) as f:
+            physical_id = core_id = None
+            for line in f:
+                key, _, value = line.partition(":")
+                key, value = key.strip(), value.strip()
+                if key == "processor":
+                    processors += 1
+                    physical_id = core_id = None
+                elif key in ("model name", "Model") and model_name == "unknown":
+                    model_name = value
+                elif key in ("flags", "Features") and not flags:
+                    flags = {_FLAG_ALIASES.get(flag, flag) for flag in value.split()}
+                elif key == "physical id":
+                    physical_id = value
+                elif key == "core id":
+                    core_id = value
+                if physical_id is not None and core_id is not None:
+                    cores.add((physical_id, core_id))
+    except OSError as e:
+        logger.debug(f"Could not read cpuinfo: {e}")
+
+    if processors:
+        logical = processors
+    # Without core ids (most ARM kernels, some VMs) every processor is a core
+    physical = len(cores) or logical
+
+    try:
+        usable = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        usable = logical
+
+    numa_nodes = (
+        len(
+            glob.glob(os.path.join(sys_root, "devices", "system", "node", "node[0-9]*"))
+        )
+        or 1
+    )
+
+    return CPUInfo(
+        model_name=model_name,
+        logical_cores=logical,
+        physical_cores=physical,
+        usable_cores=usable,
+        numa_nodes=numa_nodes,
+        features={flag for flag in SIMD_FLAGS if flag in flags},
+    )
+
+
+def parse_cpulist(text: str) -> List[int]:
+    """Expand a kernel CPU list such as "0-3,8-11" into CPU numbers."""
+    cpus: List[int] = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        cpus.extend(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def probe_numa_nodes(sys_root: str = "/sys") -> List[NUMANode]:
+    """
+    Read the NUMA topology from sysfs.
+
+    Args:
+        sys_root: Root of the sysfs filesystem
+
+    Returns:
+        Nodes ordered by id, empty where sysfs has no node directory
+        (non-Linux hosts, some containers)
+    """
+    nodes = []
+    for path in glob.glob(
+        os.path.join(sys_root, "devices", "system", "node", "node[0-9]*")
+    ):
+        node_id = int(os.path.basename(path)[4:])
+        cpus: List[int] = []
+        memory = {"MemTotal": 0, "MemFree": 0}
+        try:
+            with open(os.path.join(path, "cpulist")) as f:
+                cpus = parse_cpulist(f.read())
+            # Lines look like "Node 0 MemTotal:       65536000 kB"
+            with open(os.path.join(path, "meminfo")) as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 4 and fields[2].rstrip(":") in memory:
+                        memory[fields[2].rstrip(":")] = int(fields[3]) * 1024
+        except (OSError, ValueError) as e:
+            logger.debug(f"Could not read NUMA node {node_id}: {e}")
+        nodes.append(NUMANode(node_id, cpus, memory["MemTotal"], memory["MemFree"]))
+    return sorted(nodes, key=lambda node: node.node_id)
+
+
+def locked_memory_limit() -> Optional[int]:
+    """
+    Bytes this process may lock in RAM (RLIMIT_MEMLOCK).
+
+    Returns:
+        The soft limit, or None when it is unlimited or cannot be read
+    """
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_MEMLOCK)
+    except (ImportError, AttributeError, OSError, ValueError) as e:
+        logger.debug(f"Could not read the locked memory limit: {e}")
+        return None
+    return None if soft == resource.RLIM_INFINITY else soft
+
+
+def available_memory(proc_root: str = "/proc") -> Optional[int]:
+    """Bytes of memory available without swapping (MemAvailable), or None if unknown."""
+    try:
+        with open(os.path.join(proc_root, "meminfo")) as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError) as e:
+        logger.debug(f"Could not read meminfo: {e}")
+    return None
+
+
+def probe_hardware() -> Dict[str, object]:
+    """
+    Summarize the hardware relevant to running llama.cpp.
+
+    Returns:
+        Dictionary with gpu_offload, gpus, cpu, numa_nodes and llama_system_info
+    """
+    return {
+        "gpu_offload": llama_supports_gpu_offload(),
+        "gpus": probe_nvidia_gpus(),
+        "cpu": probe_cpu(),
+        "numa_nodes": probe_numa_nodes(),
+        "llama_system_info": llama_system_info(),
+    }
+
+
+def torch_available() -> bool:
+    """Whether the optional torch extra is installed, without importing it."""
+    return importlib.util.find_spec("torch") is not None
+
+
+def describe_cpu(cpu: Optional[CPUInfo] = None) -> str:
+    """One-line human readable CPU summary."""
+    cpu = cpu or probe_cpu()
+    features = ", ".join(sorted(cpu.features)) or "none detected"
+    return (
+        f"{cpu.model_name}: {cpu.physical_cores} cores / {cpu.logical_cores} threads "
+        f"({cpu.usable_cores} usable), {cpu.numa_nodes} NUMA node(s), SIMD: {features}"
+    )
@@ -0,0 +1,165 @@
+"""
+Tests for offline batch generation.
+"""
+
+import json
+from unittest.mock import Mock, patch
+
+import pytest
+
+from use_llama_cpp.core.batch import BatchRunner, completed_ids, read_records
+from use_llama_cpp.core.scheduler import SamplingParams, ScheduledRequest
+
+
+class _FakeScheduler:
+    """Scheduler stand-in that finishes one request per step."""
+
+    share_prefix = False
+    context_per_sequence = 512
+
+    def __init__(self, n_parallel=2):
+        self.n_parallel = n_parallel
+        self.requests = []
+        self.max_in_flight = 0
+
+    def submit(self, prompt_tokens, params=None):
+        request = ScheduledRequest(prompt_tokens, params)
+        self.requests.append(request)
+        self.max_in_flight = max(
+            self.max_in_flight, sum(not r.done for r in self.requests)
+        )
+        return request
+
+    def step(self):
+        for request in self.requests:
+            if not request.done:
+                request.output_tokens = [7, 8]
+                request._emit(f" answer to {request.prompt_tokens[-1]} ")
+                request._finish("stop")
+                return 1
+        return 0
+
+
+def _tokenize(model, messages):
+    return [1, len(messages[-1]["content"])], ["</s>"]
+
+
+@pytest.fixture
+def runner():
+    with patch("use_llama_cpp.core.batch.tokenize_chat_prompt", side_effect=_tokenize):
+        yield BatchRunner(
+            Mock(), params=SamplingParams(max_tokens=10), scheduler=_FakeScheduler()
+        )
+
+
+def _write_input(path, records):
+    path.write_text(
+        "".join(
+            line if isinstance(line, str) else json.dumps(line) + "\n"
+            for line in records
+        )
+    )
+    return str(path)
+
+
+class TestBatchRunner:
+    """Test cases for the batch runner."""
+
+    def test_read_records(self, tmp_path):
+        """Test ids default to line numbers and bad lines become errors."""
+        path = _write_input(
+            tmp_path / "in.jsonl",
+            [{"id": "a", "prompt": "x"}, '"plain"\n', "not json\n", "\n", [1]],
+        )
+
+        records = list(read_records(path))
+
+        assert records[0] == {"id": "a", "prompt": "x"}
+        assert records[1] == {"id": 2, "prompt": "plain"}
+        assert records[2]["id"] == 3 and "error" in records[2]
+        assert records[3]["id"] == 5 and "error" in records[3]
+
+    def test_generate_bounds_in_flight(self, runner):
+        """Test every record gets a result while only a few are queued."""
+        records = [{"id": i, "prompt": "q" * i} for i in range(1, 11)]
+
+        results = list(runner.generate(records))
+
+        assert sorted(r["id"] for r in results) == list(range(1, 11))
+        assert results[0] == {
+            "id": 1, "response": "answer to 1", "finish_reason": "stop",
+            "prompt_tokens": 2, "completion_tokens": 2,
+        }
+        assert runner.scheduler.max_in_flight <= 2 * runner.scheduler.n_parallel
+
+    def test_default_context_is_split_between_prompts(self):
+        """Test the created scheduler shares the model's context."""
+        model = Mock()
+        model.n_ctx.return_value = 4096
+
+        with patch("use_llama_cpp.core.batch.BatchScheduler") as scheduler:
+            scheduler.return_value.n_parallel = 8
+            list(BatchRunner(model).generate([]))
+
+        assert scheduler.call_args.kwargs["context_per_sequence"] == 512
+        scheduler.return_value.close.assert_called_once()
+
+    def test_record_overrides_and_errors(self, runner):
+        """Test per-record sampling settings and invalid records."""
+        results = list(runner.generate([
+            {"id": "a", "prompt": "hi", "max_tokens": 3, "stop": "END"},
+            {"id": "b"},
+        ]))
+
+        params = runner.scheduler.requests[0].params
+        assert (params.max_tokens, params.stop) == (3, ["END", "</s>"])
+        assert [r["id"] for r in results] == ["b", "a"]
+        assert "error" in results[0]
+
+    def test_resume_skips_completed(self, runner, tmp_path):
+        """Test an interrupted run continues after the last complete result."""
+        input_path = _write_input(
+            tmp_path / "in.jsonl", [{"id": i, "prompt": "q"} for i in range(5)]
+        )
+        output = tmp_path / "out.jsonl"
+        output.write_text(
+            json.dumps({"id": 0, "response": "done"}) + "\n" + '{"id": 1, "resp'
+        )
+
+        assert completed_ids(str(output)) == {0}
+        summary = runner.run(input_path, str(output))
+
+        lines = [json.loads(line) for line in output.read_text().splitlines()]
+        assert [line["id"] for line in lines] == [0, 1, 2, 3, 4]
+        assert summary["skipped"] == 1
+        assert summary["completed"] == 4
+
+    def test_resume_retries_failed_generations(self, runner, tmp_path):
+        """Test cancelled generations are written but run again on resume."""
+        records = [{"id": 1, "prompt": "q"}, {"id": 2, "prompt": "qq"}, "bad\n"]
+        input_path = _write_input(tmp_path / "in.jsonl", records)
+        output = str(tmp_path / "out.jsonl")
+        scheduler = runner.scheduler
+        step = scheduler.step
+
+        def cancel_second():
+            for request in scheduler.requests:
+                if not request.done and request.prompt_tokens[-1] == 2:
+                    request._finish("cancelled")
+                    return 1
+            return step()
+
+        with patch.object(scheduler, "step", side_effect=cancel_second):
+            first = runner.run(input_path, output)
+        assert first["failed"] == 2
+        assert completed_ids(output) == {1, 3}
+
+        second = runner.run(input_path, output)
+
+        lines = [json.loads(line) for line in open(output)]
+        assert second["skipped"] == 2 and second["completed"] == 1
+        assert lines[-1] == {
+            "id": 2, "response": "answer to 2", "finish_reason": "stop",
+            "prompt_tokens": 2, "completion_tokens": 2,
+        }
+        assert completed_ids(output) == {1, 2, 3}
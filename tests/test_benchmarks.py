@@ -0,0 +1,96 @@
+"""
+Tests for the benchmark suite helpers.
+"""
+
+from unittest.mock import Mock, patch
+
+from use_llama_cpp.benchmarks.inference import (
+    BenchmarkConfig,
+    bench_concurrency,
+    compare_results,
+    percentiles,
+)
+from use_llama_cpp.cli.main import parse_bench_arguments
+
+
+def _report(tokens_per_second, ttft):
+    return {"runs": [{
+        "context_size": 512,
+        "prompt_lengths": [{
+            "prompt_length": 32,
+            "prefill_tokens_per_second": tokens_per_second,
+            "ttft_seconds": ttft,
+        }],
+        "concurrency": [],
+        "chat": {},
+    }]}
+
+
+class TestBenchmarks:
+    """Test cases for benchmark helpers."""
+    
+    def test_percentiles(self):
+        """Test nearest-rank percentiles."""
+        result = percentiles([float(n) for n in range(1, 101)])
+        
+        assert result == {"p50": 50.0, "p95": 95.0, "p99": 99.0}
+    
+    def test_percentiles_empty(self):
+        """Test percentiles of no samples."""
+        assert percentiles([]) == {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    
+    def test_compare_results(self):
+        """Test throughput drops and latency rises are both regressions."""
+        rows = {
+            row["metric"]: row
+            for row in compare_results(_report(100.0, 0.10), _report(80.0, 0.12))
+        }
+        
+        assert rows["ctx512/prompt32/prefill_tokens_per_second"]["verdict"] == "worse"
+        assert rows["ctx512/prompt32/ttft_seconds"]["verdict"] == "worse"
+    
+    def test_compare_results_within_threshold(self):
+        """Test small changes are reported as the same."""
+        rows = compare_results(_report(100.0, 0.10), _report(102.0, 0.099))
+        
+        assert {row["verdict"] for row in rows} == {"same"}
+    
+    def test_concurrency_splits_context(self):
+        """Test concurrent sequences share the model's context."""
+        model = Mock()
+        model.n_ctx.return_value = 1024
+        model.tokenize.return_value = list(range(64))
+        config = BenchmarkConfig(
+            "model.gguf", concurrency=[2, 32], max_tokens=32, repeats=1
+        )
+        
+        with patch("use_llama_cpp.core.scheduler.BatchScheduler") as scheduler:
+            scheduler.return_value.submit.return_value = Mock(
+                output_tokens=[1, 2], submitted_at=0.0, first_token_at=0.1,
+                finished_at=0.2,
+            )
+            results = bench_concurrency(model, config, 32)
+        
+        scheduler.assert_called_once_with(
+            model, n_parallel=2, context_per_sequence=512
+        )
+        assert [result["concurrency"] for result in results] == [2]
+    
+    def test_parse_bench_arguments(self):
+        """Test sweep arguments accept several values."""
+        args = parse_bench_arguments(
+            [
+                "model.gguf",
+                "--prompt-lengths",
+                "16",
+                "64",
+                "--concurrency",
+                "1",
+                "2",
+                "4",
+            ]
+        )
+        
+        assert args.prompt_lengths == [16, 64]
+        assert args.concurrency == [1, 2, 4]
+        assert args.context_sizes == [2048]
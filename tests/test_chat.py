@@ -0,0 +1,375 @@
+"""
+Tests for the AIChat class.
+"""
+
+import asyncio
+import mmap
+import threading
+import zlib
+
+import numpy as np
+import pytest
+from unittest.mock import Mock, patch
+
+from llama_cpp import LlamaState
+
+from use_llama_cpp.core import session
+from use_llama_cpp.core.chat import AIChat, AsyncAIChat
+from use_llama_cpp.core.grammar import GrammarCache
+from use_llama_cpp.core.metrics import MetricsRegistry
+from use_llama_cpp.core.response_cache import ResponseCache
+
+
+def _stream_chunks(*deltas):
+    """Build create_completion stream chunks for the given deltas."""
+    chunks = [{"choices": [{"text": d}]} for d in deltas]
+    chunks.append({"choices": [{"text": "", "finish_reason": "stop"}]})
+    return iter(chunks)
+
+
+def _mock_model(cached_tokens=()):
+    """Create a mock Llama whose context holds the given tokens."""
+    model = Mock()
+    model.input_ids = np.zeros(512, dtype=np.intc)
+    model.input_ids[:len(cached_tokens)] = cached_tokens
+    model.n_tokens = len(cached_tokens)
+    model.model_path = "/models/test.gguf"
+    model.n_ctx.return_value = 512
+    model.tokenize.side_effect = lambda text, **kwargs: text.split()
+    model.n_batch = 8
+    model.n_vocab.return_value = 10
+    return model
+
+
+@pytest.fixture(autouse=True)
+def prompt_tokens():
+    """Tokenize each message of a conversation as one token."""
+    def tokenize(model, messages):
+        return [hash(m["content"]) % 1000 for m in messages], ["<|eot|>"]
+    with patch(
+        "use_llama_cpp.core.chat.tokenize_chat_prompt", side_effect=tokenize
+    ) as mock:
+        yield mock
+
+
+class TestAIChat:
+    """Test cases for AIChat class."""
+    
+    def test_get_response(self):
+        """Test a blocking response is recorded in history."""
+        model = _mock_model()
+        model.create_completion.return_value = {"choices": [{"text": " Hi there. "}]}
+        chat = AIChat(model)
+        
+        assert chat.get_response("Hello") == "Hi there."
+        assert chat.conversation_history[-1] == {
+            "role": "assistant",
+            "content": "Hi there.",
+        }
+        assert "<|eot|>" in model.create_completion.call_args.kwargs["stop"]
+    
+    def test_response_metrics(self):
+        """Test each turn reports token counts to the callback and registry."""
+        model = _mock_model()
+        model.create_completion.return_value = {
+            "choices": [{"text": "Hi", "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 2, "completion_tokens": 3, "total_tokens": 5},
+        }
+        registry = MetricsRegistry()
+        reported = []
+        chat = AIChat(model, metrics=registry, on_metrics=reported.append)
+        
+        chat.get_response("Hello")
+        
+        assert reported == [chat.last_metrics]
+        assert chat.last_metrics.prompt_tokens == 2
+        assert chat.last_metrics.completion_tokens == 3
+        assert chat.last_metrics.finish_reason == "stop"
+        assert 'use_llama_cpp_requests_total{model="test.gguf"} 1' in registry.render()
+    
+    def test_failed_response_metrics(self):
+        """Test failed blocking and streamed turns are both counted as errors."""
+        model = _mock_model()
+        model.create_completion.side_effect = RuntimeError("boom")
+        registry = MetricsRegistry()
+        chat = AIChat(model, metrics=registry)
+        
+        assert chat.get_response("Hello") is None
+        assert chat.last_metrics.finish_reason == "error"
+        assert list(chat.stream_response("Hello")) == []
+        assert chat.last_metrics.finish_reason == "error"
+        
+        text = registry.render()
+        assert 'use_llama_cpp_requests_total{model="test.gguf"} 2' in text
+        assert 'use_llama_cpp_request_errors_total{model="test.gguf"} 2' in text
+    
+    def test_response_cache(self):
+        """Test a repeated deterministic question is answered from the cache."""
+        model = _mock_model()
+        model.create_completion.return_value = {"choices": [{"text": "Paris"}]}
+        cache = ResponseCache()
+        
+        AIChat(model, response_cache=cache).get_response("Capital?", temperature=0)
+        chat = AIChat(model, response_cache=cache)
+        
+        assert list(chat.stream_response("Capital?", temperature=0)) == ["Paris"]
+        assert chat.last_cache_hit is True
+        assert chat.conversation_history[-1] == {
+            "role": "assistant",
+            "content": "Paris",
+        }
+        assert chat.get_response("Capital?", temperature=0.5) == "Paris"
+        assert chat.last_cache_hit is False
+        assert model.create_completion.call_count == 2
+    
+    def test_json_schema_response(self):
+        """Test a schema is compiled once and passed to llama.cpp as a grammar."""
+        model = _mock_model()
+        model.create_completion.return_value = {"choices": [{"text": '{"ok": true}'}]}
+        cache = GrammarCache()
+        chat = AIChat(model, grammar_cache=cache)
+        schema = {"type": "object", "properties": {"ok": {"type": "boolean"}}}
+        
+        chat.get_response("Status?", json_schema=schema)
+        chat.get_response("Again?", json_schema=dict(reversed(list(schema.items()))))
+        
+        assert "ok" in model.create_completion.call_args.kwargs["grammar"]._grammar
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["hits"] == 1
+    
+    def test_stream_response(self):
+        """Test streamed deltas are yielded and recorded once finished."""
+        model = _mock_model()
+        model.create_completion.return_value = _stream_chunks(" Hi", " there", ".")
+        chat = AIChat(model)
+        
+        deltas = list(chat.stream_response("Hello"))
+        
+        assert deltas == ["Hi", " there", "."]
+        assert model.create_completion.call_args.kwargs["stream"] is True
+        assert chat.conversation_history[-1] == {
+            "role": "assistant",
+            "content": "Hi there.",
+        }
+    
+    def test_stream_response_error(self):
+        """Test a failing stream ends quietly without recording a reply."""
+        model = _mock_model()
+        model.create_completion.side_effect = RuntimeError("boom")
+        chat = AIChat(model)
+        
+        assert list(chat.stream_response("Hello")) == []
+        assert chat.conversation_history[-1]["role"] == "user"
+    
+    def test_astream_response(self):
+        """Test the async iterator yields the same deltas."""
+        model = _mock_model()
+        model.create_completion.return_value = _stream_chunks("Hi", "!")
+        chat = AIChat(model)
+        
+        async def collect():
+            return [d async for d in chat.astream_response("Hello")]
+        
+        assert asyncio.run(collect()) == ["Hi", "!"]
+        assert chat.conversation_history[-1] == {"role": "assistant", "content": "Hi!"}
+    
+    def test_async_chat_stops_abandoned_stream(self):
+        """Test leaving an async stream early stops generation on the worker thread."""
+        model = _mock_model()
+        produced = []
+        closed = threading.Event()
+        
+        def tokens(**kwargs):
+            try:
+                for i in range(1000):
+                    produced.append(i)
+                    yield {"choices": [{"text": f"t{i} "}]}
+            finally:
+                closed.set()
+        
+        model.create_completion.side_effect = tokens
+        chat = AsyncAIChat(model)
+        
+        async def take_two():
+            deltas = []
+            async for delta in chat.stream_response("Hello"):
+                deltas.append(delta)
+                if len(deltas) == 2:
+                    break
+            return deltas
+        
+        assert asyncio.run(take_two()) == ["t0 ", "t1 "]
+        assert closed.wait(5)
+        assert len(produced) < 1000
+        assert chat.get_conversation_history()[-1]["role"] == "assistant"
+    
+    def test_async_get_response(self):
+        """Test a complete async response is recorded in history."""
+        model = _mock_model()
+        model.create_completion.return_value = _stream_chunks(" Hi", "!")
+        chat = AsyncAIChat(model)
+        
+        assert asyncio.run(chat.get_response("Hello")) == "Hi!"
+        assert chat.get_conversation_history()[-1] == {
+            "role": "assistant",
+            "content": "Hi!",
+        }
+    
+    def test_prefix_reused_from_kv_cache(self):
+        """Test cached tokens matching the prompt prefix are reported as reused."""
+        chat = AIChat(_mock_model())
+        system_token = hash(chat.system_prompt) % 1000
+        chat.model = _mock_model([system_token])
+        chat.model.create_completion.return_value = {"choices": [{"text": "Hi"}]}
+        
+        chat.get_response("Hello")
+        
+        assert chat.last_prompt_tokens == 2
+        assert chat.last_cached_tokens == 1
+    
+    def test_clobbered_cache_restores_snapshot(self):
+        """Test the snapshot is reloaded after another session used the model."""
+        model = _mock_model([1, 2, 3])
+        model.create_completion.return_value = {"choices": [{"text": "Hi"}]}
+        chat = AIChat(model, snapshot_kv=True)
+        chat.get_response("Hello")
+        snapshot = model.save_state.return_value
+        
+        # Another session replaces the context contents
+        model.input_ids[:3] = [7, 8, 9]
+        chat.get_response("Again")
+        
+        model.load_state.assert_called_once_with(snapshot)
+    
+    def test_reset_drops_snapshot(self):
+        """Test a reset conversation does not restore the old KV snapshot."""
+        model = _mock_model([1, 2, 3])
+        model.create_completion.return_value = {"choices": [{"text": "Hi"}]}
+        chat = AIChat(model, snapshot_kv=True)
+        chat.get_response("Hello")
+        
+        chat.reset_conversation()
+        model.input_ids[:3] = [7, 8, 9]
+        chat.get_response("Again")
+        
+        model.load_state.assert_not_called()
+    
+    def test_long_history_is_truncated(self, prompt_tokens):
+        """Test old turns are dropped so the prompt fits next to max_tokens."""
+        model = _mock_model()
+        model.n_ctx.return_value = 64
+        model.create_completion.return_value = {"choices": [{"text": "ok"}]}
+        chat = AIChat(model, system_prompt="Be brief.")
+        for i in range(6):
+            chat.add_message("user", f"question {i}")
+            chat.add_message("assistant", f"answer {i}")
+        
+        assert chat.get_response("last question", max_tokens=20) == "ok"
+        
+        sent = prompt_tokens.call_args.args[1]
+        assert sent[0]["content"] == "Be brief."
+        assert sent[1]["role"] == "user"
+        assert sent[-1]["content"] == "last question"
+        assert len(sent) < len(chat.conversation_history)
+        # The full history is kept
+        assert len(chat.conversation_history) == 15
+    
+    def test_message_too_long_for_context(self, prompt_tokens):
+        """Test a message that cannot fit returns None instead of overflowing."""
+        prompt_tokens.side_effect = lambda model, messages: (
+            [0] * sum(len(m["content"].split()) for m in messages), []
+        )
+        model = _mock_model()
+        model.n_ctx.return_value = 64
+        chat = AIChat(model)
+        
+        assert chat.get_response("word " * 100, max_tokens=20) is None
+        model.create_completion.assert_not_called()
+
+    @pytest.mark.parametrize("compress", [False, True])
+    def test_session_round_trip(self, tmp_path, compress):
+        """Test a saved session resumes with its history and KV state."""
+        model = _mock_model([4, 5, 6])
+        model.create_completion.return_value = {"choices": [{"text": "Hi"}]}
+        model.save_state.return_value = LlamaState(
+            input_ids=model.input_ids.copy(),
+            scores=np.zeros((3, 10), dtype=np.single),
+            n_tokens=3,
+            llama_state=b"kv-data" * 10,
+            llama_state_size=70,
+            seed=42,
+        )
+        chat = AIChat(model, system_prompt="Be brief.")
+        chat.get_response("Hello")
+        path = str(tmp_path / "chat.session")
+        
+        assert chat.save_session(path, compress=compress) is True
+        
+        resumed_model = _mock_model()
+        resumed = AIChat.load_session(resumed_model, path)
+        state = resumed_model.load_state.call_args.args[0]
+        
+        assert resumed.system_prompt == "Be brief."
+        assert resumed.conversation_history == chat.conversation_history
+        assert state.n_tokens == 3
+        assert list(state.input_ids[:3]) == [4, 5, 6]
+        assert bytes(state.llama_state) == b"kv-data" * 10
+    
+    @pytest.mark.parametrize("compress", [False, True])
+    def test_load_session_closes_mapping(self, tmp_path, compress):
+        """Test the session file is unmapped when its KV state is not used."""
+        model = _mock_model([4, 5, 6])
+        model.save_state.return_value = LlamaState(
+            input_ids=model.input_ids.copy(),
+            scores=np.zeros((3, 10), dtype=np.single),
+            n_tokens=3,
+            llama_state=b"kv-data" * 10,
+            llama_state_size=70,
+            seed=42,
+        )
+        path = str(tmp_path / "chat.session")
+        assert AIChat(model).save_session(path, compress=compress) is True
+        
+        mapped = []
+        def record(*args, **kwargs):
+            mapped.append(real_mmap(*args, **kwargs))
+            return mapped[-1]
+        real_mmap = mmap.mmap
+        other_model = _mock_model()
+        other_model.model_path = "/models/other.gguf"
+        with patch("use_llama_cpp.core.session.mmap.mmap", side_effect=record):
+            resumed = AIChat.load_session(other_model, path)
+        
+        assert resumed is not None
+        other_model.load_state.assert_not_called()
+        assert mapped[0].closed
+    
+    def test_load_session_invalid_file(self, tmp_path):
+        """Test a non-session file is rejected."""
+        path = tmp_path / "bogus.session"
+        path.write_bytes(b"not a session file")
+        
+        assert AIChat.load_session(_mock_model(), str(path)) is None
+    
+    def test_load_session_keeps_decompress_error(self, tmp_path):
+        """Test a corrupt KV state raises its own error, not the unmap failure."""
+        model = _mock_model([4, 5, 6])
+        state = LlamaState(
+            input_ids=model.input_ids.copy(),
+            scores=np.zeros((3, 10), dtype=np.single),
+            n_tokens=3,
+            llama_state=b"kv-data" * 10,
+            llama_state_size=70,
+            seed=42,
+        )
+        path = tmp_path / "chat.session"
+        session.save_session(str(path), [], "", model, state, compress=True)
+        data = path.read_bytes()
+        path.write_bytes(data[:-8] + b"\xff" * 8)
+        
+        with pytest.raises(zlib.error):
+            session.load_session(str(path), _mock_model())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
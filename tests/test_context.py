@@ -0,0 +1,93 @@
+"""
+Tests for the context window policies.
+"""
+
+from use_llama_cpp.core.context import (
+    ContextWindow,
+    KeepLastNPolicy,
+    SlidingWindowPolicy,
+    SummarizePolicy,
+)
+
+
+def _history(turns):
+    """Build a conversation of `turns` user/assistant pairs."""
+    history = [{"role": "system", "content": "system"}]
+    for i in range(turns):
+        history.append({"role": "user", "content": f"question {i}"})
+        history.append({"role": "assistant", "content": f"answer {i}"})
+    return history
+
+
+def _count(message):
+    """Every message costs ten tokens."""
+    return 10
+
+
+class TestContextPolicies:
+    """Test cases for the context policies."""
+
+    def test_sliding_window_keeps_fitting_history(self):
+        """Test nothing is dropped while the history fits."""
+        history = _history(2)
+        window = SlidingWindowPolicy().fit(history, ContextWindow(), 100, _count)
+
+        assert window.start == 1
+
+    def test_sliding_window_drops_to_low_water(self):
+        """Test the oldest turns are dropped down to the low-water mark."""
+        history = _history(5)
+        policy = SlidingWindowPolicy(low_water=0.5)
+        window = policy.fit(history, ContextWindow(), 100, _count)
+        messages = policy.messages(history, window)
+
+        assert len(messages) * 10 <= 50
+        assert messages[0]["role"] == "system"
+        assert messages[1]["role"] == "user"
+        assert messages[-1] == history[-1]
+
+    def test_sliding_window_is_stable_between_turns(self):
+        """Test the window does not move again right after dropping."""
+        history = _history(5)
+        policy = SlidingWindowPolicy(low_water=0.5)
+        window = policy.fit(history, ContextWindow(), 100, _count)
+        history.append({"role": "user", "content": "next"})
+
+        assert policy.fit(history, window, 100, _count) == window
+
+    def test_keep_last_n(self):
+        """Test only the last N messages are kept."""
+        history = _history(5)
+        policy = KeepLastNPolicy(n=4)
+        window = policy.fit(history, ContextWindow(), 1000, _count)
+
+        assert policy.messages(history, window)[1:] == history[-4:]
+
+    def test_summarize_replaces_dropped_turns(self):
+        """Test dropped turns are folded into the system message."""
+        history = _history(5)
+        calls = []
+
+        def summarize(messages, previous):
+            calls.append(messages)
+            return "they talked"
+
+        policy = SummarizePolicy(summarize, low_water=0.5)
+        window = policy.fit(history, ContextWindow(), 100, _count)
+        messages = policy.messages(history, window)
+
+        assert calls and calls[0][0] == history[1]
+        assert "they talked" in messages[0]["content"]
+        assert messages[-1] == history[-1]
+
+    def test_summarize_failure_drops_turns(self):
+        """Test a failing summarizer still lets the prompt fit."""
+        def summarize(messages, previous):
+            raise RuntimeError("boom")
+
+        history = _history(5)
+        policy = SummarizePolicy(summarize, low_water=0.5)
+        window = policy.fit(history, ContextWindow(), 100, _count)
+
+        assert window.summary is None
+        assert len(policy.messages(history, window)) * 10 <= 100
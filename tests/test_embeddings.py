@@ -0,0 +1,52 @@
+"""
+Tests for batched embeddings.
+"""
+
+from unittest.mock import Mock
+
+import numpy as np
+import pytest
+
+from use_llama_cpp.core.embeddings import Embedder, l2_normalize
+
+
+def _embedder(model_pooling):
+    """Embedder with the given model pooling, without a real model."""
+    embedder = Embedder.__new__(Embedder)
+    embedder.model_pooling = model_pooling
+    return embedder
+
+
+class TestEmbedder:
+    """Test cases for Embedder class."""
+
+    def test_l2_normalize(self):
+        """Test rows are scaled to unit length and zero rows stay zero."""
+        vectors = np.array([[3.0, 4.0], [0.0, 0.0]], dtype=np.float32)
+
+        result = l2_normalize(vectors)
+
+        assert result is vectors
+        np.testing.assert_allclose(result, [[0.6, 0.8], [0.0, 0.0]])
+
+    def test_requires_embedding_mode(self):
+        """Test a model loaded for generation is rejected."""
+        model = Mock()
+        model.context_params.embeddings = False
+
+        with pytest.raises(ValueError):
+            Embedder(model)
+
+    def test_resolve_pooling(self):
+        """Test per-request pooling is only allowed when the model does not pool."""
+        assert _embedder("none").resolve_pooling(None) == "mean"
+        assert _embedder("none").resolve_pooling("last") == "last"
+        assert _embedder("cls").resolve_pooling(None) == "cls"
+        with pytest.raises(ValueError):
+            _embedder("mean").resolve_pooling("last")
+        with pytest.raises(ValueError):
+            _embedder("none").resolve_pooling("max")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
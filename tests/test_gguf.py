@@ -0,0 +1,126 @@
+"""
+Tests for the GGUF header parser.
+"""
+
+import struct
+
+import pytest
+
+from use_llama_cpp.core.model_loader import ModelLoader
+from use_llama_cpp.utils.gguf import GGUFArray, GGUFError, list_models, read_gguf
+
+
+def _string(value):
+    data = value.encode("utf-8")
+    return struct.pack("<Q", len(data)) + data
+
+
+def _write_gguf(path, tensor_bytes=None):
+    """Write a small GGUF file with one Q8_0 and one F32 tensor."""
+    metadata = [
+        ("general.architecture", struct.pack("<I", 8) + _string("llama")),
+        ("general.name", struct.pack("<I", 8) + _string("Test Model")),
+        ("general.file_type", struct.pack("<II", 4, 15)),
+        ("llama.context_length", struct.pack("<II", 4, 4096)),
+        (
+            "tokenizer.ggml.tokens",
+            struct.pack("<IIQ", 9, 8, 3)
+            + b"".join(_string(t) for t in ("a", "bb", "ccc")),
+        ),
+        (
+            "tokenizer.ggml.scores",
+            struct.pack("<IIQ", 9, 6, 2) + struct.pack("<2f", 0.5, -1.0),
+        ),
+    ]
+    tensors = [
+        ("blk.0.attn_q.weight", (64, 2), 8, 0),
+        ("output_norm.weight", (64,), 0, 160),
+    ]
+
+    header = b"GGUF" + struct.pack("<IQQ", 3, len(tensors), len(metadata))
+    for key, value in metadata:
+        header += _string(key) + value
+    for name, shape, ggml_type, offset in tensors:
+        header += _string(name) + struct.pack("<I", len(shape))
+        header += b"".join(struct.pack("<Q", dim) for dim in shape)
+        header += struct.pack("<IQ", ggml_type, offset)
+    header += b"\0" * (-len(header) % 32)
+    # 4 blocks of Q8_0 (136 bytes) padded to 160, then 64 floats
+    data = b"\1" * (160 + 256 if tensor_bytes is None else tensor_bytes)
+    path.write_bytes(header + data)
+    return str(path), len(header)
+
+
+class TestGGUF:
+    """Test cases for the GGUF parser."""
+
+    def test_metadata_and_tensors(self, tmp_path):
+        """Test metadata values, the tensor table and derived properties."""
+        path, data_offset = _write_gguf(tmp_path / "model.gguf")
+
+        gguf = read_gguf(path)
+
+        assert gguf.architecture == "llama"
+        assert gguf.name == "Test Model"
+        assert gguf.quantization == "Q4_K_M"
+        assert gguf.context_length == 4096
+        assert gguf.metadata["tokenizer.ggml.tokens"] == GGUFArray(8, 3)
+        assert gguf.data_offset == data_offset
+        assert [t.name for t in gguf.tensors] == [
+            "blk.0.attn_q.weight",
+            "output_norm.weight",
+        ]
+        assert gguf.tensors[0].type_name == "Q8_0"
+        assert gguf.tensors[0].nbytes == 136
+        assert gguf.tensors[1].offset == data_offset + 160
+        assert gguf.parameter_count == 192
+
+    def test_arrays_on_request(self, tmp_path):
+        """Test array values are read when asked for."""
+        path, _ = _write_gguf(tmp_path / "model.gguf")
+
+        gguf = read_gguf(path, tensors=False, arrays=True)
+
+        assert gguf.metadata["tokenizer.ggml.tokens"] == ["a", "bb", "ccc"]
+        assert gguf.metadata["tokenizer.ggml.scores"] == [0.5, -1.0]
+        assert gguf.tensors == []
+
+    def test_not_gguf(self, tmp_path):
+        """Test other files are rejected."""
+        path = tmp_path / "model.gguf"
+        path.write_bytes(b"PK\3\4 not a model")
+
+        with pytest.raises(GGUFError):
+            read_gguf(str(path))
+
+    def test_truncated_header(self, tmp_path):
+        """Test a header cut short raises instead of reading garbage."""
+        path, data_offset = _write_gguf(tmp_path / "model.gguf")
+        with open(path, "r+b") as f:
+            f.truncate(data_offset // 2)
+
+        with pytest.raises(GGUFError):
+            read_gguf(path)
+
+    def test_validate_rejects_truncated_model(self, tmp_path):
+        """Test validation fails when tensor data is missing."""
+        complete, _ = _write_gguf(tmp_path / "complete.gguf")
+        truncated, _ = _write_gguf(tmp_path / "truncated.gguf", tensor_bytes=100)
+
+        assert ModelLoader(complete).validate_model_path() is True
+        assert ModelLoader(truncated).validate_model_path() is False
+
+    def test_list_models(self, tmp_path):
+        """Test directory listing skips unreadable files and later shards."""
+        _write_gguf(tmp_path / "a.gguf")
+        (tmp_path / "sub").mkdir()
+        _write_gguf(tmp_path / "sub" / "b-00001-of-00002.gguf")
+        _write_gguf(tmp_path / "sub" / "b-00002-of-00002.gguf")
+        (tmp_path / "broken.gguf").write_bytes(b"nope")
+
+        found = list_models(str(tmp_path))
+
+        assert [g.path for g in found] == [
+            str(tmp_path / "a.gguf"),
+            str(tmp_path / "sub" / "b-00001-of-00002.gguf"),
+        ]
@@ -0,0 +1,61 @@
+"""
+Tests for the compiled grammar cache.
+"""
+
+import pytest
+
+from use_llama_cpp.core.grammar import GrammarCache, grammar_key
+
+
+class TestGrammarCache:
+    """Test cases for GrammarCache class."""
+
+    def test_schema_compiled_once(self):
+        """Test equal schemas in any key order or as JSON text share one grammar."""
+        cache = GrammarCache()
+        schema = {
+            "type": "object",
+            "properties": {"name": {"type": "string"}},
+            "required": ["name"],
+        }
+
+        grammar = cache.get(json_schema=schema)
+
+        assert (
+            cache.get(
+                json_schema='{"required": ["name"], "type": "object", '
+                '"properties": {"name": {"type": "string"}}}'
+            )
+            is grammar
+        )
+        assert "name" in grammar._grammar
+        assert cache.stats()["hits"] == 1
+        assert grammar_key(gbnf="root ::= \"a\"") != grammar_key(json_schema=schema)
+
+    def test_lru_eviction(self):
+        """Test least recently used grammars are dropped over capacity."""
+        cache = GrammarCache(capacity=2)
+        first = cache.get(gbnf='root ::= "a"')
+        cache.get(gbnf='root ::= "b"')
+        cache.get(gbnf='root ::= "a"')
+        cache.get(gbnf='root ::= "c"')
+
+        assert cache.get(gbnf='root ::= "a"') is first
+        assert cache.stats()["entries"] == 2
+        assert cache.stats()["misses"] == 3
+
+    def test_invalid_input(self):
+        """Test invalid schemas and ambiguous arguments raise ValueError."""
+        cache = GrammarCache()
+
+        with pytest.raises(ValueError):
+            cache.get(json_schema="{not json")
+        with pytest.raises(ValueError):
+            cache.get()
+        with pytest.raises(ValueError):
+            cache.get(json_schema={}, gbnf='root ::= "a"')
+        assert cache.stats()["entries"] == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
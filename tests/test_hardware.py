@@ -0,0 +1,141 @@
+"""
+Tests for torch-free hardware probing.
+"""
+
+from unittest.mock import patch
+
+from use_llama_cpp.utils.gpu_checker import GPUChecker
+from use_llama_cpp.utils.hardware import (
+    GPUDevice,
+    parse_cpulist,
+    probe_cpu,
+    probe_numa_nodes,
+    probe_nvidia_gpus,
+)
+
+CPUINFO = """\
+processor	: 0
+model name	: Test CPU
+physical id	: 0
+core id		: 0
+flags		: fpu sse3 avx avx2 fma f16c
+
+processor	: 1
+model name	: Test CPU
+physical id	: 0
+core id		: 0
+flags		: fpu sse3 avx avx2 fma f16c
+
+processor	: 2
+model name	: Test CPU
+physical id	: 0
+core id		: 1
+flags		: fpu sse3 avx avx2 fma f16c
+
+processor	: 3
+model name	: Test CPU
+physical id	: 0
+core id		: 1
+flags		: fpu sse3 avx avx2 fma f16c
+"""
+
+
+class TestHardware:
+    """Test cases for hardware probing."""
+    
+    def test_probe_cpu(self, tmp_path):
+        """Test cores, NUMA nodes and SIMD flags are read from /proc and /sys."""
+        (tmp_path / "proc").mkdir()
+        (tmp_path / "proc" / "cpuinfo").write_text(CPUINFO)
+        for node in ("node0", "node1"):
+            (tmp_path / "sys" / "devices" / "system" / "node" / node).mkdir(
+                parents=True
+            )
+        
+        cpu = probe_cpu(str(tmp_path / "proc"), str(tmp_path / "sys"))
+        
+        assert cpu.model_name == "Test CPU"
+        assert cpu.logical_cores == 4
+        assert cpu.physical_cores == 2
+        assert cpu.numa_nodes == 2
+        assert cpu.features == {"sse3", "avx", "avx2", "fma", "f16c"}
+    
+    def test_probe_cpu_without_proc(self, tmp_path):
+        """Test probing falls back to os.cpu_count when /proc is missing."""
+        cpu = probe_cpu(str(tmp_path), str(tmp_path))
+        
+        assert cpu.logical_cores >= 1
+        assert cpu.physical_cores == cpu.logical_cores
+        assert cpu.numa_nodes == 1
+    
+    def test_probe_numa_nodes(self, tmp_path):
+        """Test node CPUs and memory are read from sysfs."""
+        node = tmp_path / "devices" / "system" / "node" / "node1"
+        node.mkdir(parents=True)
+        (node / "cpulist").write_text("8-11,20\n")
+        (node / "meminfo").write_text(
+            "Node 1 MemTotal:       2048 kB\nNode 1 MemFree:        1024 kB\n"
+        )
+        
+        assert parse_cpulist("0-2,5") == [0, 1, 2, 5]
+        nodes = probe_numa_nodes(str(tmp_path))
+        assert [(n.node_id, n.cpus, n.memory_total, n.memory_free) for n in nodes] == [
+            (1, [8, 9, 10, 11, 20], 2048 * 1024, 1024 * 1024)
+        ]
+    
+    def test_probe_nvidia_gpus(self, tmp_path):
+        """Test GPU names are read from the driver's /proc entries."""
+        gpu_dir = tmp_path / "driver" / "nvidia" / "gpus" / "0000:01:00.0"
+        gpu_dir.mkdir(parents=True)
+        (gpu_dir / "information").write_text("Model: \t\t NVIDIA Test GPU\nIRQ: 42\n")
+        
+        assert probe_nvidia_gpus(str(tmp_path)) == [
+            GPUDevice(0, "NVIDIA Test GPU", "0000:01:00.0")
+        ]
+    
+    def test_gpu_checker_without_torch(self):
+        """Test GPUChecker answers without the torch extra."""
+        gpus = [GPUDevice(0, "NVIDIA Test GPU", "0000:01:00.0")]
+        with (
+            patch(
+                "use_llama_cpp.utils.gpu_checker.probe_nvidia_gpus", return_value=gpus
+            ),
+            patch(
+                "use_llama_cpp.utils.gpu_checker.llama_supports_gpu_offload",
+                return_value=True,
+            ),
+            patch(
+                "use_llama_cpp.utils.gpu_checker.torch_available", return_value=False
+            ),
+        ):
+            assert GPUChecker.is_cuda_available()
+            assert GPUChecker.get_gpu_count() == 1
+            assert GPUChecker.get_gpu_info()[0]["name"] == "NVIDIA Test GPU"
+            assert GPUChecker.get_memory_info() is None
+            assert not GPUChecker.set_gpu_device(0)
+    
+    def test_gpu_checker_skips_torch_without_gpu(self):
+        """Test torch is not imported on a host without an NVIDIA GPU."""
+        with (
+            patch("use_llama_cpp.utils.gpu_checker.probe_nvidia_gpus", return_value=[]),
+            patch(
+                "use_llama_cpp.utils.gpu_checker.torch_available", return_value=True
+            ) as torch_available,
+        ):
+            assert GPUChecker.get_gpu_info() == []
+            assert GPUChecker.get_memory_info() is None
+            torch_available.assert_not_called()
+    
+    def test_gpu_checker_cpu_build(self):
+        """Test a GPU is not reported usable when llama.cpp cannot offload."""
+        gpus = [GPUDevice(0, "NVIDIA Test GPU", "0000:01:00.0")]
+        with (
+            patch(
+                "use_llama_cpp.utils.gpu_checker.probe_nvidia_gpus", return_value=gpus
+            ),
+            patch(
+                "use_llama_cpp.utils.gpu_checker.llama_supports_gpu_offload",
+                return_value=False,
+            ),
+        ):
+            assert not GPUChecker.is_cuda_available()
@@ -0,0 +1,85 @@
+"""
+Tests for the PrefixStateCache class.
+"""
+
+import numpy as np
+import pytest
+from unittest.mock import Mock
+
+from llama_cpp import LlamaState
+
+from use_llama_cpp.core.kv_cache import PrefixStateCache
+
+
+def _mock_model(state_bytes=100):
+    """Create a mock Llama whose saved states hold `state_bytes` of KV data."""
+    model = Mock()
+    model.model_path = "/models/test.gguf"
+    model.n_ctx.return_value = 16
+    model.n_batch = 8
+    model._logits_all = False
+    model.save_state.side_effect = lambda: LlamaState(
+        input_ids=np.zeros(16, dtype=np.intc),
+        scores=np.zeros((8, 10), dtype=np.single),
+        n_tokens=4,
+        llama_state=b"\0" * state_bytes,
+        llama_state_size=state_bytes,
+        seed=0,
+    )
+    return model
+
+
+class TestPrefixStateCache:
+    """Test cases for PrefixStateCache class."""
+    
+    def test_longest_prefix_lookup(self):
+        """Test the longest cached prefix of the prompt is returned."""
+        model = _mock_model()
+        cache = PrefixStateCache()
+        cache.save(model, [1, 2])
+        cache.save(model, [1, 2, 3])
+        cache.save(model, [9])
+        
+        n_tokens, state = cache.lookup(model, [1, 2, 3, 4])
+        
+        assert n_tokens == 3
+        assert state.scores.shape == (1, 10)
+        assert cache.lookup(model, [5, 6]) is None
+        assert (cache.hits, cache.misses) == (1, 1)
+    
+    def test_other_model_misses(self):
+        """Test states are not shared between different models."""
+        cache = PrefixStateCache()
+        cache.save(_mock_model(), [1, 2])
+        other = _mock_model()
+        other.model_path = "/models/other.gguf"
+        
+        assert cache.lookup(other, [1, 2, 3]) is None
+    
+    def test_lru_eviction(self):
+        """Test least recently used states are evicted to stay within budget."""
+        model = _mock_model(state_bytes=1000)
+        one_entry = 1000 + 16 * 4 + 10 * 4
+        cache = PrefixStateCache(capacity_bytes=2 * one_entry)
+        cache.save(model, [1])
+        cache.save(model, [2])
+        cache.lookup(model, [1, 5])
+        cache.save(model, [3])
+        
+        assert len(cache) == 2
+        assert (model, [1]) in cache
+        assert (model, [2]) not in cache
+        assert cache.size_bytes <= cache.capacity_bytes
+    
+    def test_restore_loads_state(self):
+        """Test restore loads the cached state into the model."""
+        model = _mock_model()
+        cache = PrefixStateCache()
+        cache.save(model, [1, 2])
+        
+        assert cache.restore(model, [1, 2, 3]) == 2
+        model.load_state.assert_called_once()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
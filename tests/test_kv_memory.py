@@ -0,0 +1,104 @@
+"""
+Tests for KV cache sizing.
+"""
+
+import pytest
+
+from use_llama_cpp.core.kv_memory import estimate_kv_memory, plan_kv_cache
+from use_llama_cpp.utils.gguf import read_gguf
+
+from .test_pool import _gguf
+
+
+def _model(tmp_path, head_size=32):
+    """Header of a model with 2 layers, 4 heads and 2 KV heads."""
+    return read_gguf(_gguf(tmp_path / "m.gguf", {
+        "general.architecture": "llama",
+        "llama.block_count": 2,
+        "llama.embedding_length": 4 * head_size,
+        "llama.attention.head_count": 4,
+        "llama.attention.head_count_kv": 2,
+    }))
+
+
+@pytest.fixture
+def gguf(tmp_path):
+    return _model(tmp_path)
+
+
+class TestKVMemory:
+    """Test cases for the KV cache estimator and planner."""
+
+    def test_estimate(self, gguf):
+        """Test KV cache and attention buffer sizes per cache type."""
+        f16 = estimate_kv_memory(gguf, 1000)
+        # 2 layers x 2 KV heads x (32 + 32) dims x 2 bytes per cell
+        assert f16.kv_bytes == 1000 * 512
+        # f32 scores of 4 heads x 1000 cells x 512 micro-batch tokens
+        assert f16.attention_bytes == 4 * 1000 * 512 * 4
+
+        q8 = estimate_kv_memory(
+            gguf, 500, n_seq=2, type_k="q8_0", type_v="q8_0", flash_attn=True
+        )
+        # A 32-element q8_0 block takes 34 bytes
+        assert q8.n_cells == 1000
+        assert q8.kv_bytes == 1000 * 4 * (34 + 34)
+        assert q8.total_bytes == q8.kv_bytes
+
+        with pytest.raises(ValueError):
+            estimate_kv_memory(gguf, 1000, type_k="q3_k")
+
+    def test_block_size_must_divide_head_size(self, tmp_path):
+        """Test quantized types are refused or skipped for small heads."""
+        gguf = _model(tmp_path, head_size=16)
+        with pytest.raises(ValueError, match="head size"):
+            estimate_kv_memory(gguf, 1000, type_k="q8_0")
+
+        plan = plan_kv_cache(gguf, 1000, budget=1_300_000, other_bytes=1_000_000)
+        assert (plan.type_k, plan.flash_attn) == ("f16", True)
+        with pytest.raises(ValueError, match="budget"):
+            plan_kv_cache(gguf, 1000, budget=1_200_000, other_bytes=1_000_000)
+
+    def test_plan_downgrades_auto_settings(self, gguf):
+        """Test flash attention and cache quantization are enabled to fit the budget."""
+        plan = plan_kv_cache(gguf, 1000)
+        assert (plan.type_k, plan.type_v, plan.flash_attn) == ("f16", "f16", False)
+        assert not plan.notes
+
+        plan = plan_kv_cache(gguf, 1000, budget=1_600_000, other_bytes=1_000_000)
+        assert (plan.type_k, plan.type_v, plan.flash_attn) == ("f16", "f16", True)
+        assert plan.notes
+
+        plan = plan_kv_cache(gguf, 1000, budget=1_300_000, other_bytes=1_000_000)
+        assert (plan.type_k, plan.type_v, plan.flash_attn) == ("q8_0", "q8_0", True)
+        assert plan.llama_params() == {"type_k": 8, "type_v": 8, "flash_attn": True}
+
+        plan = plan_kv_cache(
+            gguf, 1000, type_k="q8_0", budget=1_250_000, other_bytes=1_000_000
+        )
+        assert (plan.type_k, plan.type_v) == ("q8_0", "q4_0")
+
+        with pytest.raises(ValueError, match="budget"):
+            plan_kv_cache(gguf, 1000, budget=1_100_000, other_bytes=1_000_000)
+
+    def test_plan_keeps_explicit_settings(self, gguf):
+        """Test explicit settings are never downgraded."""
+        with pytest.raises(ValueError, match="budget"):
+            plan_kv_cache(
+                gguf,
+                1000,
+                type_k="f16",
+                type_v="f16",
+                budget=1_300_000,
+                other_bytes=1_000_000,
+            )
+
+        # Without flash attention only keys can be quantized
+        plan = plan_kv_cache(
+            gguf, 1000, flash_attn=False, budget=9_600_000, other_bytes=1_000_000
+        )
+        assert (plan.type_k, plan.type_v, plan.flash_attn) == ("q8_0", "f16", False)
+
+        with pytest.raises(ValueError, match="flash attention"):
+            plan_kv_cache(gguf, 1000, type_v="q8_0", flash_attn=False)
+        assert plan_kv_cache(gguf, 1000, type_v="q8_0").flash_attn
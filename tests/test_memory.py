@@ -0,0 +1,84 @@
+"""
+Tests for mmap, mlock and NUMA placement of model weights.
+"""
+
+import pytest
+
+from use_llama_cpp.core.memory import NUMA_STRATEGIES, mapping_stats, plan_memory
+from use_llama_cpp.utils.hardware import NUMANode
+
+GB = 1024 ** 3
+
+NODES = [
+    NUMANode(0, [0, 1, 2, 3], 64 * GB, 3 * GB),
+    NUMANode(1, [4, 5, 6, 7], 64 * GB, 40 * GB),
+]
+
+
+class TestMemoryPlan:
+    """Test cases for plan_memory."""
+
+    def test_mlock_limited(self):
+        """Test mlock is off when the limit or free memory cannot hold the model."""
+        assert plan_memory(
+            4 * GB, use_mlock=True, lock_limit=None, available=16 * GB
+        ).use_mlock
+        limited = plan_memory(4 * GB, use_mlock=True, lock_limit=64 * 1024 ** 2)
+        assert not limited.use_mlock
+        assert "ulimit" in limited.notes[0]
+        assert not plan_memory(4 * GB, use_mlock=None, available=4 * GB).use_mlock
+        assert not plan_memory(4 * GB, use_mlock=None, gpu_layers=-1).use_mlock
+
+    def test_numa_auto(self):
+        """Test auto binds to a node with room for the model, else distributes."""
+        plan = plan_memory(8 * GB, numa="auto", nodes=NODES)
+        assert (plan.numa_node, plan.cpus) == (1, [4, 5, 6, 7])
+        assert plan.llama_params()["numa"] == NUMA_STRATEGIES["numactl"]
+
+        plan = plan_memory(60 * GB, numa="auto", nodes=NODES)
+        assert plan.numa_node is None
+        assert plan.numa_strategy == NUMA_STRATEGIES["distribute"]
+
+        assert plan_memory(8 * GB, numa="auto", nodes=NODES[:1]).numa_strategy == 0
+
+    def test_numa_explicit(self):
+        """Test binding to a named node and invalid settings."""
+        plan = plan_memory(8 * GB, numa="0", nodes=NODES)
+        assert plan.numa_node == 0
+        assert "less than the model" in plan.notes[0]
+        with pytest.raises(ValueError):
+            plan_memory(8 * GB, numa=5, nodes=NODES)
+        with pytest.raises(ValueError):
+            plan_memory(8 * GB, numa="spread", nodes=NODES)
+
+
+def test_mapping_stats(tmp_path):
+    """Test mapped, resident, locked and per-node bytes of a file mapping."""
+    model = tmp_path / "model.gguf"
+    model.write_bytes(b"")
+    (tmp_path / "smaps").write_text(
+        f"7f0000000000-7f0000400000 r--p 00000000 08:01 1234 {model}\n"
+        "Size:               4096 kB\nRss:                1024 kB\n"
+        "Locked:                0 kB\n"
+        "7f0000400000-7f0000500000 rw-p 00000000 00:00 0\n"
+        "Size:               1024 kB\nRss:                1024 kB\n"
+    )
+    (tmp_path / "numa_maps").write_text(
+        f"7f0000000000 default file={model} "
+        "mapped=256 N0=200 N1=56 kernelpagesize_kB=4\n"
+    )
+
+    stats = mapping_stats(str(model), str(tmp_path))
+
+    assert (stats.mapped_bytes, stats.resident_bytes, stats.locked_bytes) == (
+        4 * 1024**2,
+        1024**2,
+        0,
+    )
+    assert stats.resident_fraction == 0.25
+    assert stats.node_bytes == {0: 200 * 4096, 1: 56 * 4096}
+    assert mapping_stats(str(tmp_path / "other.gguf"), str(tmp_path)) is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
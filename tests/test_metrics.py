@@ -0,0 +1,92 @@
+"""
+Tests for request metrics and the Prometheus registry.
+"""
+
+from unittest.mock import Mock, patch
+
+import pytest
+
+from use_llama_cpp.core.metrics import MetricsRegistry, RequestMetrics, RequestTimer
+
+
+def _metrics(**overrides):
+    values = dict(
+        prompt_tokens=10,
+        completion_tokens=20,
+        cached_tokens=4,
+        prefill_seconds=0.02,
+        ttft_seconds=0.03,
+        decode_seconds=0.5,
+        total_seconds=0.53,
+        finish_reason="stop",
+    )
+    values.update(overrides)
+    return RequestMetrics(**values)
+
+
+class TestMetrics:
+    """Test cases for request metrics."""
+    
+    def test_tokens_per_second(self):
+        """Test decode throughput is derived from completion tokens."""
+        assert _metrics().tokens_per_second == 40.0
+        assert _metrics(decode_seconds=0.0).tokens_per_second == 0.0
+    
+    def test_timer_counts_streamed_chunks(self):
+        """Test streamed chunks give TTFT and token counts without llama.cpp's."""
+        timer = RequestTimer(Mock())
+        timer.token()
+        timer.token()
+        
+        metrics = timer.finish(prompt_tokens=7, cached_tokens=3)
+        
+        assert metrics.completion_tokens == 2
+        assert 0 <= metrics.ttft_seconds <= metrics.total_seconds
+        assert metrics.cached_tokens == 3
+    
+    def test_timer_splits_drafted_request(self):
+        """Test drafted requests get decode time from wall time after prefill."""
+        # 100 prompt tokens; 9 generated and 2 rejected draft tokens evaluated
+        perf = iter([(0.0, 0.0, 0, 0), (216.0, 30.0, 108, 3)])
+        drafts = iter([(0, 0, 0), (8, 8, 6)])
+        with patch("use_llama_cpp.core.metrics.time") as clock, \
+                patch("use_llama_cpp.core.metrics._perf_counters",
+                      side_effect=lambda model: next(perf)), \
+                patch("use_llama_cpp.core.metrics._draft_counters",
+                      side_effect=lambda model: next(drafts)):
+            clock.perf_counter.side_effect = [0.0, 1.0]
+            timer = RequestTimer(Mock())
+            metrics = timer.finish(prompt_tokens=100, completion_tokens=10)
+        
+        assert metrics.prefill_seconds == pytest.approx(0.2)
+        assert metrics.decode_seconds == pytest.approx(0.8)
+        assert metrics.ttft_seconds == pytest.approx(0.2)
+        assert metrics.cached_tokens == 0
+    
+    def test_registry_render(self):
+        """Test counters and histograms in the Prometheus text format."""
+        registry = MetricsRegistry()
+        registry.observe(_metrics(), model="a")
+        registry.observe(_metrics(ttft_seconds=2.0), model="a")
+        
+        text = registry.render()
+        
+        assert "# TYPE use_llama_cpp_requests_total counter" in text
+        assert 'use_llama_cpp_requests_total{model="a"} 2' in text
+        assert 'use_llama_cpp_completion_tokens_total{model="a"} 40' in text
+        assert (
+            'use_llama_cpp_time_to_first_token_seconds_bucket{model="a",le="0.05"} 1'
+            in text
+        )
+        assert (
+            'use_llama_cpp_time_to_first_token_seconds_bucket{model="a",le="+Inf"} 2'
+            in text
+        )
+        assert 'use_llama_cpp_time_to_first_token_seconds_count{model="a"} 2' in text
+    
+    def test_label_escaping(self):
+        """Test label values are escaped."""
+        registry = MetricsRegistry()
+        registry.observe(_metrics(), model='a"b')
+        
+        assert 'model="a\\"b"' in registry.render()
@@ -7,6 +7,7 @@ from unittest.mock import Mock, patch
 from pathlib import Path
 
 from use_llama_cpp.core.model_loader import ModelLoader
+from use_llama_cpp.core.tuning import TuningConfig
 
 
 class TestModelLoader:
@@ -70,6 +71,59 @@ class TestModelLoader:
             assert loader.model is None
             mock_logger.info.assert_called_once_with("Model unloaded")
 
+    def test_load_and_warmup(self):
+        """Test warmup runs a short decode and marks the loader ready."""
+        loader = ModelLoader("/path/to/model.gguf", warmup_tokens=4)
+        model = Mock()
+        model.create_completion.return_value = iter([{}, {}])
+        
+        with patch.object(
+            loader,
+            "load_model",
+            side_effect=lambda: setattr(loader, "model", model) or model,
+        ):
+            assert loader.load_and_warmup() is model
+        
+        assert loader.state == "ready"
+        assert loader.wait_ready(0)
+        assert model.create_completion.call_args.kwargs["max_tokens"] == 4
+        model.reset.assert_called_once()
+    
+    def test_background_load_failure(self):
+        """Test a failed background load is reported and never ready."""
+        loader = ModelLoader("/nonexistent/model.gguf")
+        
+        loader.start_background_load().join(5)
+        
+        assert loader.state == "failed"
+        assert loader.wait_ready(0) is False
+    
+    def test_prefetch_weights(self, tmp_path):
+        """Test weights are read in a background thread."""
+        path = tmp_path / "model.gguf"
+        path.write_bytes(b"\0" * 1000)
+        loader = ModelLoader(str(path))
+        
+        thread = loader.prefetch_weights(chunk_bytes=64)
+        thread.join(5)
+        
+        assert not thread.is_alive()
+    
+    def test_cached_calibration_keeps_batch_sizes(self):
+        """Test a cached calibration sets threads but keeps the batch sizes."""
+        loader = ModelLoader("/path/to/model.gguf", n_batch=128, n_ubatch=64,
+                             auto_tune=True)
+        cached = TuningConfig(3, 6, source="cache")
+        
+        with patch.object(loader, "_tuning_key", return_value="host:model"), \
+                patch("use_llama_cpp.core.tuning.load_cached_config",
+                      return_value=cached):
+            params = loader._thread_params()
+        
+        assert params == {
+            "n_batch": 128, "n_ubatch": 64, "n_threads": 3, "n_threads_batch": 6,
+        }
+
 
 if __name__ == "__main__":
     pytest.main([__file__])
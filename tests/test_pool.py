@@ -0,0 +1,132 @@
+"""
+Tests for the multi-model pool.
+"""
+
+import struct
+import threading
+from unittest.mock import Mock
+
+from use_llama_cpp.core.pool import ModelPool, estimate_model_memory
+
+
+def _gguf(path, metadata):
+    """Write a GGUF header with only uint32 and string metadata."""
+    data = b"GGUF" + struct.pack("<IQQ", 3, 0, len(metadata))
+    for key, value in metadata.items():
+        data += struct.pack("<Q", len(key)) + key.encode("utf-8")
+        if isinstance(value, str):
+            data += struct.pack("<IQ", 8, len(value)) + value.encode("utf-8")
+        else:
+            data += struct.pack("<II", 4, value)
+    path.write_bytes(data)
+    return str(path)
+
+
+class _FakeLoader:
+    """ModelLoader stand-in that records loads and unloads."""
+
+    events = []
+
+    def __init__(self, model_path, **kwargs):
+        self.model_path = model_path
+        self.model = None
+
+    def load_model(self):
+        self.model = Mock(name=self.model_path)
+        self.events.append(("load", self.model_path))
+        return self.model
+
+    def unload_model(self):
+        self.model = None
+        self.events.append(("unload", self.model_path))
+
+
+def _pool(tmp_path, sizes, **kwargs):
+    """Pool of fake models whose memory estimate is their file size."""
+    _FakeLoader.events = []
+    pool = ModelPool(loader_factory=_FakeLoader, gpu_offload=False, **kwargs)
+    for name, size in sizes.items():
+        path = tmp_path / f"{name}.gguf"
+        path.write_bytes(b"\0" * size)
+        pool.register(name, str(path))
+    return pool
+
+
+class TestModelPool:
+    """Test cases for the model pool."""
+
+    def test_estimate_includes_kv_cache(self, tmp_path):
+        """Test the KV cache estimate from GGUF metadata."""
+        path = _gguf(tmp_path / "m.gguf", {
+            "general.architecture": "llama",
+            "llama.block_count": 2,
+            "llama.embedding_length": 64,
+            "llama.attention.head_count": 4,
+            "llama.attention.head_count_kv": 2,
+        })
+        size = (tmp_path / "m.gguf").stat().st_size
+
+        cpu = estimate_model_memory(
+            path, context_size=100, gpu_layers=-1, gpu_offload=False
+        )
+        half = estimate_model_memory(
+            path, context_size=100, gpu_layers=1, gpu_offload=True
+        )
+
+        # 100 tokens x 2 layers x 2 KV heads x (16 + 16) dims x 2 bytes
+        assert cpu.ram_bytes == size + 25600
+        assert cpu.vram_bytes == 0
+        assert half.vram_bytes == (size + 25600) // 2
+
+    def test_loads_once_and_reuses(self, tmp_path):
+        """Test a model is loaded on first use and then reused."""
+        pool = _pool(tmp_path, {"a": 100})
+
+        first = pool.acquire("a")
+        pool.release("a")
+        second = pool.acquire("a")
+        pool.release("a")
+
+        assert first is second
+        assert [e[0] for e in _FakeLoader.events] == ["load"]
+        assert pool.loaded() == ["a"]
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        """Test the least recently used idle model makes room."""
+        pool = _pool(tmp_path, {"a": 100, "b": 100, "c": 100}, ram_budget_bytes=250)
+        for name in ("a", "b", "a", "c"):
+            assert pool.acquire(name) is not None
+            pool.release(name)
+
+        assert pool.loaded() == ["a", "c"]
+        assert pool.stats()["evictions"] == 1
+
+    def test_model_in_use_is_not_evicted(self, tmp_path):
+        """Test a referenced model stays loaded and blocks loading another."""
+        pool = _pool(tmp_path, {"a": 100, "b": 100}, ram_budget_bytes=150)
+        model = pool.acquire("a")
+
+        assert pool.acquire("b", timeout=0.05) is None
+        assert pool.unload("a") is False
+        assert pool.loaded() == ["a"]
+
+        pool.release("a")
+        assert pool.acquire("b") is not None
+        assert pool.loaded() == ["b"]
+        assert model is not None
+
+    def test_waits_for_release(self, tmp_path):
+        """Test acquire waits until a busy model is released."""
+        pool = _pool(tmp_path, {"a": 100, "b": 100}, max_models=1)
+        pool.acquire("a")
+        threading.Timer(0.05, pool.release, args=("a",)).start()
+
+        assert pool.acquire("b", timeout=5) is not None
+
+    def test_too_large_and_unknown(self, tmp_path):
+        """Test models that can never fit and unknown names."""
+        pool = _pool(tmp_path, {"big": 500}, ram_budget_bytes=100)
+
+        assert pool.acquire("big") is None
+        assert pool.acquire("missing") is None
+        assert _FakeLoader.events == []
@@ -0,0 +1,94 @@
+"""
+Tests for the ResponseCache class.
+"""
+
+import numpy as np
+
+from use_llama_cpp.core.response_cache import ResponseCache
+
+GREEDY = {"temperature": 0.0, "max_tokens": 50}
+
+
+def _messages(question, system="Be brief."):
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": question},
+    ]
+
+
+def _embedder(text):
+    """Bag-of-letters embedding: texts with the same letters are identical."""
+    vector = np.zeros(26)
+    for char in text.lower():
+        if char.isalpha():
+            vector[ord(char) - ord("a")] += 1
+    return vector
+
+
+class TestResponseCache:
+    """Test cases for ResponseCache class."""
+    
+    def test_exact_match_after_normalization(self):
+        """Test whitespace differences still hit and other settings miss."""
+        cache = ResponseCache()
+        cache.put("model.gguf", _messages("What is  GGUF?"), GREEDY, "A file format.")
+        
+        assert (
+            cache.get("model.gguf", _messages(" What is GGUF? "), GREEDY)
+            == "A file format."
+        )
+        assert (
+            cache.get(
+                "model.gguf", _messages("What is GGUF?"), {**GREEDY, "max_tokens": 10}
+            )
+            is None
+        )
+        assert cache.get("other.gguf", _messages("What is GGUF?"), GREEDY) is None
+        assert cache.stats()["hits"]["memory"] == 1
+        assert cache.stats()["misses"] == 2
+    
+    def test_random_sampling_is_not_cached(self):
+        """Test only deterministic settings are stored."""
+        cache = ResponseCache()
+        
+        assert cache.put("m", _messages("q"), {"temperature": 0.7}, "a") is False
+        assert (
+            cache.put("m", _messages("q"), {"temperature": 0.7, "seed": 3}, "a") is True
+        )
+        assert cache.get("m", _messages("q"), {"temperature": 0.7}) is None
+    
+    def test_memory_tier_is_lru(self):
+        """Test the least recently used reply is dropped first."""
+        cache = ResponseCache(capacity=2)
+        for question in ("a", "b"):
+            cache.put("m", _messages(question), GREEDY, question.upper())
+        cache.get("m", _messages("a"), GREEDY)
+        cache.put("m", _messages("c"), GREEDY, "C")
+        
+        assert cache.get("m", _messages("b"), GREEDY) is None
+        assert cache.get("m", _messages("a"), GREEDY) == "A"
+    
+    def test_disk_tier_survives_restart(self, tmp_path):
+        """Test replies are read back from sqlite by a new cache."""
+        path = str(tmp_path / "responses.sqlite")
+        first = ResponseCache(path=path, max_disk_entries=2)
+        for question in ("a", "b", "c"):
+            first.put("m", _messages(question), GREEDY, question.upper())
+        first.close()
+        
+        second = ResponseCache(path=path)
+        
+        assert second.get("m", _messages("c"), GREEDY) == "C"
+        assert second.get("m", _messages("a"), GREEDY) is None
+        assert second.stats()["disk_entries"] == 2
+        assert second.stats()["hits"]["disk"] == 1
+    
+    def test_semantic_tier(self):
+        """Test similar questions hit only under the same system prompt."""
+        cache = ResponseCache(embedder=_embedder, similarity_threshold=0.99)
+        cache.put("m", _messages("listen"), GREEDY, "reply")
+        
+        assert cache.get("m", _messages("silent"), GREEDY) == "reply"
+        assert cache.get("m", _messages("silent", system="Be verbose."), GREEDY) is None
+        assert cache.get("m", _messages("louder"), GREEDY) is None
+        assert cache.stats()["hits"]["semantic"] == 1
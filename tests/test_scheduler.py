@@ -0,0 +1,196 @@
+"""
+Tests for the BatchScheduler class.
+"""
+
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from use_llama_cpp.core.scheduler import BatchScheduler, SamplingParams
+
+EOS = 99
+
+
+class _FakeBatch:
+    """llama_batch stand-in with plain lists."""
+
+    def __init__(self, n_tokens, embd, n_seq_max, verbose):
+        self.batch = SimpleNamespace(
+            token=[0] * n_tokens,
+            pos=[0] * n_tokens,
+            n_seq_id=[0] * n_tokens,
+            seq_id=[[0] for _ in range(n_tokens)],
+            logits=[False] * n_tokens,
+            n_tokens=0,
+        )
+
+    def close(self):
+        pass
+
+
+class _FakeContext:
+    """Context whose model predicts the input token plus one."""
+
+    def __init__(self, model, params, verbose):
+        self.params = params
+        self.decoded = []
+        self.copies = []
+        self.removed = []
+
+    def decode(self, batch):
+        b = batch.batch
+        self.decoded.append(
+            [(b.seq_id[i][0], b.pos[i], b.token[i]) for i in range(b.n_tokens)]
+        )
+
+    def kv_cache_seq_cp(self, src, dst, p0, p1):
+        self.copies.append((src, dst))
+
+    def kv_cache_seq_rm(self, seq_id, p0, p1):
+        self.removed.append(seq_id)
+
+    def close(self):
+        pass
+
+
+class _FakeSampler:
+    def __getattr__(self, name):
+        # add_greedy, add_top_k, ... configure nothing here
+        return lambda *args: None
+
+    def sample(self, ctx, index):
+        return ctx.decoded[-1][index][2] + 1
+
+    def accept(self, token):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fake_llama():
+    """Replace llama.cpp's context, batch and sampler with the fakes."""
+    internals = SimpleNamespace(
+        LlamaContext=_FakeContext, LlamaBatch=_FakeBatch, LlamaSampler=_FakeSampler
+    )
+    llama_cpp = Mock()
+    params = llama_cpp.llama_context_params.from_buffer_copy
+    params.side_effect = lambda _: SimpleNamespace(n_ubatch=512)
+    llama_cpp.llama_vocab_is_eog.side_effect = lambda vocab, token: token == EOS
+    with patch("use_llama_cpp.core.scheduler.internals", internals), \
+            patch("use_llama_cpp.core.scheduler.llama_cpp", llama_cpp):
+        yield
+
+
+def _scheduler(n_parallel=2, **kwargs):
+    """Scheduler on a mock model whose tokens detokenize to their last digit."""
+    model = Mock(n_batch=16, verbose=False)
+    model.n_ctx.return_value = 64
+    model.detokenize.side_effect = lambda tokens, **kw: "".join(
+        str(t % 10) for t in tokens
+    ).encode()
+    return BatchScheduler(model, n_parallel=n_parallel, **kwargs)
+
+
+class TestBatchScheduler:
+    """Test cases for BatchScheduler class."""
+
+    def test_request_joins_running_batch(self):
+        """Test a new prompt is prefilled in the same decode as a running request."""
+        scheduler = _scheduler()
+        first = scheduler.submit([10, 11], SamplingParams(max_tokens=5))
+        scheduler.step()
+        scheduler.step()
+
+        second = scheduler.submit([20, 21, 22], SamplingParams(max_tokens=2))
+        scheduler.step()
+
+        # The decode token of the running sequence comes first
+        assert scheduler._ctx.decoded[-1] == [
+            (0, 3, 13), (1, 0, 20), (1, 1, 21), (1, 2, 22),
+        ]
+        scheduler.run_until_idle()
+        assert (first.text, first.finish_reason) == ("23456", "length")
+        assert (second.text, second.finish_reason) == ("34", "length")
+
+    def test_finished_sequence_frees_its_slot(self):
+        """Test a waiting request takes the sequence of a finished one."""
+        scheduler = _scheduler(n_parallel=1)
+        first = scheduler.submit([EOS - 2])
+        second = scheduler.submit([30])
+        scheduler.step()
+        assert scheduler.pending_requests == 1
+
+        scheduler.step()
+
+        # EOS ends the first request without emitting it
+        assert (first.text, first.finish_reason) == ("8", "stop")
+        assert scheduler._ctx.removed == [0]
+        assert scheduler.active_requests == 0 and scheduler.pending_requests == 1
+        scheduler.step()
+        assert scheduler._ctx.decoded[-1] == [(0, 0, 30)]
+        assert scheduler.active_requests == 1
+
+    def test_max_tokens(self):
+        """Test generation stops at max_tokens with finish reason length."""
+        scheduler = _scheduler()
+        request = scheduler.submit([0], SamplingParams(max_tokens=3))
+        scheduler.run_until_idle()
+
+        assert request.output_tokens == [1, 2, 3]
+        assert (request.text, request.finish_reason) == ("123", "length")
+
+    def test_stop_string_split_across_tokens(self):
+        """Test a stop string spanning two tokens is found and never streamed."""
+        scheduler = _scheduler()
+        request = scheduler.submit([0], SamplingParams(max_tokens=10, stop=["34"]))
+        scheduler.run_until_idle()
+
+        assert (request.text, request.finish_reason) == ("12", "stop")
+        assert list(request.stream()) == ["1", "2"]
+
+    def test_shared_prefix(self):
+        """Test a request starting with the shared prefix copies its KV cells."""
+        scheduler = _scheduler(share_prefix=True)
+        scheduler.set_shared_prefix([5, 6])
+        request = scheduler.submit([5, 6, 7], SamplingParams(max_tokens=1))
+        other = scheduler.submit([8, 9], SamplingParams(max_tokens=1))
+        scheduler.step()
+
+        decoded = scheduler._ctx.decoded
+        # The prefix is evaluated in its own sequence after the request sequences
+        assert decoded[0] == [(2, 0, 5), (2, 1, 6)]
+        assert scheduler._ctx.copies == [(2, 0)]
+        assert decoded[1] == [(0, 2, 7), (1, 0, 8), (1, 1, 9)]
+        assert scheduler.shared_prefix == [5, 6]
+        assert scheduler.stats()["prefix_tokens_reused"] == 2
+        assert (request.text, other.text) == ("8", "0")
+
+    def test_stats(self):
+        """Test throughput counters and rates."""
+        scheduler = _scheduler()
+        scheduler.submit([0, 1, 2], SamplingParams(max_tokens=4))
+        scheduler.run_until_idle()
+
+        stats = scheduler.stats()
+        assert stats["prompt_tokens"] == 3
+        assert stats["generated_tokens"] == 4
+        assert stats["active_requests"] == 0 and stats["pending_requests"] == 0
+        assert stats["busy_seconds"] > 0
+        busy = stats["busy_seconds"]
+        assert stats["generated_tokens_per_second"] == pytest.approx(4 / busy)
+        assert stats["prompt_tokens_per_second"] == pytest.approx(3 / busy)
+
+    def test_output_has_no_nul_padding(self):
+        """Test text comes from trimmed pieces, not llama.cpp's piece buffer."""
+        scheduler = _scheduler()
+        # token_to_piece returns its whole fixed-size buffer
+        to_piece = scheduler.model._model.token_to_piece
+        to_piece.side_effect = lambda token: str(token % 10).encode() + b"\0" * 31
+        request = scheduler.submit([0], SamplingParams(max_tokens=3))
+        scheduler.run_until_idle()
+
+        assert request.text == "123"
+        assert "\0" not in request.text
@@ -0,0 +1,396 @@
+"""
+Tests for the OpenAI-compatible InferenceServer.
+"""
+
+import asyncio
+import base64
+import json
+import threading
+
+import numpy as np
+import pytest
+from unittest.mock import Mock, patch
+
+from use_llama_cpp.core.metrics import MetricsRegistry
+from use_llama_cpp.server import InferenceServer
+
+
+async def _request(port, method, path, payload=None):
+    """Send one HTTP request and return (status, headers, body)."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: test\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, content = raw.partition(b"\r\n\r\n")
+    lines = head.decode().split("\r\n")
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    return int(lines[0].split()[1]), headers, content.decode()
+
+
+def _run_with_server(model, scenario, **kwargs):
+    """Start a server on a free port, run the scenario and stop the server."""
+    async def runner():
+        server = InferenceServer(model, model_name="test-model", port=0, **kwargs)
+        await server.start()
+        try:
+            return await scenario(server)
+        finally:
+            await server.stop()
+    return asyncio.run(runner())
+
+
+class TestInferenceServer:
+    """Test cases for InferenceServer class."""
+    
+    def test_chat_completion(self):
+        """Test a non-streaming chat completion round trip."""
+        model = Mock()
+        model.create_chat_completion.return_value = {
+            "object": "chat.completion",
+            "model": "/models/test.gguf",
+            "choices": [{"message": {"role": "assistant", "content": "Hi"}}],
+        }
+        
+        async def scenario(server):
+            return await _request(server.port, "POST", "/v1/chat/completions", {
+                "messages": [{"role": "user", "content": "Hello"}],
+                "max_tokens": 8,
+                "user": "ignored",
+            })
+        
+        status, headers, body = _run_with_server(model, scenario)
+        
+        assert status == 200
+        assert json.loads(body)["model"] == "test-model"
+        model.create_chat_completion.assert_called_once_with(
+            messages=[{"role": "user", "content": "Hello"}], max_tokens=8
+        )
+    
+    def test_streaming_completion(self):
+        """Test completions are streamed as server-sent events."""
+        model = Mock()
+        model.create_completion.return_value = iter([
+            {"choices": [{"text": "Hel"}]},
+            {"choices": [{"text": "lo"}]},
+        ])
+        
+        async def scenario(server):
+            return await _request(server.port, "POST", "/v1/completions", {
+                "prompt": "Say hello", "stream": True
+            })
+        
+        status, headers, body = _run_with_server(model, scenario)
+        events = [line[len("data: "):] for line in body.split("\n\n") if line]
+        
+        assert status == 200
+        assert headers["Content-Type"] == "text/event-stream"
+        assert [json.loads(e)["choices"][0]["text"] for e in events[:-1]] == [
+            "Hel",
+            "lo",
+        ]
+        assert events[-1] == "[DONE]"
+    
+    def test_queue_full_returns_429(self):
+        """Test backpressure once the bounded queue is full."""
+        release = threading.Event()
+        model = Mock()
+        model.create_completion.side_effect = lambda **kw: release.wait(5) and {
+            "choices": []
+        }
+        
+        async def scenario(server):
+            payload = {"prompt": "x"}
+            running = asyncio.create_task(
+                _request(server.port, "POST", "/v1/completions", payload)
+            )
+            while server.queue_depth < 1:
+                await asyncio.sleep(0.01)
+            waiting = asyncio.create_task(
+                _request(server.port, "POST", "/v1/completions", payload)
+            )
+            while server.queue_depth < 2:
+                await asyncio.sleep(0.01)
+            rejected = await _request(server.port, "POST", "/v1/completions", payload)
+            health = await _request(server.port, "GET", "/health")
+            release.set()
+            await asyncio.gather(running, waiting)
+            return rejected, health
+        
+        rejected, health = _run_with_server(model, scenario, max_queue_size=1)
+        
+        assert rejected[0] == 429
+        assert json.loads(rejected[2])["error"]["type"] == "rate_limit_error"
+        assert json.loads(health[2])["queue_depth"] == 2
+    
+    def test_disconnected_client_cancels_queued_job(self):
+        """Test a queued request is skipped once its client has gone away."""
+        release = threading.Event()
+        model = Mock()
+        model.create_completion.side_effect = (
+            lambda **kw: release.wait(5) and {"choices": []}
+        )
+        
+        async def scenario(server):
+            payload = {"prompt": "x"}
+            running = asyncio.create_task(
+                _request(server.port, "POST", "/v1/completions", payload)
+            )
+            while server.queue_depth < 1:
+                await asyncio.sleep(0.01)
+            _, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            body = json.dumps(payload).encode()
+            head = (
+                f"POST /v1/completions HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n"
+            )
+            writer.write(head.encode() + body)
+            while server.queue_depth < 2:
+                await asyncio.sleep(0.01)
+            writer.close()
+            # The closed connection is seen by the server before the queue moves on
+            await asyncio.sleep(0.1)
+            release.set()
+            await running
+            await server._queue.join()
+        
+        _run_with_server(model, scenario)
+        
+        assert model.create_completion.call_count == 1
+    
+    def test_half_closed_client_still_receives_stream(self):
+        """Test a stream is not cancelled when the client only closes its writes."""
+        model = Mock()
+        model.create_completion.return_value = iter([{"choices": [{"text": "Hi"}]}])
+        
+        async def scenario(server):
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            body = json.dumps({"prompt": "x", "stream": True}).encode()
+            head = (
+                f"POST /v1/completions HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n"
+            )
+            writer.write(head.encode() + body)
+            writer.write_eof()
+            raw = await reader.read()
+            writer.close()
+            return raw.decode()
+        
+        raw = _run_with_server(model, scenario)
+        
+        assert raw.startswith("HTTP/1.1 200")
+        assert raw.endswith("data: [DONE]\n\n")
+    
+    def test_metrics_endpoint(self):
+        """Test finished requests are exported in Prometheus format."""
+        model = Mock()
+        model.create_completion.return_value = {
+            "choices": [{"text": "Hi", "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7},
+        }
+        
+        async def scenario(server):
+            await _request(server.port, "POST", "/v1/completions", {"prompt": "Hello"})
+            return await _request(server.port, "GET", "/metrics")
+        
+        status, headers, body = _run_with_server(
+            model, scenario, metrics=MetricsRegistry()
+        )
+        
+        assert status == 200
+        assert headers["Content-Type"].startswith("text/plain")
+        assert 'use_llama_cpp_requests_total{model="test-model"} 1' in body
+        assert 'use_llama_cpp_completion_tokens_total{model="test-model"} 2' in body
+        assert "use_llama_cpp_queue_depth 0" in body
+    
+    def test_not_ready_while_loading(self):
+        """Test health is answered and completions refused until the model is warm."""
+        loader = Mock(state="loading", model=None)
+        loader.ready = threading.Event()
+        
+        async def scenario(server):
+            before = [
+                await _request(server.port, "GET", "/health"),
+                await _request(server.port, "GET", "/ready"),
+                await _request(
+                    server.port, "POST", "/v1/completions", {"prompt": "Hi"}
+                ),
+            ]
+            loader.model = Mock()
+            loader.model.create_completion.return_value = {
+                "choices": [{"text": "Hello"}]
+            }
+            loader.ready.set()
+            after = [
+                await _request(server.port, "GET", "/ready"),
+                await _request(
+                    server.port, "POST", "/v1/completions", {"prompt": "Hi"}
+                ),
+            ]
+            return before, after
+        
+        before, after = _run_with_server(None, scenario, loader=loader)
+        
+        assert before[0][0] == 200 and json.loads(before[0][2])["status"] == "loading"
+        assert before[1][0] == 503
+        assert before[2][0] == 503
+        assert [response[0] for response in after] == [200, 200]
+    
+    def test_embeddings(self):
+        """Test embeddings in float and base64 encodings and invalid input."""
+        embedder = Mock(last_token_count=5)
+        embedder.resolve_pooling.return_value = "mean"
+        embedder.embed.side_effect = lambda texts, **kwargs: np.ones(
+            (len(texts), 3), dtype=np.float32
+        )
+        
+        async def scenario(server):
+            return [
+                await _request(
+                    server.port, "POST", "/v1/embeddings", {"input": ["a", "b"]}
+                ),
+                await _request(
+                    server.port,
+                    "POST",
+                    "/v1/embeddings",
+                    {"input": "a", "encoding_format": "base64"},
+                ),
+                await _request(server.port, "POST", "/v1/embeddings", {"input": [1]}),
+            ]
+        
+        with patch("use_llama_cpp.server.app.Embedder", return_value=embedder):
+            responses = _run_with_server(Mock(), scenario)
+        
+        floats, encoded, invalid = [json.loads(body) for _, _, body in responses]
+        assert [status for status, _, _ in responses] == [200, 200, 400]
+        assert [item["embedding"] for item in floats["data"]] == [[1.0, 1.0, 1.0]] * 2
+        assert floats["model"] == "test-model"
+        assert floats["usage"]["prompt_tokens"] == 5
+        decoded = np.frombuffer(
+            base64.b64decode(encoded["data"][0]["embedding"]), dtype="<f4"
+        )
+        assert decoded.tolist() == [1.0, 1.0, 1.0]
+    
+    def test_tokenize(self):
+        """Test tokenize, detokenize and message counting endpoints."""
+        model = Mock()
+        model.tokenize.side_effect = lambda text, **kwargs: [
+            len(word) for word in text.split()
+        ]
+        model.detokenize.side_effect = lambda tokens, **kwargs: b" ".join(
+            b"x" * t for t in tokens
+        )
+        model.n_vocab.return_value = 10
+        messages = [{"role": "user", "content": "hi there"}]
+        
+        async def scenario(server):
+            return [
+                await _request(server.port, "POST", "/tokenize", {"content": "a bb"}),
+                await _request(
+                    server.port, "POST", "/tokenize", {"content": ["a", "ccc"]}
+                ),
+                await _request(
+                    server.port, "POST", "/tokenize", {"messages": messages}
+                ),
+                await _request(server.port, "POST", "/detokenize", {"tokens": [1, 2]}),
+                await _request(
+                    server.port, "POST", "/detokenize", {"tokens": [[3], []]}
+                ),
+                await _request(server.port, "POST", "/detokenize", {"tokens": [99]}),
+                await _request(server.port, "POST", "/tokenize", {"content": 5}),
+            ]
+        
+        with patch(
+            "use_llama_cpp.core.tokenizer.tokenize_chat_prompt",
+            return_value=([0, 1, 2], []),
+        ):
+            responses = _run_with_server(model, scenario)
+        
+        assert [status for status, _, _ in responses] == [
+            200,
+            200,
+            200,
+            200,
+            200,
+            400,
+            400,
+        ]
+        single, batch, count, text, texts = [
+            json.loads(body) for _, _, body in responses[:5]
+        ]
+        assert single == {"tokens": [1, 2], "count": 2}
+        assert batch == {"tokens": [[1], [3]], "count": [1, 1]}
+        assert count == {"count": 3 + 2}
+        assert text == {"content": "x xx"}
+        assert texts == {"content": ["xxx", ""]}
+        # Tokenization does not go through the inference queue
+        model.create_completion.assert_not_called()
+    
+    def test_structured_output(self):
+        """Test response formats become cached grammars and bad ones are rejected."""
+        model = Mock()
+        model.create_chat_completion.return_value = {
+            "choices": [{"message": {"content": "{}"}}]
+        }
+        schema = {"type": "object", "properties": {"ok": {"type": "boolean"}}}
+        messages = [{"role": "user", "content": "Hi"}]
+        
+        async def scenario(server):
+            return [
+                await _request(
+                    server.port,
+                    "POST",
+                    "/v1/chat/completions",
+                    {
+                        "messages": messages,
+                        "response_format": {
+                            "type": "json_schema",
+                            "json_schema": {"name": "s", "schema": schema},
+                        },
+                    },
+                ),
+                await _request(
+                    server.port,
+                    "POST",
+                    "/v1/chat/completions",
+                    {
+                        "messages": messages,
+                        "response_format": {"type": "json_object", "schema": schema},
+                    },
+                ),
+                await _request(
+                    server.port,
+                    "POST",
+                    "/v1/chat/completions",
+                    {
+                        "messages": messages,
+                        "json_schema": schema,
+                        "grammar": 'root ::= "a"',
+                    },
+                ),
+            ]
+        
+        responses = _run_with_server(model, scenario)
+        
+        assert [status for status, _, _ in responses] == [200, 200, 400]
+        first, second = [
+            call.kwargs["grammar"]
+            for call in model.create_chat_completion.call_args_list
+        ]
+        assert first is second
+        assert "response_format" not in model.create_chat_completion.call_args.kwargs
+    
+    def test_unknown_endpoint(self):
+        """Test unknown paths return 404."""
+        async def scenario(server):
+            return await _request(server.port, "GET", "/v1/unknown")
+        
+        status, _, _ = _run_with_server(Mock(), scenario)
+        assert status == 404
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
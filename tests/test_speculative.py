@@ -0,0 +1,81 @@
+"""
+Tests for speculative decoding drafters.
+"""
+
+import numpy as np
+from unittest.mock import Mock
+
+from use_llama_cpp.core.metrics import RequestTimer
+from use_llama_cpp.core.speculative import PromptLookupDrafter, SpeculativeDraft
+
+
+class _FixedDrafter:
+    """Always proposes the same tokens."""
+
+    num_pred_tokens = 3
+
+    def __init__(self, tokens):
+        self.tokens = np.array(tokens, dtype=np.intc)
+
+    def __call__(self, input_ids, **kwargs):
+        return self.tokens
+
+
+def _ids(*tokens):
+    return np.array(tokens, dtype=np.intc)
+
+
+class TestSpeculative:
+    """Test cases for drafters and acceptance tracking."""
+    
+    def test_prompt_lookup_uses_latest_match(self):
+        """Test the continuation of the most recent n-gram occurrence is proposed."""
+        drafter = PromptLookupDrafter(max_ngram_size=2, num_pred_tokens=2)
+        
+        assert drafter(_ids(1, 2, 3, 4, 1, 2, 5, 6, 1, 2)).tolist() == [5, 6]
+        assert drafter(_ids(7, 9, 8, 9)).tolist() == [8, 9]
+        assert drafter(_ids(1, 2, 3)).tolist() == []
+    
+    def test_acceptance_is_counted_on_next_call(self):
+        """Test accepted tokens are the draft prefix the model kept."""
+        draft = SpeculativeDraft(_FixedDrafter([5, 6, 7]))
+        
+        draft(_ids(1, 2))
+        # Model kept 5 and 6, then sampled 9 instead of 7
+        draft(_ids(1, 2, 5, 6, 9))
+        # Full accept plus the model's own next token
+        draft(_ids(1, 2, 5, 6, 9, 5, 6, 7, 8))
+        # A new request does not settle the previous draft
+        draft(_ids(3))
+        
+        assert (draft.drafted_tokens, draft.accepted_tokens) == (6, 5)
+        assert draft.proposed_tokens == 12
+    
+    def test_low_acceptance_pauses_drafting(self):
+        """Test drafting stops for a while when drafts keep being rejected."""
+        draft = SpeculativeDraft(
+            _FixedDrafter([5, 6, 7]), min_acceptance=0.5, window=4, pause_steps=3
+        )
+        context = [1]
+        for _ in range(5):
+            draft(_ids(*context))
+            context.append(9)
+        
+        assert draft.enabled is False
+        # The step that paused drafting counts towards the pause
+        assert [len(draft(_ids(*context, *[9] * i))) for i in range(3)] == [0, 0, 3]
+        assert draft.enabled is True
+        assert draft.stats()["paused_count"] == 1
+    
+    def test_request_metrics_include_drafts(self):
+        """Test a request reports the drafts settled while it ran."""
+        model = Mock()
+        model.draft_model = SpeculativeDraft(_FixedDrafter([5, 6, 7]))
+        timer = RequestTimer(model)
+        model.draft_model(_ids(1))
+        model.draft_model(_ids(1, 5, 6, 7, 8))
+        
+        metrics = timer.finish(prompt_tokens=1, completion_tokens=4)
+        
+        assert (metrics.draft_tokens, metrics.accepted_draft_tokens) == (3, 3)
+        assert metrics.draft_acceptance_rate == 1.0
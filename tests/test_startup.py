@@ -0,0 +1,52 @@
+"""
+Tests for lazy package imports.
+"""
+
+import subprocess
+import sys
+
+from use_llama_cpp.benchmarks.startup import measure_startup, run_once
+
+
+class TestStartup:
+    """Test cases for import-time behaviour."""
+    
+    def test_import_loads_no_heavy_modules(self):
+        """Test importing the package does not pull in torch or llama_cpp."""
+        result = run_once(
+            ["-c", "import use_llama_cpp, use_llama_cpp.core, use_llama_cpp.utils"]
+        )
+        
+        assert result["exit_code"] == 0
+        assert result["heavy_modules"] == []
+    
+    def test_cli_help_loads_no_heavy_modules(self):
+        """Test --help returns before any model code is imported."""
+        result = run_once(
+            ["-c", "from use_llama_cpp.cli.main import main; main(['--help'])"]
+        )
+        
+        assert result["exit_code"] == 0
+        assert result["heavy_modules"] == []
+    
+    def test_lazy_attributes_resolve(self):
+        """Test public names still resolve on first access."""
+        code = (
+            "import use_llama_cpp, use_llama_cpp.core as core\n"
+            "assert use_llama_cpp.AIChat is core.AIChat\n"
+            "assert 'ModelLoader' in dir(use_llama_cpp)\n"
+            "try:\n"
+            "    use_llama_cpp.Missing\n"
+            "except AttributeError:\n"
+            "    pass\n"
+            "else:\n"
+            "    raise SystemExit(1)\n"
+        )
+        assert subprocess.run([sys.executable, "-c", code]).returncode == 0
+    
+    def test_measure_startup(self):
+        """Test the benchmark reports time and peak RSS per case."""
+        results = measure_startup(runs=1, cases=["import"])
+        
+        assert results["import"]["median_seconds"] > 0
+        assert results["import"]["peak_rss_mb"] > 0
@@ -0,0 +1,105 @@
+"""
+Tests for the Tokenizer class.
+"""
+
+import gc
+import weakref
+from unittest.mock import Mock, patch
+
+import pytest
+
+from use_llama_cpp.core.tokenizer import Tokenizer
+
+
+def _mock_model():
+    """Mock Llama with one token per word, the token ID being the word length."""
+    model = Mock()
+    model.tokenize.side_effect = lambda text, **kwargs: [
+        len(word) for word in text.split()
+    ]
+    model.detokenize.side_effect = lambda tokens, **kwargs: b" ".join(
+        b"x" * t for t in tokens
+    )
+    return model
+
+
+@pytest.fixture(autouse=True)
+def chat_prompt():
+    """Two template tokens per message plus one for the generation prompt."""
+    def tokenize(model, messages):
+        tokens = [0]
+        for message in messages:
+            tokens += [1, 2] + [len(word) for word in message["content"].split()]
+        return tokens, []
+    with patch(
+        "use_llama_cpp.core.tokenizer.tokenize_chat_prompt", side_effect=tokenize
+    ) as mock:
+        yield mock
+
+
+class TestTokenizer:
+    """Test cases for Tokenizer class."""
+
+    def test_batches_and_cache(self):
+        """Test batched tokenize, detokenize and count reuse cached token IDs."""
+        model = _mock_model()
+        tokenizer = Tokenizer(model)
+
+        assert tokenizer.tokenize(["a bb", "ccc"]) == [[1, 2], [3]]
+        assert tokenizer.count(["ccc", "a bb", "dddd e"]) == [1, 2, 2]
+        assert tokenizer.detokenize([[1, 2], [3]]) == ["x xx", "xxx"]
+        assert model.tokenize.call_count == 3
+        assert tokenizer.stats()["hits"] == 2
+
+        # Different flags are different entries
+        tokenizer.tokenize(["ccc"], add_bos=True)
+        assert model.tokenize.call_count == 4
+
+    def test_count_messages_is_incremental(self):
+        """Test a growing conversation only tokenizes new messages."""
+        model = _mock_model()
+        tokenizer = Tokenizer(model)
+        history = [
+            {"role": "system", "content": "be brief"},
+            {"role": "user", "content": "hi there"},
+        ]
+
+        assert tokenizer.count_messages(history) == 1 + 2 * 2 + 4
+        assert model.tokenize.call_count == 2
+
+        history.append({"role": "assistant", "content": "hello"})
+        assert tokenizer.count_messages(history) == 1 + 3 * 2 + 5
+        assert model.tokenize.call_count == 3
+        assert tokenizer.count_messages(history, exact=True) == 1 + 3 * 2 + 5
+
+    def test_lru_eviction(self):
+        """Test least recently used texts are dropped past capacity."""
+        model = _mock_model()
+        tokenizer = Tokenizer(model, capacity=2)
+
+        tokenizer.count(["a", "b", "a", "c"])
+        assert tokenizer.stats()["entries"] == 2
+        tokenizer.count(["a"])
+        assert model.tokenize.call_count == 3
+        tokenizer.count(["b"])
+        assert model.tokenize.call_count == 4
+
+    def test_shared_per_model(self):
+        """Test for_model returns one tokenizer per model."""
+        model = _mock_model()
+        assert Tokenizer.for_model(model) is Tokenizer.for_model(model)
+        assert Tokenizer.for_model(model) is not Tokenizer.for_model(_mock_model())
+
+    def test_registry_does_not_keep_model_alive(self):
+        """Test a model with a shared tokenizer is still garbage-collected."""
+        model = _mock_model()
+        tokenizer = Tokenizer.for_model(model)
+        assert tokenizer.count(["a bb"]) == [2]
+        ref = weakref.ref(model)
+
+        del model
+        gc.collect()
+
+        assert ref() is None
+        with pytest.raises(ReferenceError):
+            tokenizer.count(["ccc"])
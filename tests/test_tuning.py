@@ -0,0 +1,73 @@
+"""
+Tests for thread auto-tuning.
+"""
+
+from use_llama_cpp.core.tuning import (
+    TuningConfig,
+    cgroup_cpu_limit,
+    load_cached_config,
+    recommend_config,
+    save_cached_config,
+    thread_candidates,
+)
+from use_llama_cpp.utils.hardware import CPUInfo
+
+
+def _cpu(logical=16, physical=8, usable=16):
+    return CPUInfo("Test CPU", logical, physical, usable, 1, {"avx2"})
+
+
+class TestTuning:
+    """Test cases for thread auto-tuning."""
+    
+    def test_cgroup_v2_quota(self, tmp_path):
+        """Test a cgroup v2 quota is converted to CPUs."""
+        (tmp_path / "cpu.max").write_text("250000 100000\n")
+        
+        assert cgroup_cpu_limit(str(tmp_path)) == 2.5
+    
+    def test_cgroup_v2_unlimited(self, tmp_path):
+        """Test an unlimited cgroup v2 quota."""
+        (tmp_path / "cpu.max").write_text("max 100000\n")
+        
+        assert cgroup_cpu_limit(str(tmp_path)) is None
+    
+    def test_cgroup_v1_quota(self, tmp_path):
+        """Test a cgroup v1 CFS quota is converted to CPUs."""
+        (tmp_path / "cpu").mkdir()
+        (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("400000\n")
+        (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+        
+        assert cgroup_cpu_limit(str(tmp_path)) == 4.0
+    
+    def test_recommend_uses_physical_cores_for_decoding(self):
+        """Test hyperthread siblings are not used for decoding."""
+        config = recommend_config(_cpu(), cgroup_limit=None)
+        
+        assert config.n_threads == 8
+        assert config.n_threads_batch == 16
+    
+    def test_recommend_respects_cgroup_quota(self):
+        """Test thread counts stay within the container's CPU quota."""
+        config = recommend_config(_cpu(), cgroup_limit=2.5)
+        
+        assert config.n_threads == 2
+        assert config.n_threads_batch == 2
+    
+    def test_thread_candidates(self):
+        """Test candidates cover powers of two and the limit."""
+        assert thread_candidates(6) == [1, 2, 3, 4, 6]
+    
+    def test_cache_round_trip(self, tmp_path):
+        """Test calibrated settings are cached per key."""
+        path = str(tmp_path / "tuning.json")
+        save_cached_config("host:model", TuningConfig(3, 6, source="calibrated"), path)
+        
+        cached = load_cached_config("host:model", path)
+        
+        assert (cached.n_threads, cached.n_threads_batch, cached.source) == (
+            3,
+            6,
+            "cache",
+        )
+        assert load_cached_config("other:model", path) is None
@@ -0,0 +1,107 @@
+"""
+Tests for the pre-fork worker pool.
+"""
+
+import asyncio
+import json
+
+import pytest
+from unittest.mock import Mock
+
+from use_llama_cpp.server import InferenceServer, PreforkServer
+from use_llama_cpp.server.workers import _Worker, merge_metrics, partition_cpus
+from use_llama_cpp.utils.hardware import NUMANode
+
+from .test_server import _request
+
+
+class TestPartitionCpus:
+    """Test cases for partition_cpus."""
+    
+    def test_numa_aligned(self):
+        """Test worker CPU sets stay within a node when workers divide over nodes."""
+        nodes = [NUMANode(0, [0, 1, 2, 3], 0, 0), NUMANode(1, [4, 5, 6, 7], 0, 0)]
+        
+        assert partition_cpus(4, list(range(8)), nodes) == [
+            [0, 1],
+            [2, 3],
+            [4, 5],
+            [6, 7],
+        ]
+        assert partition_cpus(3, list(range(8)), nodes) == [
+            [0, 1],
+            [2, 3, 4],
+            [5, 6, 7],
+        ]
+    
+    def test_more_workers_than_cpus(self):
+        """Test every worker gets at least one CPU."""
+        assert partition_cpus(3, [0, 1], []) == [[0], [0], [1]]
+
+
+def test_merge_metrics():
+    """Test samples get a worker label and families are listed once."""
+    text = (
+        "# HELP x_total Things.\n# TYPE x_total counter\n"
+        'x_total{model="m"} {n}\n# TYPE depth gauge\ndepth {n}\n'
+    )
+    
+    merged = merge_metrics(
+        {"0": text.replace("{n}", "1"), "1": text.replace("{n}", "2")}
+    )
+    
+    assert merged.splitlines() == [
+        "# HELP x_total Things.",
+        "# TYPE x_total counter",
+        'x_total{worker="0",model="m"} 1',
+        'x_total{worker="1",model="m"} 2',
+        "# TYPE depth gauge",
+        'depth{worker="0"} 1',
+        'depth{worker="1"} 2',
+    ]
+
+
+def test_routes_to_least_outstanding_worker():
+    """Test requests go to the worker with the fewest outstanding tokens."""
+    models = [Mock(), Mock()]
+    for i, model in enumerate(models):
+        model.create_completion.return_value = {"choices": [{"text": f"worker {i}"}]}
+    
+    async def scenario():
+        backends = [InferenceServer(model, port=0) for model in models]
+        pool = PreforkServer(Mock(), n_workers=2, model_name="pool", port=0)
+        for backend in backends:
+            await backend.start()
+        pool._workers = [
+            _Worker(index=i, cpus=None, port=backend.port, state="ready")
+            for i, backend in enumerate(backends)
+        ]
+        # Worker 0 is busy with a long generation
+        pool._workers[0].outstanding_tokens = 500
+        await pool.start()
+        try:
+            responses = [
+                await _request(
+                    pool.port,
+                    "POST",
+                    "/v1/completions",
+                    {"prompt": "Hi", "max_tokens": 8},
+                ),
+                await _request(pool.port, "GET", "/health"),
+            ]
+        finally:
+            await pool.stop()
+            for backend in backends:
+                await backend.stop()
+        return responses
+    
+    (status, _, body), (_, _, health) = asyncio.run(scenario())
+    
+    assert status == 200
+    assert json.loads(body)["choices"][0]["text"] == "worker 1"
+    assert json.loads(health)["status"] == "ok"
+    assert [w["outstanding_tokens"] for w in json.loads(health)["workers"]] == [500, 0]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])